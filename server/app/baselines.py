@@ -0,0 +1,266 @@
+from typing import Dict, List, Optional, Tuple
+import os
+import time
+import zlib
+
+import numpy as np
+
+from detection import Alert, EventBatch, Rule
+
+# Behaviour is summarized per client over fixed event-time windows
+BASELINE_WINDOW_SECONDS = int(os.getenv("BASELINE_WINDOW_SECONDS", "300"))
+# EWMA smoothing per closed window (~0.02 = about a week of 5-minute windows of memory)
+BASELINE_ALPHA = float(os.getenv("BASELINE_ALPHA", "0.02"))
+# Windows a client must have before its deviations are scored
+BASELINE_MIN_WINDOWS = int(os.getenv("BASELINE_MIN_WINDOWS", "24"))
+BASELINE_Z_THRESHOLD = float(os.getenv("BASELINE_Z_THRESHOLD", "4.0"))
+BASELINE_INITIAL_CAPACITY = 1024
+# Distinct destinations per window are counted with a HyperLogLog of 2**precision
+# one-byte registers per client (7 -> 128 bytes, ~9% standard error; small counts near exact)
+BASELINE_HLL_PRECISION = 7
+
+# Protocol mix is tracked as shares over this fixed vocabulary
+PROTOCOLS = ("dns", "http", "tls", "tcp", "udp", "icmp", "dhcpv4", "other")
+
+# Scored features. Volumes are log1p scaled; protocol_shift is the total
+# variation distance between a window's protocol mix and the client's usual mix.
+FEATURES = ("bytes", "flows", "destinations", "protocol_shift")
+
+# Lower bound on each feature's standard deviation so near-constant clients
+# don't turn tiny wobbles into huge z-scores
+STD_FLOOR = np.array([0.5, 0.5, 0.5, 0.1])
+
+_PROTOCOL_INDEX = {protocol: i for i, protocol in enumerate(PROTOCOLS)}
+_OTHER = _PROTOCOL_INDEX["other"]
+
+_HLL_REGISTERS = 1 << BASELINE_HLL_PRECISION
+_HLL_ALPHA = 0.7213 / (1 + 1.079 / _HLL_REGISTERS)
+# Rank of an all-zero hash remainder (32-bit hash minus the register index bits)
+_HLL_MAX_RANK = 32 - BASELINE_HLL_PRECISION + 1
+
+
+def _destination_hashes(destinations) -> np.ndarray:
+    """Stable, well-mixed 32-bit hashes of destination strings (crc32 through a multiplicative finalizer)."""
+    crc = np.fromiter((zlib.crc32(destination.encode()) for destination in destinations), dtype=np.uint64,
+                      count=len(destinations))
+    mixed = (crc * np.uint64(0x9E3779B97F4A7C15)) & np.uint64(0xFFFFFFFFFFFFFFFF)
+    return (mixed >> np.uint64(32)).astype(np.uint32)
+
+
+def hll_add(registers: np.ndarray, slots: np.ndarray, hashes: np.ndarray):
+    """Fold 32-bit `hashes` into the HyperLogLog register rows of `slots`."""
+    index = (hashes & np.uint32(_HLL_REGISTERS - 1)).astype(np.intp)
+    rest = (hashes >> np.uint32(BASELINE_HLL_PRECISION)).astype(np.int64)
+    # Rank = 1 + trailing zeros of the remaining bits, via its lowest set bit
+    lowest = rest & -rest
+    rank = np.where(rest == 0, _HLL_MAX_RANK, np.log2(np.maximum(lowest, 1)).astype(np.int64) + 1)
+    np.maximum.at(registers, (slots, index), rank.astype(registers.dtype))
+
+
+def hll_count(registers: np.ndarray) -> np.ndarray:
+    """Estimated distinct count per register row, with linear counting for small cardinalities."""
+    m = registers.shape[1]
+    raw = _HLL_ALPHA * m * m / np.exp2(-registers.astype(np.float64)).sum(axis=1)
+    zeros = (registers == 0).sum(axis=1)
+    linear = m * np.log(m / np.maximum(zeros, 1))
+    return np.where((raw <= 2.5 * m) & (zeros > 0), linear, raw)
+
+
+class BaselineEngine:
+    """
+    Streaming per-client baselines of bytes, flows, distinct destinations and
+    protocol mix.
+
+    Each client owns one row (slot) in a set of preallocated arrays: EWMA
+    mean and variance per feature, EWMA protocol shares, the number of
+    windows seen and the current window's running totals, including a
+    fixed-size HyperLogLog of its destinations (root domain, or destination
+    IP for flows without one). Rows are constant-size, so memory grows only
+    with the number of clients. The arrays double in capacity as clients
+    appear.
+
+    Events are accumulated into the open window. When event time passes the
+    window end, every active client's window is turned into a feature
+    vector, scored against its baseline (upward z per feature, variance
+    bias-corrected for young baselines), and then folded into the EWMA.
+    """
+
+    def __init__(self, window_seconds: int = BASELINE_WINDOW_SECONDS, alpha: float = BASELINE_ALPHA,
+                 min_windows: int = BASELINE_MIN_WINDOWS, threshold: float = BASELINE_Z_THRESHOLD,
+                 capacity: int = BASELINE_INITIAL_CAPACITY):
+        self.window_ms = window_seconds * 1000
+        self.alpha = alpha
+        self.min_windows = min_windows
+        self.threshold = threshold
+
+        self.slots: Dict[str, int] = {}
+        self.client_ids: List[str] = []
+        self.client_names: List[str] = []
+        self.mean = np.zeros((capacity, len(FEATURES)))
+        self.var = np.zeros((capacity, len(FEATURES)))
+        self.protocol_mix = np.zeros((capacity, len(PROTOCOLS)))
+        self.windows = np.zeros(capacity, dtype=np.int32)
+
+        # Open window accumulators
+        self.acc_bytes = np.zeros(capacity, dtype=np.int64)
+        self.acc_flows = np.zeros(capacity, dtype=np.int64)
+        self.acc_protocols = np.zeros((capacity, len(PROTOCOLS)), dtype=np.int64)
+        self.acc_destinations = np.zeros((capacity, _HLL_REGISTERS), dtype=np.uint8)
+        self.current_window: Optional[int] = None
+
+        self.windows_closed = 0
+        self.deviations = 0
+
+    _STATE = ("mean", "var", "protocol_mix", "windows", "acc_bytes", "acc_flows", "acc_protocols",
+              "acc_destinations")
+
+    def __len__(self) -> int:
+        return len(self.slots)
+
+    def _grow(self, needed: int):
+        capacity = len(self.windows)
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        for name in self._STATE:
+            old = getattr(self, name)
+            new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+    def _slots_for(self, client_ids, client_names) -> np.ndarray:
+        slots = self.slots
+        out = np.empty(len(client_ids), dtype=np.intp)
+        for i, client_id in enumerate(client_ids):
+            slot = slots.get(client_id)
+            if slot is None:
+                slot = slots[client_id] = len(self.client_ids)
+                self.client_ids.append(client_id)
+                self.client_names.append(client_names[i])
+            out[i] = slot
+        self._grow(len(self.client_ids))
+        return out
+
+    def _accumulate(self, slots: np.ndarray, batch: EventBatch, rows: np.ndarray):
+        np.add.at(self.acc_bytes, slots, batch.bytes[rows])
+        np.add.at(self.acc_flows, slots, 1)
+        protocols = np.fromiter((_PROTOCOL_INDEX.get(p, _OTHER) for p in batch.protocol[rows]),
+                                dtype=np.intp, count=len(rows))
+        np.add.at(self.acc_protocols, (slots, protocols), 1)
+        destinations = batch.destination_key()[rows]
+        known = destinations != ""
+        if known.any():
+            hll_add(self.acc_destinations, slots[known], _destination_hashes(destinations[known]))
+
+    def _close_window(self) -> List[Tuple[int, float, np.ndarray]]:
+        """Score and fold the open window. Returns (slot, score, z) for deviating clients."""
+        active = np.flatnonzero(self.acc_flows)
+        self.windows_closed += 1
+        if not len(active):
+            return []
+
+        flows = self.acc_flows[active]
+        shares = self.acc_protocols[active] / flows[:, None]
+        seen = self.windows[active]
+        first = seen == 0
+        mix = np.where(first[:, None], shares, self.protocol_mix[active])
+
+        x = np.empty((len(active), len(FEATURES)))
+        x[:, 0] = np.log1p(self.acc_bytes[active])
+        x[:, 1] = np.log1p(flows)
+        x[:, 2] = np.log1p(hll_count(self.acc_destinations[active]))
+        x[:, 3] = 0.5 * np.abs(shares - mix).sum(axis=1)
+
+        mean = self.mean[active]
+        var = self.var[active]
+
+        # Score against the baseline as it stood before this window. The
+        # variance starts at 0, so young baselines divide out the missing weight.
+        debias = 1 - (1 - self.alpha) ** np.maximum(seen - 1, 1)
+        std = np.maximum(np.sqrt(var / debias[:, None]), STD_FLOOR)
+        z = np.maximum((x - mean) / std, 0)
+        scores = z.max(axis=1)
+        flagged = np.flatnonzero((seen >= self.min_windows) & (scores >= self.threshold))
+
+        # Incremental EWMA mean/variance; a client's first window seeds its mean
+        diff = x - mean
+        increment = self.alpha * diff
+        self.mean[active] = np.where(first[:, None], x, mean + increment)
+        self.var[active] = np.where(first[:, None], 0.0, (1 - self.alpha) * (var + diff * increment))
+        self.protocol_mix[active] = mix + self.alpha * (shares - mix)
+        self.windows[active] = seen + 1
+
+        self.acc_bytes[active] = 0
+        self.acc_flows[active] = 0
+        self.acc_protocols[active] = 0
+        self.acc_destinations[active] = 0
+
+        self.deviations += len(flagged)
+        return [(int(active[i]), float(scores[i]), z[i]) for i in flagged]
+
+    def update(self, batch: EventBatch) -> List[Tuple[int, float, np.ndarray]]:
+        """Fold a batch in; returns deviations from any windows it closed."""
+        if not len(batch):
+            return []
+        slots = self._slots_for(batch.client_id, batch.client_name)
+        window_ids = batch.timestamp_ms // self.window_ms
+
+        deviations = []
+        for window_id in np.unique(window_ids):
+            if self.current_window is None:
+                self.current_window = int(window_id)
+            elif window_id > self.current_window:
+                deviations.extend(self._close_window())
+                self.current_window = int(window_id)
+            # Late events (older windows) count towards the open one
+            rows = np.flatnonzero(window_ids == window_id)
+            self._accumulate(slots[rows], batch, rows)
+        return deviations
+
+    def baseline(self, client_id: str) -> Optional[dict]:
+        slot = self.slots.get(client_id)
+        if slot is None:
+            return None
+        return {
+            "windows": int(self.windows[slot]),
+            "mean": dict(zip(FEATURES, self.mean[slot].round(4).tolist())),
+            "std": dict(zip(FEATURES, np.sqrt(self.var[slot]).round(4).tolist())),
+            "protocol_mix": dict(zip(PROTOCOLS, self.protocol_mix[slot].round(4).tolist())),
+        }
+
+    def stats(self) -> dict:
+        state_bytes = sum(getattr(self, name).nbytes for name in self._STATE)
+        return {
+            "clients": len(self.slots),
+            "capacity": len(self.windows),
+            "state_bytes": state_bytes,
+            "windows_closed": self.windows_closed,
+            "deviations": self.deviations,
+        }
+
+
+class BaselineRule(Rule):
+    """Alerts when a client's closed window deviates from its own baseline."""
+
+    name = "behavior_baseline"
+
+    def __init__(self, engine: Optional[BaselineEngine] = None):
+        self.engine = engine if engine is not None else BaselineEngine()
+
+    def evaluate(self, batch: EventBatch) -> List[Alert]:
+        alerts = []
+        for slot, score, z in self.engine.update(batch):
+            client_id = self.engine.client_ids[slot]
+            client_name = self.engine.client_names[slot]
+            top = np.argsort(z)[::-1][:3]
+            drivers = {FEATURES[i]: round(float(z[i]), 2) for i in top if z[i] >= 1}
+            summary = ", ".join(f"{feature} z={value}" for feature, value in drivers.items())
+            alerts.append(Alert(("behavior_baseline", client_id), {
+                "type": "anomaly",
+                "message": f"📈 {client_name} (ID: {client_id}) deviated from its baseline ({summary})",
+                "score": round(score, 2),
+                "drivers": drivers,
+                "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+            }))
+        return alerts
@@ -0,0 +1,286 @@
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+import asyncio
+import logging
+import os
+import time
+
+import numpy as np
+
+from detection import Alert, EventBatch, Rule
+from scoring_pool import ScoringPool
+
+# (client, destination) pairs tracked; the least active are evicted first
+BEACON_MAX_PAIRS = int(os.getenv("BEACON_MAX_PAIRS", "20000"))
+# Most recent connection times kept per pair
+BEACON_HISTORY = 64
+# Connections a pair needs before it is scored
+BEACON_MIN_EVENTS = 12
+# Seconds of event time between scoring passes
+BEACON_SCORE_INTERVAL = 300
+# Coefficient of variation of inter-arrival times at or below which traffic is "low jitter"
+BEACON_MAX_JITTER = float(os.getenv("BEACON_MAX_JITTER", "0.15"))
+# Share of (non-DC) spectral power in the strongest frequency needed to call it periodic
+BEACON_MIN_PERIODICITY = float(os.getenv("BEACON_MIN_PERIODICITY", "0.2"))
+# Beacons faster than this are more likely chatty protocols than C2 check-ins
+BEACON_MIN_PERIOD_SECONDS = 5.0
+# Bins in the per-pair count series fed to the FFT
+BEACON_FFT_BINS = 256
+# Flow ids remembered for dedup; packetbeat re-reports a live flow every period
+BEACON_FLOW_MEMORY = 200000
+
+logger = logging.getLogger(__name__)
+
+
+def score_periodicity(times: np.ndarray, valid: np.ndarray, bins: int = BEACON_FFT_BINS):
+    """
+    Jitter and spectral periodicity for many pairs at once.
+
+    `times` is pairs x history in seconds, chronological per row, with
+    `valid` marking the filled (right-aligned) entries. Returns per pair:
+    mean interval, coefficient of variation of the intervals (jitter) and
+    the share of spectral power in the strongest non-DC frequency of the
+    binned connection count series.
+    """
+    pairs, history = times.shape
+    gaps = np.diff(times, axis=1)
+    gap_valid = valid[:, 1:] & valid[:, :-1]
+    counts = gap_valid.sum(axis=1)
+
+    gap_sum = np.where(gap_valid, gaps, 0).sum(axis=1)
+    mean = gap_sum / np.maximum(counts, 1)
+    variance = np.where(gap_valid, (gaps - mean[:, None]) ** 2, 0).sum(axis=1) / np.maximum(counts, 1)
+    jitter = np.sqrt(variance) / np.maximum(mean, 1e-9)
+
+    # Bin each pair's own span into a count series and look for one dominant frequency
+    first = np.where(valid, times, np.inf).min(axis=1)
+    last = np.where(valid, times, -np.inf).max(axis=1)
+    span = np.maximum(last - first, 1e-9)
+    position = np.clip(((times - first[:, None]) / span[:, None] * (bins - 1)).astype(np.int64), 0, bins - 1)
+    series = np.zeros((pairs, bins))
+    rows = np.broadcast_to(np.arange(pairs)[:, None], times.shape)
+    np.add.at(series, (rows[valid], position[valid]), 1)
+
+    power = np.abs(np.fft.rfft(series - series.mean(axis=1, keepdims=True), axis=1)[:, 1:]) ** 2
+    periodicity = power.max(axis=1) / np.maximum(power.sum(axis=1), 1e-12)
+    return mean, jitter, periodicity
+
+
+class BeaconTracker:
+    """
+    Recent connection times per (client, destination) pair in fixed arrays.
+
+    Each tracked pair owns a row of a pairs x BEACON_HISTORY ring buffer.
+    When all rows are taken, new pairs replace the pairs with the fewest
+    connections (space-saving style: the newcomer inherits that count), so
+    memory is bounded while heavy talkers stay tracked. Each flow id is
+    counted once, since packetbeat reports long-lived flows periodically
+    and those updates would look like a perfect beacon.
+    """
+
+    def __init__(self, max_pairs: int = BEACON_MAX_PAIRS, history: int = BEACON_HISTORY):
+        self.max_pairs = max_pairs
+        self.history = history
+        self.times = np.zeros((max_pairs, history), dtype=np.int64)  # epoch millis
+        self.head = np.zeros(max_pairs, dtype=np.int64)  # next write position
+        self.filled = np.zeros(max_pairs, dtype=np.int64)  # valid entries in the ring
+        self.counts = np.zeros(max_pairs, dtype=np.int64)  # connections seen (space-saving count)
+        self.slots: Dict[Tuple[str, str], int] = {}
+        self.pairs: List[Optional[Tuple[str, str]]] = [None] * max_pairs
+        self.client_names: List[str] = [""] * max_pairs
+        self._seen_flows: "OrderedDict[str, None]" = OrderedDict()
+        self.evicted = 0
+        self.duplicate_flows = 0
+
+    def __len__(self) -> int:
+        return len(self.slots)
+
+    def _new_flow_mask(self, flow_ids: np.ndarray) -> np.ndarray:
+        seen = self._seen_flows
+        mask = np.ones(len(flow_ids), dtype=bool)
+        for i, flow_id in enumerate(flow_ids):
+            if not flow_id:
+                continue
+            if flow_id in seen:
+                mask[i] = False
+                seen.move_to_end(flow_id)
+            else:
+                seen[flow_id] = None
+        while len(seen) > BEACON_FLOW_MEMORY:
+            seen.popitem(last=False)
+        self.duplicate_flows += int((~mask).sum())
+        return mask
+
+    def _assign_slots(self, keys: List[Tuple[str, str]], names: np.ndarray) -> np.ndarray:
+        """Slot per key, taking free rows or evicting the least active pairs. -1 = not tracked."""
+        slots = self.slots
+        distinct = list(dict.fromkeys(keys))
+        new_keys = [key for key in distinct if key not in slots]
+        if new_keys:
+            n_free = min(self.max_pairs - len(slots), len(new_keys))
+            # Until the table first fills up, occupied rows are exactly 0..len(slots)-1
+            targets = list(range(len(slots), len(slots) + n_free))
+            inherited = [0] * n_free
+            reuse = len(new_keys) - n_free
+            if reuse:
+                # Evict the least active tracked pairs that aren't in this batch
+                candidates = self.counts.copy()
+                protected = [slots[key] for key in distinct if key in slots] + targets
+                candidates[protected] = np.iinfo(np.int64).max
+                reuse = min(reuse, self.max_pairs - len(protected))
+                victims = np.argpartition(candidates, reuse - 1)[:reuse] if reuse else np.zeros(0, dtype=np.intp)
+                for victim in victims:
+                    del slots[self.pairs[victim]]
+                targets.extend(victims.tolist())
+                inherited.extend(self.counts[victims].tolist())
+                self.evicted += len(victims)
+
+            first_name = dict(zip(keys, names))
+            for key, slot, count in zip(new_keys, targets, inherited):
+                slots[key] = slot
+                self.pairs[slot] = key
+                self.client_names[slot] = first_name[key]
+                self.head[slot] = 0
+                self.filled[slot] = 0
+                self.counts[slot] = count
+        return np.fromiter((slots.get(key, -1) for key in keys), dtype=np.intp, count=len(keys))
+
+    def add(self, batch: EventBatch):
+        destinations = batch.destination_key()
+        rows = np.flatnonzero(destinations != "")
+        if not len(rows):
+            return
+        rows = rows[self._new_flow_mask(batch.flow_id[rows])]
+        if not len(rows):
+            return
+
+        keys = list(zip(batch.client_id[rows].tolist(), destinations[rows].tolist()))
+        slots = self._assign_slots(keys, batch.client_name[rows])
+        tracked = slots >= 0
+        rows, slots = rows[tracked], slots[tracked]
+
+        # Vectorized ring-buffer append: rank each event within its slot's group
+        order = np.argsort(slots, kind="stable")
+        sorted_slots = slots[order]
+        group_start = np.r_[0, np.flatnonzero(np.diff(sorted_slots)) + 1]
+        group_sizes = np.diff(np.r_[group_start, len(sorted_slots)])
+        rank = np.arange(len(sorted_slots)) - np.repeat(group_start, group_sizes)
+        positions = (self.head[sorted_slots] + rank) % self.history
+        self.times[sorted_slots, positions] = batch.timestamp_ms[rows][order]
+
+        unique_slots = sorted_slots[group_start]
+        self.head[unique_slots] = (self.head[unique_slots] + group_sizes) % self.history
+        self.filled[unique_slots] = np.minimum(self.filled[unique_slots] + group_sizes, self.history)
+        self.counts[unique_slots] += group_sizes
+
+    def score_inputs(self, min_events: int = BEACON_MIN_EVENTS) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """(slots, times, valid) for every pair with enough history, ready for score_periodicity()."""
+        slots = np.flatnonzero(self.filled >= min_events)
+        # Unroll each ring so the oldest entry comes first, right-aligned with `valid`
+        offsets = (self.head[slots, None] + np.arange(self.history)[None, :]) % self.history
+        times = self.times[slots[:, None], offsets] / 1000.0
+        valid = np.arange(self.history)[None, :] >= (self.history - self.filled[slots])[:, None]
+        return slots, times, valid
+
+    def score(self, min_events: int = BEACON_MIN_EVENTS):
+        """Score every pair with enough history. Returns (slots, mean period s, jitter, periodicity)."""
+        slots, times, valid = self.score_inputs(min_events)
+        if not len(slots):
+            empty = np.zeros(0)
+            return slots, empty, empty, empty
+        mean, jitter, periodicity = score_periodicity(times, valid)
+        return slots, mean, jitter, periodicity
+
+    def stats(self) -> dict:
+        return {
+            "pairs": len(self.slots),
+            "max_pairs": self.max_pairs,
+            "state_bytes": self.times.nbytes + self.head.nbytes + self.filled.nbytes + self.counts.nbytes,
+            "evicted": self.evicted,
+            "duplicate_flows": self.duplicate_flows,
+        }
+
+
+class BeaconingRule(Rule):
+    """
+    Alerts on low-jitter, strongly periodic connections from a client to one destination.
+
+    With a `pool`, each scoring pass runs in its worker processes and the
+    alerts are returned from collect() when it finishes; a pass that is
+    still running when the next one is due makes that one skip.
+    """
+
+    name = "beaconing"
+
+    def __init__(self, tracker: Optional[BeaconTracker] = None, interval: int = BEACON_SCORE_INTERVAL,
+                 pool: Optional[ScoringPool] = None):
+        self.tracker = tracker if tracker is not None else BeaconTracker()
+        self.interval_ms = interval * 1000
+        self.pool = pool
+        self.last_scored_ms: Optional[int] = None
+        self.last_scored_pairs = 0
+        self.skipped_passes = 0
+        self._pending: Optional[asyncio.Future] = None
+        self._pending_pairs: List[Tuple[Tuple[str, str], str]] = []
+
+    def detect(self) -> List[Alert]:
+        slots, mean, jitter, periodicity = self.tracker.score()
+        pairs = [(self.tracker.pairs[slot], self.tracker.client_names[slot]) for slot in slots]
+        return self._alerts(pairs, mean, jitter, periodicity)
+
+    def _offload(self):
+        if self._pending is not None:
+            self.skipped_passes += 1
+            return
+        slots, times, valid = self.tracker.score_inputs()
+        if not len(slots):
+            return
+        # Slots can be reused while the pass runs, so resolve the pairs now
+        self._pending_pairs = [(self.tracker.pairs[slot], self.tracker.client_names[slot]) for slot in slots]
+        self._pending = asyncio.ensure_future(self.pool.map_rows(score_periodicity, {"times": times, "valid": valid}))
+
+    def collect(self) -> List[Alert]:
+        if self._pending is None or not self._pending.done():
+            return []
+        pending, self._pending = self._pending, None
+        if pending.exception() is not None:
+            logger.error(f"Offloaded beaconing pass failed: {pending.exception()}")
+            return []
+        return self._alerts(self._pending_pairs, *pending.result())
+
+    def _alerts(self, pairs, mean: np.ndarray, jitter: np.ndarray, periodicity: np.ndarray) -> List[Alert]:
+        self.last_scored_pairs = len(pairs)
+        flagged = np.flatnonzero(
+            (jitter <= BEACON_MAX_JITTER) & (periodicity >= BEACON_MIN_PERIODICITY) & (mean >= BEACON_MIN_PERIOD_SECONDS)
+        )
+        alerts = []
+        for i in flagged:
+            (client_id, destination), client_name = pairs[i]
+            alerts.append(Alert(("beaconing", client_id, destination), {
+                "type": "alert",
+                "message": f"📡 {client_name} (ID: {client_id}) is beaconing to {destination} "
+                           f"every {mean[i]:.0f}s (jitter {jitter[i]:.2f}, periodicity {periodicity[i]:.2f})",
+                "period_seconds": round(float(mean[i]), 1),
+                "jitter": round(float(jitter[i]), 3),
+                "periodicity": round(float(periodicity[i]), 3),
+                "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+            }))
+        return alerts
+
+    def evaluate(self, batch: EventBatch) -> List[Alert]:
+        if not len(batch):
+            return []
+        self.tracker.add(batch)
+        newest = int(batch.timestamp_ms.max())
+        if self.last_scored_ms is None:
+            self.last_scored_ms = newest
+        if newest - self.last_scored_ms < self.interval_ms:
+            return []
+        self.last_scored_ms = newest
+        if self.pool is not None:
+            self._offload()
+            return []
+        return self.detect()
+
+    def stats(self) -> dict:
+        return dict(self.tracker.stats(), last_scored_pairs=self.last_scored_pairs, skipped_passes=self.skipped_passes)
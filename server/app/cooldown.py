@@ -0,0 +1,121 @@
+from collections import OrderedDict
+from typing import Hashable, Optional
+import json
+import logging
+import os
+import threading
+import time
+
+from data_dir import DATA_DIR, ensure_parent
+
+COOLDOWN_SNAPSHOT_FILE = os.getenv("COOLDOWN_SNAPSHOT_FILE", os.path.join(DATA_DIR, "cooldowns.json"))
+COOLDOWN_MAX_ENTRIES = int(os.getenv("COOLDOWN_MAX_ENTRIES", "200000"))
+COOLDOWN_SNAPSHOT_INTERVAL = 30
+
+logger = logging.getLogger(__name__)
+
+
+class CooldownStore:
+    """
+    Alert cooldowns with time-based expiry and a hard entry cap.
+
+    Every key shares one TTL, so expiry order is insertion order: entries
+    live in an OrderedDict and re-arming a key moves it to the back. That
+    makes check_and_set() O(1), and expired entries are popped off the
+    front as they age out instead of accumulating forever. When the cap is
+    reached the entries closest to expiry are evicted first.
+
+    Keys are tuples such as ("restricted_domain", client, domain). Expiry
+    times are wall-clock so a snapshot stays meaningful across restarts.
+    """
+
+    def __init__(self, ttl: float, max_entries: int = COOLDOWN_MAX_ENTRIES, path: Optional[str] = COOLDOWN_SNAPSHOT_FILE):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.path = path
+        self._expires: "OrderedDict[Hashable, float]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.dirty = False
+        self.fired = 0
+        self.suppressed = 0
+        self.expired = 0
+        self.evicted = 0
+
+    def __len__(self) -> int:
+        return len(self._expires)
+
+    def _expire(self, now: float):
+        expires = self._expires
+        while expires:
+            key, expires_at = next(iter(expires.items()))
+            if expires_at > now:
+                break
+            del expires[key]
+            self.expired += 1
+
+    def check_and_set(self, key: Hashable, now: Optional[float] = None) -> bool:
+        """True if `key` is not cooling down, in which case its cooldown starts now."""
+        now = time.time() if now is None else now
+        with self._lock:
+            self._expire(now)
+            if key in self._expires:
+                self.suppressed += 1
+                return False
+            while len(self._expires) >= self.max_entries:
+                self._expires.popitem(last=False)
+                self.evicted += 1
+            self._expires[key] = now + self.ttl
+            self.fired += 1
+            self.dirty = True
+            return True
+
+    def is_cooling_down(self, key: Hashable, now: Optional[float] = None) -> bool:
+        now = time.time() if now is None else now
+        expires_at = self._expires.get(key)
+        return expires_at is not None and expires_at > now
+
+    def save(self):
+        """Atomically write the live entries to `path`."""
+        if not self.path:
+            return
+        with self._lock:
+            self._expire(time.time())
+            entries = [[list(key) if isinstance(key, tuple) else key, expires_at]
+                       for key, expires_at in self._expires.items()]
+            self.dirty = False
+        tmp_path = ensure_parent(f"{self.path}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump({"ttl": self.ttl, "entries": entries}, file)
+        os.replace(tmp_path, self.path)
+
+    def load(self):
+        """Restore entries from `path`, skipping any that expired while we were down."""
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, encoding="utf-8") as file:
+                entries = json.load(file)["entries"]
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Ignoring unreadable cooldown snapshot {self.path}: {e}")
+            return
+
+        now = time.time()
+        # Ordered by expiry alone: keys of different types don't compare
+        live = sorted(((expires_at, tuple(key) if isinstance(key, list) else key)
+                       for key, expires_at in entries if expires_at > now), key=lambda item: item[0])
+        with self._lock:
+            for expires_at, key in live[-self.max_entries:]:
+                self._expires[key] = expires_at
+            self._expires = OrderedDict(sorted(self._expires.items(), key=lambda item: item[1]))
+        logger.info(f"Restored {len(live)} alert cooldowns from {self.path}")
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._expires),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+            "fired": self.fired,
+            "suppressed": self.suppressed,
+            "expired": self.expired,
+            "evicted": self.evicted,
+        }
@@ -0,0 +1,12 @@
+import os
+
+# Runtime state (rollup store, cooldown snapshot) is written here rather than into the source tree
+DATA_DIR = os.getenv("UEBA_DATA_DIR", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data"))
+
+
+def ensure_parent(path: str) -> str:
+    """Create the directory `path` will be written into, if missing."""
+    parent = os.path.dirname(path)
+    if parent:
+        os.makedirs(parent, exist_ok=True)
+    return path
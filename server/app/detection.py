@@ -0,0 +1,334 @@
+from typing import Callable, Dict, Hashable, Iterable, List, Optional, Sequence
+import asyncio
+import logging
+import time
+
+import numpy as np
+
+from cooldown import CooldownStore
+from metrics import LoopTimer
+from tailer import LogTailer
+
+# Fields every rule can rely on being present in an EventBatch
+EVENT_SOURCE_FIELDS = [
+    "@timestamp",
+    "client_id",
+    "client_name",
+    "destination.domain",
+    "destination.ip",
+    "flow.id",
+    "network.bytes",
+    "network.protocol",
+]
+
+logger = logging.getLogger(__name__)
+
+
+def _narrows(query: dict, other: dict) -> bool:
+    """True if `query` is a bool filter that includes all of `other`, so it can only match a subset of it."""
+    clauses = (query.get("bool") or {}).get("filter")
+    return isinstance(clauses, list) and other in clauses
+
+
+def _first(value, default):
+    if isinstance(value, list):
+        return value[0] if value else default
+    return default if value is None else value
+
+
+class EventBatch:
+    """
+    One tailer batch normalized into columns.
+
+    String columns are object arrays and numeric ones are int64 arrays, all of
+    the same length, so rules can select rows with boolean masks instead of
+    re-walking the raw hits. Missing strings (domain, ip, flow id) are "".
+    """
+
+    __slots__ = ("ids", "timestamp_ms", "client_id", "client_name", "domain", "root_domain", "bytes", "protocol",
+                 "destination_ip", "flow_id")
+
+    def __init__(self, ids, timestamp_ms, client_id, client_name, domain, root_domain, bytes, protocol,
+                 destination_ip=None, flow_id=None):
+        self.ids = ids
+        self.timestamp_ms = timestamp_ms
+        self.client_id = client_id
+        self.client_name = client_name
+        self.domain = domain
+        self.root_domain = root_domain
+        self.bytes = bytes
+        self.protocol = protocol
+        self.destination_ip = destination_ip if destination_ip is not None else np.full(len(ids), "", dtype=object)
+        self.flow_id = flow_id if flow_id is not None else np.full(len(ids), "", dtype=object)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def destination_key(self) -> np.ndarray:
+        """Root domain where known, else destination IP, else ""."""
+        keys = self.root_domain.copy()
+        missing = keys == ""
+        keys[missing] = self.destination_ip[missing]
+        return keys
+
+    @classmethod
+    def from_hits(cls, hits: Sequence[dict], root_domains: Callable[[Iterable[str]], List[str]]) -> "EventBatch":
+        count = len(hits)
+        ids = np.empty(count, dtype=object)
+        client_id = np.empty(count, dtype=object)
+        client_name = np.empty(count, dtype=object)
+        domain = np.empty(count, dtype=object)
+        protocol = np.empty(count, dtype=object)
+        destination_ip = np.empty(count, dtype=object)
+        flow_id = np.empty(count, dtype=object)
+        timestamp_ms = np.empty(count, dtype=np.int64)
+        sent_bytes = np.zeros(count, dtype=np.int64)
+
+        for i, hit in enumerate(hits):
+            source = hit.get("_source") or {}
+            destination = source.get("destination") or {}
+            network = source.get("network") or {}
+            flow = source.get("flow") or {}
+            ids[i] = hit["_id"]
+            # The tailer sorts on @timestamp, so its sort value is epoch millis
+            timestamp_ms[i] = hit["sort"][0]
+            client_id[i] = str(_first(source.get("client_id"), "Unknown ID"))
+            client_name[i] = str(_first(source.get("client_name"), "Unknown"))
+            value = _first(destination.get("domain"), "")
+            domain[i] = value if isinstance(value, str) and value != "N/A" else ""
+            protocol[i] = str(_first(network.get("protocol"), ""))
+            destination_ip[i] = str(_first(destination.get("ip"), ""))
+            flow_id[i] = str(_first(flow.get("id"), ""))
+            value = _first(network.get("bytes"), 0)
+            sent_bytes[i] = value if isinstance(value, (int, float)) else 0
+
+        root_domain = np.empty(count, dtype=object)
+        has_domain = domain != ""
+        root_domain[:] = ""
+        if has_domain.any():
+            root_domain[has_domain] = root_domains(domain[has_domain])
+
+        return cls(ids, timestamp_ms, client_id, client_name, domain, root_domain, sent_bytes, protocol,
+                   destination_ip, flow_id)
+
+
+class Alert:
+    """An alert raised by a rule. `key` doubles as its cooldown and fan-out coalesce key."""
+
+    __slots__ = ("key", "payload")
+
+    def __init__(self, key: Hashable, payload: dict):
+        self.key = key
+        self.payload = payload
+
+
+class Rule:
+    """
+    A detection stage fed every EventBatch by the DetectionPipeline.
+
+    Subclasses set `name` and implement evaluate(). `query` is an optional ES
+    filter describing the events the rule cares about (None = all events).
+    When every rule declares one, the pipeline ORs them into its single
+    ingest query, so adding a rule never adds a query; as soon as one rule
+    needs all events the pipeline tails match_all instead. Either way
+    evaluate() sees every event in the batch and must apply its own
+    predicate. `runtime_mappings` are merged likewise, and only sent when
+    the query that references them is.
+
+    Rules that offload scoring (e.g. to a ScoringPool) return those alerts
+    from collect() once the work finishes; the pipeline polls it every cycle.
+    """
+
+    name = "rule"
+    query: Optional[dict] = None
+    runtime_mappings: Optional[dict] = None
+
+    async def prepare(self):
+        """Refresh any I/O-backed state before a batch is evaluated."""
+
+    def evaluate(self, batch: EventBatch) -> List[Alert]:
+        raise NotImplementedError
+
+    def collect(self) -> List[Alert]:
+        """Alerts from offloaded work that finished since the last cycle."""
+        return []
+
+
+class RuleStats:
+    __slots__ = ("batches", "events", "cpu_seconds", "last_cpu_ms", "alerts", "suppressed", "errors")
+
+    def __init__(self):
+        self.batches = 0
+        self.events = 0
+        self.cpu_seconds = 0.0
+        self.last_cpu_ms = 0.0
+        self.alerts = 0
+        self.suppressed = 0
+        self.errors = 0
+
+    def snapshot(self) -> dict:
+        return {
+            "batches": self.batches,
+            "events": self.events,
+            "cpu_seconds": round(self.cpu_seconds, 6),
+            "cpu_us_per_event": round(self.cpu_seconds / self.events * 1e6, 3) if self.events else None,
+            "last_cpu_ms": round(self.last_cpu_ms, 3),
+            "alerts": self.alerts,
+            "suppressed": self.suppressed,
+            "errors": self.errors,
+        }
+
+
+class DetectionPipeline:
+    """
+    Single ingest stage feeding every registered rule.
+
+    Each cycle one LogTailer poll pulls the next batch of new events, which
+    is normalized once into an EventBatch and handed to each rule in turn.
+    Alerts go through the shared cooldown store and then `sink`. CPU time
+    (thread time) is tracked per rule and for the normalize step.
+    `clock` (seconds, default wall time) dates the cooldowns; replays pass
+    event time so cooldowns behave as they would have live.
+    """
+
+    def __init__(self, index: str, rules: Sequence[Rule], cooldowns: CooldownStore,
+                 sink: Callable[[dict, Hashable], object], root_domains: Callable[[Iterable[str]], List[str]],
+                 clock: Optional[Callable[[], float]] = None):
+        names = [rule.name for rule in rules]
+        if len(set(names)) != len(names):
+            raise ValueError(f"Rule names must be unique: {names}")
+        self.rules = list(rules)
+        self.cooldowns = cooldowns
+        self.sink = sink
+        self.root_domains = root_domains
+        self.clock = clock
+        self.stats_by_rule: Dict[str, RuleStats] = {rule.name: RuleStats() for rule in self.rules}
+        self.ingest_stats = RuleStats()
+        self.tailer = LogTailer(
+            index=index,
+            query=self.build_query(self.rules),
+            source=EVENT_SOURCE_FIELDS,
+            runtime_mappings=self.build_runtime_mappings(self.pushed_down(self.rules)) or None,
+        )
+
+    @staticmethod
+    def pushed_down(rules: Sequence[Rule]) -> List[Rule]:
+        """
+        The rules whose queries make up the ingest query: none if any rule needs
+        all events, else those not already covered by a wider rule's query.
+        """
+        if not rules or any(rule.query is None for rule in rules):
+            return []
+        return [rule for rule in rules
+                if not any(other is not rule and _narrows(rule.query, other.query) for other in rules)]
+
+    @classmethod
+    def build_query(cls, rules: Sequence[Rule]) -> dict:
+        queries = [rule.query for rule in cls.pushed_down(rules)]
+        if not queries:
+            return {"match_all": {}}
+        if len(queries) == 1:
+            return queries[0]
+        return {"bool": {"should": queries, "minimum_should_match": 1}}
+
+    @staticmethod
+    def build_runtime_mappings(rules: Sequence[Rule]) -> dict:
+        mappings = {}
+        for rule in rules:
+            for field, mapping in (rule.runtime_mappings or {}).items():
+                if mappings.get(field, mapping) != mapping:
+                    raise ValueError(f"Rule {rule.name} redefines runtime field {field}")
+                mappings[field] = mapping
+        return mappings
+
+    def normalize(self, hits: Sequence[dict]) -> EventBatch:
+        started = time.thread_time()
+        batch = EventBatch.from_hits(hits, self.root_domains)
+        self._record(self.ingest_stats, len(batch), time.thread_time() - started)
+        return batch
+
+    @staticmethod
+    def _record(stats: RuleStats, events: int, cpu: float):
+        stats.batches += 1
+        stats.events += events
+        stats.cpu_seconds += cpu
+        stats.last_cpu_ms = cpu * 1000
+
+    def process(self, batch: EventBatch) -> int:
+        """Run every rule over `batch` and deliver alerts. Returns alerts sent."""
+        sent = 0
+        for rule in self.rules:
+            stats = self.stats_by_rule[rule.name]
+            started = time.thread_time()
+            try:
+                alerts = rule.evaluate(batch)
+            except Exception as e:
+                stats.errors += 1
+                logger.exception(f"Rule {rule.name} failed: {e}")
+                continue
+            finally:
+                self._record(stats, len(batch), time.thread_time() - started)
+            sent += self._deliver(stats, alerts)
+        return sent
+
+    def collect(self) -> int:
+        """Deliver alerts from rules' offloaded work. Returns alerts sent."""
+        sent = 0
+        for rule in self.rules:
+            stats = self.stats_by_rule[rule.name]
+            try:
+                alerts = rule.collect()
+            except Exception as e:
+                stats.errors += 1
+                logger.exception(f"Rule {rule.name} failed: {e}")
+                continue
+            sent += self._deliver(stats, alerts)
+        return sent
+
+    def _deliver(self, stats: RuleStats, alerts: List[Alert]) -> int:
+        sent = 0
+        now = self.clock() if self.clock is not None else None
+        for alert in alerts:
+            if self.cooldowns.check_and_set(alert.key, now):
+                stats.alerts += 1
+                self.sink(alert.payload, alert.key)
+                sent += 1
+            else:
+                stats.suppressed += 1
+        return sent
+
+    async def poll(self, es) -> List[dict]:
+        """Next batch of hits from the tailer."""
+        return await self.tailer.poll(es)
+
+    def ingest(self, hits: List[dict]) -> int:
+        """Normalize polled hits once and evaluate every rule on them. Returns alerts sent."""
+        sent = self.process(self.normalize(hits)) if hits else 0
+        return sent + self.collect()
+
+    async def prepare(self):
+        for rule in self.rules:
+            await rule.prepare()
+
+    async def step(self, es) -> int:
+        await self.prepare()
+        return self.ingest(await self.poll(es))
+
+    async def run(self, es):
+        timer = LoopTimer("detection")
+        while True:
+            timer.begin()
+            try:
+                await self.step(es)
+            except Exception as e:
+                print(f"❌ Error in detection pipeline: {e}")
+            interval = self.tailer.next_interval()
+            timer.end(interval)
+            await asyncio.sleep(interval)
+
+    def stats(self) -> dict:
+        return {
+            "tailer": dict(self.tailer.stats(), pushed_down=[rule.name for rule in self.pushed_down(self.rules)]),
+            "ingest": self.ingest_stats.snapshot(),
+            "rules": {name: stats.snapshot() for name, stats in self.stats_by_rule.items()},
+        }
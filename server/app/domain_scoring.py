@@ -0,0 +1,279 @@
+from collections import OrderedDict
+from typing import Iterable, List, Optional, Sequence, Tuple
+import os
+import time
+
+import numpy as np
+
+from detection import Alert, EventBatch, Rule
+
+# Distinct domain names whose verdicts are memoized
+DOMAIN_SCORE_CACHE_SIZE = int(os.getenv("DOMAIN_SCORE_CACHE_SIZE", "200000"))
+# Optional file of known-good names (one per line) to train the bigram model on instead of the built-in corpus
+DOMAIN_BIGRAM_CORPUS_FILE = os.getenv("DOMAIN_BIGRAM_CORPUS_FILE")
+
+# Registered labels shorter than this are never called DGA; short names are too ambiguous
+DGA_MIN_LENGTH = 8
+# Mean bigram log-likelihood (nats per transition) at or below which a label reads as random
+DGA_MAX_LIKELIHOOD = float(os.getenv("DGA_MAX_LIKELIHOOD", "-3.5"))
+# Shannon entropy (bits per char) a DGA candidate must also reach
+DGA_MIN_ENTROPY = float(os.getenv("DGA_MIN_ENTROPY", "2.8"))
+
+# Subdomain length (chars, without the registered domain) from which a name may be a tunnel;
+# cloud hostnames like <bucket>.s3.dualstack.<region>.amazonaws.com run to ~45
+TUNNEL_MIN_LENGTH = int(os.getenv("TUNNEL_MIN_LENGTH", "60"))
+# Entropy (bits per char) of that subdomain needed to call it encoded data
+TUNNEL_MIN_ENTROPY = float(os.getenv("TUNNEL_MIN_ENTROPY", "3.8"))
+# A single label this long is a tunnel on its own; legitimate labels rarely come close to the 63 char limit
+TUNNEL_MIN_LABEL_LENGTH = 52
+
+# Verdicts
+BENIGN = 0
+DGA = 1
+TUNNEL = 2
+
+# Symbols: a-z, 0-9, "-", any other byte, and a word boundary at each end
+_ALPHABET = "abcdefghijklmnopqrstuvwxyz0123456789-"
+_OTHER = len(_ALPHABET)
+_BOUNDARY = _OTHER + 1
+_SYMBOLS = _BOUNDARY + 1
+_CODES = np.full(256, _OTHER, dtype=np.intp)
+for _i, _char in enumerate(_ALPHABET):
+    _CODES[ord(_char)] = _i
+    _CODES[ord(_char.upper())] = _i
+# The bigram model sees every digit as "0": real names put digits in runs
+# (cdn77, web01), which it can learn; it can't learn each digit pair
+_BIGRAM_CLASS = np.arange(_SYMBOLS)
+_BIGRAM_CLASS[[_ALPHABET.index(digit) for digit in "0123456789"]] = _ALPHABET.index("0")
+
+# Words and brand fragments typical of real hostnames; enough to learn which
+# character transitions are normal in names people pick
+_BUILTIN_CORPUS = """
+google youtube facebook amazon microsoft apple twitter instagram linkedin wikipedia yahoo netflix reddit
+office outlook windows update live login account accounts mail email calendar drive docs sheets cloud
+cloudflare akamai fastly cdn static assets images media video videos stream streaming content storage
+service services server servers api apis gateway portal secure security support help status health
+online shop store market marketplace payment payments pay bank banking finance money wallet checkout
+news weather sports music radio games game player play today times daily world global national local
+search engine index analytics metrics tracking telemetry events event logs logging monitor monitoring
+github gitlab bitbucket docker kubernetes python java script node npm package packages registry mirror
+download downloads upload uploads files file share sharing sync backup backups archive archives
+network networks internet connect connection edge proxy router firewall vpn remote desktop access
+ubuntu debian fedora redhat centos linux android mobile phone phones device devices smart home
+chat messenger message messages team teams slack zoom meeting meetings conference call voice
+adobe oracle salesforce dropbox spotify paypal stripe shopify wordpress blogger blog blogs forum
+education school university college student students learning course courses library research
+health hospital medical clinic care insurance travel hotel hotels flight flights booking tickets
+company corporate business enterprise industry digital solutions systems technology technologies
+software hardware computer computers data database information intelligence science research
+management manager admin administrator control center central office offices group groups partner
+partners customer customers client clients user users member members community social public private
+government state city county department agency official international foundation project projects
+design designs creative studio studios photo photos picture pictures gallery art arts fashion
+food recipes kitchen restaurant coffee beer wine delivery express post postal mobile wireless
+energy power solar electric water green environment earth planet space science nature animal
+office365 azure aws googleapis gstatic googleusercontent doubleclick googlesyndication msn bing skype
+akamaiedge akamaihd cloudfront amazonaws azureedge windowsupdate icloud itunes mzstatic whatsapp
+telegram discord twitch tiktok snapchat pinterest tumblr quora medium substack notion atlassian jira
+confluence zendesk hubspot mailchimp sendgrid twilio okta auth0 onelogin duo verisign digicert
+letsencrypt sectigo globalsign comodo symantec mcafee norton kaspersky sophos crowdstrike sentinel
+paloalto fortinet cisco juniper netgear linksys tplink dlink huawei samsung sony lenovo dell intel
+nvidia qualcomm broadcom realtek logitech canon epson brother xerox hewlett packard printer printers
+weather forecast maps map earth street view traffic transit train trains airline airport cars auto
+insurance realty estate property homes rent rental jobs careers career hire hiring work working
+""".split()
+
+
+def _load_corpus() -> List[str]:
+    if DOMAIN_BIGRAM_CORPUS_FILE:
+        with open(DOMAIN_BIGRAM_CORPUS_FILE, encoding="utf-8") as file:
+            words = [word for line in file for word in line.strip().lower().split(".") if word]
+        if words:
+            return words
+    return _BUILTIN_CORPUS
+
+
+def _encode(strings: Sequence[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Pack strings into a boundary-padded code matrix.
+
+    Row i is [BOUNDARY, c1 .. cL, BOUNDARY, -1 ...]: symbol codes of each
+    string framed by boundary markers and padded with -1. Returns (codes,
+    lengths). Non-ASCII characters become one OTHER symbol each.
+    """
+    lengths = np.fromiter(map(len, strings), dtype=np.intp, count=len(strings))
+    width = int(lengths.max()) + 2 if len(strings) else 2
+    codes = np.full((len(strings), width), -1, dtype=np.intp)
+    if not len(strings):
+        return codes, lengths
+    raw = np.frombuffer("".join(strings).encode("ascii", "replace"), dtype=np.uint8)
+    rows = np.repeat(np.arange(len(strings)), lengths)
+    starts = np.cumsum(lengths) - lengths
+    cols = np.arange(len(raw)) - np.repeat(starts, lengths) + 1
+    codes[rows, cols] = _CODES[raw]
+    codes[:, 0] = _BOUNDARY
+    codes[np.arange(len(strings)), lengths + 1] = _BOUNDARY
+    return codes, lengths
+
+
+class BigramModel:
+    """Character bigram log-probabilities (add-one smoothed) learned from known-good names."""
+
+    def __init__(self, words: Iterable[str]):
+        counts = np.ones((_SYMBOLS, _SYMBOLS))
+        codes, _ = _encode([word for word in words if word])
+        valid = (codes[:, :-1] >= 0) & (codes[:, 1:] >= 0)
+        np.add.at(counts, (_BIGRAM_CLASS[codes[:, :-1][valid]], _BIGRAM_CLASS[codes[:, 1:][valid]]), 1)
+        self.log_prob = np.log(counts / counts.sum(axis=1, keepdims=True))
+
+    def likelihood(self, codes: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+        """Mean log-probability per transition of each encoded string."""
+        prev, nxt = codes[:, :-1], codes[:, 1:]
+        valid = (prev >= 0) & (nxt >= 0)
+        log_prob = np.where(valid, self.log_prob[_BIGRAM_CLASS[prev], _BIGRAM_CLASS[nxt]], 0.0)
+        return log_prob.sum(axis=1) / (lengths + 1)
+
+
+def _entropy(codes: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    """Shannon entropy in bits per character of each encoded string (boundaries excluded)."""
+    counts = np.zeros((len(codes), _SYMBOLS))
+    chars = (codes >= 0) & (codes != _BOUNDARY)
+    rows = np.broadcast_to(np.arange(len(codes))[:, None], codes.shape)
+    np.add.at(counts, (rows[chars], codes[chars]), 1)
+    p = counts / np.maximum(lengths, 1)[:, None]
+    return -(p * np.log2(np.where(p > 0, p, 1))).sum(axis=1)
+
+
+def _split(domain: str, root_domain: str) -> Tuple[str, str]:
+    """(registered label, subdomain) of a name, e.g. ("example", "a.b") for a.b.example.co.uk."""
+    label = root_domain.split(".", 1)[0]
+    subdomain = domain[:-len(root_domain)].rstrip(".") if domain.endswith(root_domain) else ""
+    return label, subdomain
+
+
+class DomainScorer:
+    """
+    DGA and DNS-tunnel scoring of domain names, memoized per name.
+
+    The registered label (the part before the public suffix) is scored for
+    DGA: a long label that is both unlike the bigram model and high in
+    entropy. The subdomain is scored for tunnelling: long, high-entropy
+    subdomains or near-limit labels, typical of data encoded into lookups.
+
+    Verdicts are kept in an LRU of DOMAIN_SCORE_CACHE_SIZE names, so the
+    names that repeat all day are scored once; each batch's misses are
+    scored together in NumPy.
+    """
+
+    def __init__(self, model: Optional[BigramModel] = None, cache_size: int = DOMAIN_SCORE_CACHE_SIZE):
+        self.model = model if model is not None else BigramModel(_load_corpus())
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[str, Tuple[int, float]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.flagged = {DGA: 0, TUNNEL: 0}
+
+    def score_names(self, domains: Sequence[str], root_domains: Sequence[str]) -> List[Tuple[int, float]]:
+        """Uncached (verdict, score) per name. Score is -likelihood for DGA, subdomain entropy for tunnels."""
+        if not len(domains):
+            return []
+        labels, subdomains = zip(*map(_split, domains, root_domains))
+
+        codes, lengths = _encode(labels)
+        likelihood = self.model.likelihood(codes, lengths)
+        label_entropy = _entropy(codes, lengths)
+        dga = (lengths >= DGA_MIN_LENGTH) & (likelihood <= DGA_MAX_LIKELIHOOD) & (label_entropy >= DGA_MIN_ENTROPY)
+
+        codes, sub_lengths = _encode([subdomain.replace(".", "") for subdomain in subdomains])
+        sub_entropy = _entropy(codes, sub_lengths)
+        longest = np.fromiter((max(map(len, subdomain.split("."))) for subdomain in subdomains),
+                              dtype=np.intp, count=len(subdomains))
+        tunnel = ((sub_lengths >= TUNNEL_MIN_LENGTH) & (sub_entropy >= TUNNEL_MIN_ENTROPY)) \
+            | (longest >= TUNNEL_MIN_LABEL_LENGTH)
+
+        verdict = np.where(tunnel, TUNNEL, np.where(dga, DGA, BENIGN))
+        score = np.where(tunnel, sub_entropy, -likelihood)
+        return list(zip(verdict.tolist(), score.round(3).tolist()))
+
+    def score(self, domains: Sequence[str], root_domains: Sequence[str]) -> List[Tuple[int, float]]:
+        """(verdict, score) per name, from the cache where possible."""
+        cache = self._cache
+        results: List[Optional[Tuple[int, float]]] = [None] * len(domains)
+        missing = {}
+        for i, domain in enumerate(domains):
+            cached = cache.get(domain)
+            if cached is not None:
+                cache.move_to_end(domain)
+                results[i] = cached
+            else:
+                missing.setdefault(domain, []).append(i)
+        self.hits += len(domains) - sum(map(len, missing.values()))
+        self.misses += len(missing)
+
+        if missing:
+            names = list(missing)
+            roots = [root_domains[missing[name][0]] for name in names]
+            for name, verdict in zip(names, self.score_names(names, roots)):
+                cache[name] = verdict
+                if verdict[0] != BENIGN:
+                    self.flagged[verdict[0]] += 1
+                for i in missing[name]:
+                    results[i] = verdict
+            while len(cache) > self.cache_size:
+                cache.popitem(last=False)
+        return results
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "size": len(self._cache),
+            "max_size": self.cache_size,
+            "dga_names": self.flagged[DGA],
+            "tunnel_names": self.flagged[TUNNEL],
+        }
+
+
+class DomainScoringRule(Rule):
+    """Alerts when a client resolves or connects to a likely DGA or DNS-tunnel name."""
+
+    name = "domain_scoring"
+    query = {"exists": {"field": "destination.domain"}}
+
+    def __init__(self, scorer: Optional[DomainScorer] = None):
+        self.scorer = scorer if scorer is not None else DomainScorer()
+
+    def evaluate(self, batch: EventBatch) -> List[Alert]:
+        has_domain = (batch.domain != "") & (batch.root_domain != "")
+        if not has_domain.any():
+            return []
+
+        seen = list(dict.fromkeys(zip(batch.client_id[has_domain], batch.client_name[has_domain],
+                                      batch.domain[has_domain], batch.root_domain[has_domain])))
+        verdicts = self.scorer.score([domain for _, _, domain, _ in seen], [root for _, _, _, root in seen])
+
+        alerts = []
+        for (client_id, client, domain, root), (verdict, score) in zip(seen, verdicts):
+            if verdict == DGA:
+                alerts.append(Alert(("dga_domain", client, root), {
+                    "type": "alert",
+                    "message": f"🎲 {client} (ID: {client_id}) contacted a likely algorithmically generated domain: {domain}",
+                    "domain": domain,
+                    "score": score,
+                    "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+                }))
+            elif verdict == TUNNEL:
+                # Key on the registered domain: every tunnelled lookup is a new name
+                alerts.append(Alert(("dns_tunnel", client, root), {
+                    "type": "alert",
+                    "message": f"🕳️ {client} (ID: {client_id}) is sending encoded-looking lookups to {root}",
+                    "domain": domain,
+                    "score": score,
+                    "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+                }))
+        return alerts
+
+    def stats(self) -> dict:
+        return self.scorer.stats()
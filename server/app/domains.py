@@ -0,0 +1,250 @@
+from collections import defaultdict
+from typing import FrozenSet, List, Optional
+import csv
+import functools
+import os
+import pathlib
+import sys
+import threading
+import time
+import tldextract
+
+
+# Max distinct hostnames memoized by the root-domain extractor
+ROOT_DOMAIN_CACHE_SIZE = int(os.getenv("ROOT_DOMAIN_CACHE_SIZE", "65536"))
+# Optional local public_suffix_list.dat; otherwise tldextract's bundled snapshot is used
+PUBLIC_SUFFIX_LIST_FILE = os.getenv("PUBLIC_SUFFIX_LIST_FILE")
+
+
+class RootDomainExtractor:
+    """
+    Memoized tldextract wrapper that never touches the network.
+
+    The suffix list comes from PUBLIC_SUFFIX_LIST_FILE when set, or from the
+    snapshot bundled with tldextract, and is loaded once at construction.
+    """
+
+    def __init__(self, cache_size: int = ROOT_DOMAIN_CACHE_SIZE, suffix_list_file: Optional[str] = PUBLIC_SUFFIX_LIST_FILE):
+        suffix_list_urls = ()
+        if suffix_list_file:
+            suffix_list_urls = (pathlib.Path(suffix_list_file).resolve().as_uri(),)
+
+        self._tldextract = tldextract.TLDExtract(
+            cache_dir=None,
+            suffix_list_urls=suffix_list_urls,
+            fallback_to_snapshot=True,
+        )
+        self._tldextract("example.com")  # Parse the suffix list now, not on the first log line
+        self._cached = functools.lru_cache(maxsize=cache_size)(self._extract)
+
+    def _extract(self, domain):
+        extracted = self._tldextract(domain)
+        return f"{extracted.domain}.{extracted.suffix}" if extracted.suffix else extracted.domain
+
+    def extract(self, domain):
+        return self._cached(domain)
+
+    def extract_many(self, domains) -> List[str]:
+        cached = self._cached
+        return [cached(domain) for domain in domains]
+
+    def stats(self) -> dict:
+        info = self._cached.cache_info()
+        lookups = info.hits + info.misses
+        return {
+            "hits": info.hits,
+            "misses": info.misses,
+            "hit_ratio": info.hits / lookups if lookups else 0.0,
+            "size": info.currsize,
+            "max_size": info.maxsize,
+        }
+
+    def clear(self):
+        self._cached.cache_clear()
+
+
+root_domain_extractor = RootDomainExtractor()
+
+# Function to extract the root domain
+def extract_root_domain(domain):
+    return root_domain_extractor.extract(domain)
+
+def extract_root_domains(domains) -> List[str]:
+    return root_domain_extractor.extract_many(domains)
+
+# Character-level trie; superseded by DomainSuffixMatcher and kept for benchmarks
+class TrieNode:
+    def __init__(self):
+        self.children = defaultdict(TrieNode)
+        self.is_end = False
+
+class DomainTrie:
+    def __init__(self):
+        self.root = TrieNode()
+
+    def insert(self, domain):
+        node = self.root
+        for char in domain[::-1]:  # Reverse for suffix-based search
+            node = node.children[char]
+        node.is_end = True
+
+    def search(self, domain):
+        node = self.root
+        for char in domain[::-1]:  # Reverse search
+            if char not in node.children:
+                return False
+            node = node.children[char]
+            if node.is_end:
+                return True  # Allow subdomain matches
+        return node.is_end
+
+
+class DomainSuffixMatcher:
+    """
+    Label-level suffix matcher backed by a set of interned domain strings.
+
+    A lookup probes the domain and each parent domain after a dot, so it costs
+    O(labels) hash lookups and only matches on label boundaries:
+    `mail.google.com` matches `google.com`, `notgoogle.com` does not.
+    """
+
+    __slots__ = ("_suffixes",)
+
+    def __init__(self, domains=()):
+        self._suffixes = set()
+        for domain in domains:
+            self.insert(domain)
+
+    def insert(self, domain: str):
+        domain = domain.strip().strip(".").lower()
+        if domain:
+            self._suffixes.add(sys.intern(domain))
+
+    def search(self, domain: str) -> bool:
+        suffixes = self._suffixes
+        domain = domain.lower()
+        if domain in suffixes:
+            return True
+        dot = domain.find(".")
+        while dot != -1:
+            if domain[dot + 1:] in suffixes:
+                return True
+            dot = domain.find(".", dot + 1)
+        return False
+
+    def match_many(self, domains) -> List[bool]:
+        search = self.search
+        return [search(domain) for domain in domains]
+
+    def __len__(self):
+        return len(self._suffixes)
+
+    def __contains__(self, domain):
+        return self.search(domain)
+
+
+class BlocklistSnapshot:
+    """A compiled, versioned view of the restricted-domain CSV."""
+
+    __slots__ = ("version", "domains", "matcher", "mtime_ns", "loaded_at")
+
+    def __init__(self, version: int, domains: FrozenSet[str], matcher, mtime_ns: Optional[int]):
+        self.version = version
+        self.domains = domains
+        self.matcher = matcher
+        self.mtime_ns = mtime_ns
+        self.loaded_at = time.time()
+
+    def search(self, domain: str) -> bool:
+        return self.matcher.search(domain)
+
+    def match_many(self, domains) -> List[bool]:
+        return self.matcher.match_many(domains)
+
+
+def read_blocklist_entries(path: str) -> List[str]:
+    """
+    The CSV's domains as written, in file order.
+
+    The file has no header row and may start with a BOM (it is edited in
+    Excel). A `url` header left by older versions is skipped, as are blanks.
+    """
+    entries = []
+    with open(path, "r", encoding="utf-8-sig", newline="") as file:
+        for row in csv.reader(file):
+            if not row or not row[0].strip():
+                continue
+            value = row[0].strip()
+            if value.lower() == "url":
+                continue
+            entries.append(value)
+    return entries
+
+
+def write_blocklist_entries(path: str, entries: List[str]):
+    """Rewrite the CSV with `entries`, one per line, keeping the BOM and no header."""
+    with open(path, "w", encoding="utf-8-sig", newline="") as file:
+        csv.writer(file, lineterminator="\n").writerows([entry] for entry in entries)
+
+
+def remove_blocklist_entry(path: str, url: str) -> bool:
+    """Drop every line equal to `url` from the CSV. Returns whether any was removed."""
+    entries = read_blocklist_entries(path)
+    remaining = [entry for entry in entries if entry != url.strip()]
+    if len(remaining) == len(entries):
+        return False
+    write_blocklist_entries(path, remaining)
+    return True
+
+
+def read_blocklist_csv(path: str) -> FrozenSet[str]:
+    """Parse the CSV into a set of root domains."""
+    return frozenset(extract_root_domain(entry.lower()) for entry in read_blocklist_entries(path))
+
+
+class RestrictedDomainBlocklist:
+    """
+    Holds the current BlocklistSnapshot and rebuilds it only when the CSV
+    changes. Readers grab `self.snapshot` once and use it lock-free; a reload
+    builds the new snapshot off to the side and swaps the reference.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.snapshot = BlocklistSnapshot(0, frozenset(), DomainSuffixMatcher(), None)
+        self._lock = threading.Lock()
+
+    def _mtime_ns(self) -> Optional[int]:
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def reload(self) -> BlocklistSnapshot:
+        """Rebuild the matcher from the CSV and swap it in."""
+        with self._lock:
+            mtime_ns = self._mtime_ns()
+            try:
+                domains = read_blocklist_csv(self.path)
+            except FileNotFoundError:
+                print(f"❌ CSV file '{self.path}' not found!")
+                return self.snapshot
+
+            if domains == self.snapshot.domains:
+                # Content unchanged (e.g. touched file); keep the version
+                self.snapshot.mtime_ns = mtime_ns
+                return self.snapshot
+
+            matcher = DomainSuffixMatcher(domains)
+
+            self.snapshot = BlocklistSnapshot(self.snapshot.version + 1, domains, matcher, mtime_ns)
+            print(f"✅ Restricted domains reloaded (version {self.snapshot.version}, {len(domains)} domains)")
+            return self.snapshot
+
+    def reload_if_changed(self) -> BlocklistSnapshot:
+        if self._mtime_ns() != self.snapshot.mtime_ns:
+            return self.reload()
+        return self.snapshot
+
+    def search(self, domain: str) -> bool:
+        return self.snapshot.search(domain)
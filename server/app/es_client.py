@@ -0,0 +1,48 @@
+from elasticsearch import AsyncElasticsearch
+from typing import Optional
+import os
+import time
+
+from metrics import es_call_site, es_request_errors, es_request_seconds
+
+# Connection pool and retry tuning for the shared async client
+ES_CONNECTIONS_PER_NODE = int(os.getenv("ES_CONNECTIONS_PER_NODE", "25"))
+ES_MAX_RETRIES = int(os.getenv("ES_MAX_RETRIES", "3"))
+
+# Per-call timeouts (seconds): plain searches vs. heavy dashboard aggregations
+ES_REQUEST_TIMEOUT = float(os.getenv("ES_REQUEST_TIMEOUT", "10"))
+ES_AGGREGATION_TIMEOUT = float(os.getenv("ES_AGGREGATION_TIMEOUT", "30"))
+
+# "fake" swaps the cluster for the in-memory, self-feeding stand-in in fake_es.py (load tests only)
+ES_BACKEND = os.getenv("ES_BACKEND", "elasticsearch")
+
+
+def create_es_client(url: str, username: str, password: str) -> AsyncElasticsearch:
+    """Build the one AsyncElasticsearch client shared by every handler and background task."""
+    if ES_BACKEND == "fake":
+        from fake_es import FakeElasticsearch
+
+        return FakeElasticsearch.from_env()
+    return AsyncElasticsearch(
+        [url],
+        basic_auth=(username, password),  # Authentication
+        verify_certs=False,  # Set to True for security (if using a valid SSL cert)
+        connections_per_node=ES_CONNECTIONS_PER_NODE,
+        request_timeout=ES_REQUEST_TIMEOUT,
+        max_retries=ES_MAX_RETRIES,
+        retry_on_timeout=True,
+    )
+
+
+async def search(es: AsyncElasticsearch, index: Optional[str], body: dict, timeout: Optional[float] = None):
+    """Run a search without blocking the event loop, optionally overriding the request timeout."""
+    client = es.options(request_timeout=timeout) if timeout is not None else es
+    site = (es_call_site.get(),)
+    started = time.perf_counter()
+    try:
+        return await client.search(index=index, body=body)
+    except Exception:
+        es_request_errors.inc(site)
+        raise
+    finally:
+        es_request_seconds.observe(time.perf_counter() - started, site)
@@ -0,0 +1,946 @@
+"""
+In-memory stand-in for AsyncElasticsearch, for load tests without an ELK stack.
+
+Implements the part of the search API this app uses:
+
+  queries       match_all, match (exact, as on keyword fields), term, terms,
+                range (epoch millis, ISO dates, now-1h style date math),
+                exists, ids, prefix, bool (must/filter/should/must_not,
+                minimum_should_match)
+  search        size/from, sort (field asc/desc, _id, _shard_doc),
+                search_after, post_filter, _source includes, track_total_hits,
+                point-in-time (open/close, pit in the body), runtime
+                fields for the working-hours local-hour script
+  aggregations  terms (order by count, key or a sub-aggregation), sum, min,
+                max, avg, value_count, cardinality, date_histogram
+                (fixed_interval, format, min_doc_count), composite (terms and
+                date_histogram sources, after)
+
+Documents live in one list per index sorted by @timestamp, so the
+range + sort on @timestamp that the tailers issue is a bisect and a short
+scan. Queries are evaluated in a worker thread: the event loop only takes
+a snapshot of the matching time window, the way it would only wait on a
+socket with a real cluster. The fake shares this process's GIL though, so
+keep FAKE_ES_MAX_DOCS in proportion to the query load.
+
+Select it with ES_BACKEND=fake (see es_client.create_es_client); FAKE_ES_RATE
+documents per second from a PacketbeatGenerator are then fed into
+FAKE_ES_INDEX for as long as the client is open.
+"""
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from datetime import datetime, timezone
+from fnmatch import fnmatchcase
+from heapq import merge
+from itertools import count, product
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+import asyncio
+import os
+import re
+import time
+import uuid
+
+from elastic_transport import ApiResponseMeta, HttpHeaders, NodeConfig
+from elasticsearch import BadRequestError, NotFoundError
+
+from packetbeat_generator import GENERATOR_CLIENTS, PacketbeatGenerator, feed
+from working_hours import get_timezone
+
+# Oldest documents are dropped beyond this many per index
+FAKE_ES_MAX_DOCS = int(os.getenv("FAKE_ES_MAX_DOCS", "300000"))
+# Synthetic feed used by ES_BACKEND=fake: documents/s, clients, and history indexed up front
+FAKE_ES_INDEX = os.getenv("FAKE_ES_INDEX", "proxy-logs")
+FAKE_ES_RATE = float(os.getenv("FAKE_ES_RATE", "1000"))
+FAKE_ES_CLIENTS = int(os.getenv("FAKE_ES_CLIENTS", str(GENERATOR_CLIENTS)))
+FAKE_ES_BACKFILL_DOCS = int(os.getenv("FAKE_ES_BACKFILL_DOCS", "50000"))
+FAKE_ES_BACKFILL_SECONDS = int(os.getenv("FAKE_ES_BACKFILL_SECONDS", "3600"))
+FAKE_ES_SEED = int(os.getenv("FAKE_ES_SEED", "7"))
+
+TIMESTAMP_FIELD = "@timestamp"
+# Fields compared as dates (epoch millis) in range queries and aggregations
+DATE_FIELDS = frozenset({TIMESTAMP_FIELD})
+# Hits counted exactly before hits.total turns into a lower bound, as in ES
+TOTAL_HITS_LIMIT = 10000
+DEFAULT_KEEP_ALIVE = "5m"
+
+_UNIT_MS = {
+    "ms": 1, "s": 1000, "m": 60_000, "h": 3_600_000, "H": 3_600_000,
+    "d": 86_400_000, "w": 604_800_000, "M": 2_592_000_000, "y": 31_536_000_000,
+}
+_CALENDAR_UNITS = {"second": "1s", "minute": "1m", "hour": "1h", "day": "1d", "week": "1w"}
+_DURATION = re.compile(r"^(\d+)(ms|[smhHdwMy])$")
+_DATE_MATH = re.compile(r"^now((?:[+-]\d+(?:ms|[smhHdwMy]))*)(?:/(ms|[smhHdwMy]))?$")
+_DATE_MATH_STEP = re.compile(r"([+-])(\d+)(ms|[smhHdwMy])")
+# Java DateTimeFormatter letters used in aggregation formats -> strftime
+_JAVA_FORMAT = re.compile(r"yyyy|yy|MMMM|MMM|MM|M|dd|d|HH|H|mm|ss|SSS|'[^']*'")
+_STRFTIME = {"yyyy": "%Y", "yy": "%y", "MMMM": "%B", "MMM": "%b", "MM": "%m", "dd": "%d", "HH": "%H",
+             "mm": "%M", "ss": "%S"}
+
+
+def _error(cls, status: int, kind: str, reason: str):
+    meta = ApiResponseMeta(status=status, http_version="1.1", headers=HttpHeaders(), duration=0.0,
+                           node=NodeConfig("http", "localhost", 9200))
+    return cls(message=kind, meta=meta, body={"error": {"type": kind, "reason": reason}, "status": status})
+
+
+def _bad_request(reason: str):
+    return _error(BadRequestError, 400, "parsing_exception", reason)
+
+
+def duration_ms(value) -> int:
+    if isinstance(value, (int, float)):
+        return int(value)
+    value = _CALENDAR_UNITS.get(value, value)
+    match = _DURATION.match(value)
+    if not match:
+        raise _bad_request(f"Unsupported interval [{value}]")
+    return int(match.group(1)) * _UNIT_MS[match.group(2)]
+
+
+def parse_date(value, now_ms: int, fmt: Optional[str] = None) -> int:
+    """Epoch millis of a range bound: a number, "now-1h/h" style date math, or an ISO date."""
+    if isinstance(value, (int, float)):
+        return int(value)
+    if fmt == "epoch_millis" or value.lstrip("-").isdigit():
+        return int(value)
+    match = _DATE_MATH.match(value)
+    if match:
+        result = now_ms
+        for sign, amount, unit in _DATE_MATH_STEP.findall(match.group(1)):
+            result += (1 if sign == "+" else -1) * int(amount) * _UNIT_MS[unit]
+        if match.group(2):
+            result -= result % _UNIT_MS[match.group(2)]
+        return result
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        raise _bad_request(f"Failed to parse date [{value}]")
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return int(parsed.timestamp() * 1000)
+
+
+def format_date(epoch_ms: int, fmt: Optional[str] = None) -> str:
+    """A date as ES renders key_as_string / value_as_string for `fmt` (default ISO-8601)."""
+    moment = datetime.fromtimestamp(epoch_ms / 1000, tz=timezone.utc)
+    if not fmt or fmt in ("strict_date_optional_time", "date_optional_time"):
+        return moment.strftime("%Y-%m-%dT%H:%M:%S.") + f"{epoch_ms % 1000:03d}Z"
+    if fmt == "epoch_millis":
+        return str(epoch_ms)
+
+    def token(match) -> str:
+        text = match.group(0)
+        if text.startswith("'"):
+            return text[1:-1]
+        if text == "M":
+            return str(moment.month)
+        if text == "d":
+            return str(moment.day)
+        if text == "H":
+            return str(moment.hour)
+        if text == "SSS":
+            return f"{epoch_ms % 1000:03d}"
+        return moment.strftime(_STRFTIME[text])
+
+    return _JAVA_FORMAT.sub(token, fmt)
+
+
+class _Doc:
+    __slots__ = ("ts", "seq", "id", "index", "source")
+
+    def __init__(self, ts: int, seq: int, doc_id: str, index: str, source: dict):
+        self.ts = ts
+        self.seq = seq
+        self.id = doc_id
+        self.index = index
+        self.source = source
+
+
+def _ts_of(doc: _Doc) -> int:
+    return doc.ts
+
+
+class _Index:
+    """One index: documents sorted by (@timestamp, insertion order)."""
+
+    def __init__(self, name: str, max_docs: int):
+        self.name = name
+        self.max_docs = max_docs
+        self.docs: List[_Doc] = []
+
+    def add(self, doc: _Doc):
+        docs = self.docs
+        if not docs or doc.ts >= docs[-1].ts:
+            docs.append(doc)
+        else:
+            docs.insert(bisect_right(docs, doc.ts, key=_ts_of), doc)
+
+    def trim(self):
+        # In slices, so steady ingest doesn't shift the whole list on every document
+        excess = len(self.docs) - self.max_docs
+        if excess > self.max_docs // 10:
+            del self.docs[:excess]
+
+    def window(self, lo: Optional[int], hi: Optional[int]) -> List[_Doc]:
+        docs = self.docs
+        start = 0 if lo is None else bisect_left(docs, lo, key=_ts_of)
+        end = len(docs) if hi is None else bisect_right(docs, hi, key=_ts_of)
+        return docs[start:end]
+
+
+class _Context:
+    """Per-search state: the `now` for date math and compiled runtime fields."""
+
+    def __init__(self, now_ms: int, runtime_mappings: Optional[dict] = None):
+        self.now_ms = now_ms
+        self.runtime = {name: _compile_runtime(name, spec) for name, spec in (runtime_mappings or {}).items()}
+
+    def values(self, doc: _Doc, field: str) -> list:
+        runtime = self.runtime.get(field)
+        if runtime is not None:
+            return runtime(doc)
+        if field.endswith(".keyword"):
+            field = field[:-8]
+        if field == TIMESTAMP_FIELD:
+            return [doc.ts]
+        if field == "_id":
+            return [doc.id]
+        if field == "_index":
+            return [doc.index]
+        node = doc.source
+        if field in node:
+            node = node[field]
+        else:
+            for part in field.split("."):
+                if not isinstance(node, dict):
+                    return []
+                node = node.get(part)
+        if node is None:
+            return []
+        if isinstance(node, list):
+            return [value for value in node if value is not None]
+        return [node]
+
+    def coerce(self, field: str, value, fmt: Optional[str] = None):
+        if field.endswith(".keyword"):
+            field = field[:-8]
+        if field in DATE_FIELDS:
+            return parse_date(value, self.now_ms, fmt)
+        return value
+
+
+def _compile_runtime(name: str, spec: dict) -> Callable[[_Doc], list]:
+    script = spec.get("script") or {}
+    source = script.get("source", "") if isinstance(script, dict) else script
+    params = script.get("params", {}) if isinstance(script, dict) else {}
+    if "tz" not in params or "getHour()" not in source:
+        raise _bad_request(f"Runtime field [{name}]: only the local-hour script is supported by the fake")
+
+    tz = get_timezone(params["tz"])
+    offsets: Dict[int, int] = {}  # UTC hour -> offset in ms; DST changes on hour boundaries
+
+    def local_hour(doc: _Doc) -> list:
+        hour = doc.ts // 3_600_000
+        offset = offsets.get(hour)
+        if offset is None:
+            moment = datetime.fromtimestamp(hour * 3600, tz)
+            offset = offsets[hour] = int(moment.utcoffset().total_seconds() * 1000)
+        return [(doc.ts + offset) // 3_600_000 % 24]
+
+    return local_hour
+
+
+def _single(clause: dict, kind: str) -> Tuple[str, object]:
+    items = [(key, value) for key, value in clause.items() if key not in ("boost", "_name")]
+    if len(items) != 1:
+        raise _bad_request(f"[{kind}] query expects exactly one field")
+    return items[0]
+
+
+def _clauses(value) -> list:
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [value]
+
+
+def compile_query(query: dict, ctx: _Context) -> Callable[[_Doc], bool]:
+    """A predicate over documents for one query clause."""
+    if len(query) != 1:
+        raise _bad_request("A query clause must have exactly one key")
+    kind, conf = next(iter(query.items()))
+    values = ctx.values
+
+    if kind == "match_all":
+        return lambda doc: True
+    if kind == "match_none":
+        return lambda doc: False
+
+    if kind in ("term", "match"):
+        field, expected = _single(conf, kind)
+        if isinstance(expected, dict):
+            expected = expected.get("value", expected.get("query"))
+        return lambda doc: expected in values(doc, field)
+
+    if kind == "terms":
+        field, accepted = _single(conf, kind)
+        accepted = set(accepted)
+        return lambda doc: any(value in accepted for value in values(doc, field))
+
+    if kind == "prefix":
+        field, prefix = _single(conf, kind)
+        if isinstance(prefix, dict):
+            prefix = prefix["value"]
+        return lambda doc: any(isinstance(value, str) and value.startswith(prefix) for value in values(doc, field))
+
+    if kind == "ids":
+        accepted = set(conf.get("values", []))
+        return lambda doc: doc.id in accepted
+
+    if kind == "exists":
+        field = conf["field"]
+        return lambda doc: bool(values(doc, field))
+
+    if kind == "range":
+        field, bounds = _single(conf, kind)
+        fmt = bounds.get("format")
+        checks = []
+        for op, test in (("gte", lambda v, b: v >= b), ("gt", lambda v, b: v > b),
+                         ("lte", lambda v, b: v <= b), ("lt", lambda v, b: v < b)):
+            if bounds.get(op) is not None:
+                checks.append((test, ctx.coerce(field, bounds[op], fmt)))
+
+        def in_range(doc: _Doc) -> bool:
+            for value in values(doc, field):
+                try:
+                    if all(test(value, bound) for test, bound in checks):
+                        return True
+                except TypeError:
+                    continue
+            return False
+
+        return in_range
+
+    if kind == "bool":
+        required = [compile_query(q, ctx) for key in ("must", "filter") for q in _clauses(conf.get(key))]
+        excluded = [compile_query(q, ctx) for q in _clauses(conf.get("must_not"))]
+        should = [compile_query(q, ctx) for q in _clauses(conf.get("should"))]
+        minimum = conf.get("minimum_should_match")
+        minimum = int(minimum) if minimum is not None else (0 if required else 1)
+        minimum = min(minimum, len(should))
+
+        def matches(doc: _Doc) -> bool:
+            if not all(test(doc) for test in required):
+                return False
+            if any(test(doc) for test in excluded):
+                return False
+            if minimum:
+                hits = 0
+                for test in should:
+                    if test(doc):
+                        hits += 1
+                        if hits >= minimum:
+                            return True
+                return False
+            return True
+
+        return matches
+
+    raise _bad_request(f"Unknown query [{kind}]")
+
+
+def time_bounds(query: Optional[dict], ctx: _Context) -> Tuple[Optional[int], Optional[int]]:
+    """Inclusive @timestamp bounds every match must fall in, from required range clauses."""
+    lo = hi = None
+    if not query:
+        return lo, hi
+    kind, conf = next(iter(query.items()))
+    if kind == "range" and TIMESTAMP_FIELD in conf:
+        bounds = conf[TIMESTAMP_FIELD]
+        fmt = bounds.get("format")
+        if bounds.get("gte") is not None:
+            lo = parse_date(bounds["gte"], ctx.now_ms, fmt)
+        if bounds.get("gt") is not None:
+            lo = parse_date(bounds["gt"], ctx.now_ms, fmt) + 1
+        if bounds.get("lte") is not None:
+            hi = parse_date(bounds["lte"], ctx.now_ms, fmt)
+        if bounds.get("lt") is not None:
+            hi = parse_date(bounds["lt"], ctx.now_ms, fmt) - 1
+    elif kind == "bool":
+        for clause in _clauses(conf.get("must")) + _clauses(conf.get("filter")):
+            clause_lo, clause_hi = time_bounds(clause, ctx)
+            if clause_lo is not None:
+                lo = clause_lo if lo is None else max(lo, clause_lo)
+            if clause_hi is not None:
+                hi = clause_hi if hi is None else min(hi, clause_hi)
+    return lo, hi
+
+
+def _parse_sort(sort) -> List[Tuple[str, bool]]:
+    """[(field, descending)] from the sort forms ES accepts."""
+    specs = []
+    for item in _clauses(sort):
+        if isinstance(item, str):
+            specs.append((item, False))
+            continue
+        field, conf = next(iter(item.items()))
+        order = conf.get("order", "asc") if isinstance(conf, dict) else conf
+        specs.append((field, order == "desc"))
+    return specs
+
+
+def _sort_value(doc: _Doc, field: str, descending: bool, ctx: _Context):
+    if field == "_shard_doc":
+        return doc.seq
+    values = ctx.values(doc, field)
+    if not values:
+        return None
+    return max(values) if descending else min(values)
+
+
+def _ordered(items: list, keys: List[Tuple[Callable, bool]]) -> list:
+    """Stable multi-key sort; None (missing) sorts last in either direction."""
+    for key, descending in reversed(keys):
+        def sort_key(item, key=key):
+            value = key(item)
+            return (value is not None, value) if value is not None else (False, 0)
+
+        items.sort(key=sort_key, reverse=descending)
+        if not descending:
+            # Missing values first after an ascending sort; move them to the end
+            present = [item for item in items if key(item) is not None]
+            items[:] = present + [item for item in items if key(item) is None]
+    return items
+
+
+def _is_after(values: list, after: list, specs: List[Tuple[str, bool]]) -> bool:
+    for value, bound, (_, descending) in zip(values, after, specs):
+        if value == bound:
+            continue
+        if value is None:
+            return True
+        if bound is None:
+            return False
+        return value < bound if descending else value > bound
+    return False
+
+
+def _filter_source(source: dict, includes: List[str]) -> dict:
+    result: dict = {}
+    for path in includes:
+        if path in source:
+            result[path] = source[path]
+            continue
+        node, parents = source, path.split(".")
+        for part in parents:
+            if not isinstance(node, dict) or part not in node:
+                break
+            node = node[part]
+        else:
+            target = result
+            for part in parents[:-1]:
+                target = target.setdefault(part, {})
+            target[parents[-1]] = node
+    return result
+
+
+# --- aggregations -----------------------------------------------------------------------------------------------
+
+
+def _metric_values(conf: dict, docs: List[_Doc], ctx: _Context) -> list:
+    field = conf["field"]
+    missing = conf.get("missing")
+    result = []
+    for doc in docs:
+        values = ctx.values(doc, field)
+        if values:
+            result.extend(values)
+        elif missing is not None:
+            result.append(missing)
+    return result
+
+
+def _numeric(values: list) -> list:
+    return [float(value) for value in values if isinstance(value, (int, float)) and not isinstance(value, bool)]
+
+
+def _agg_sum(conf, docs, sub, ctx):
+    return {"value": float(sum(_numeric(_metric_values(conf, docs, ctx))))}
+
+
+def _agg_value_count(conf, docs, sub, ctx):
+    return {"value": len(_metric_values(conf, docs, ctx))}
+
+
+def _agg_avg(conf, docs, sub, ctx):
+    values = _numeric(_metric_values(conf, docs, ctx))
+    return {"value": sum(values) / len(values) if values else None}
+
+
+def _extreme(pick):
+    def aggregate(conf, docs, sub, ctx):
+        values = _numeric(_metric_values(conf, docs, ctx))
+        if not values:
+            return {"value": None}
+        value = pick(values)
+        field = conf["field"].removesuffix(".keyword")
+        if field in DATE_FIELDS:
+            return {"value": value, "value_as_string": format_date(int(value), conf.get("format"))}
+        return {"value": value}
+    return aggregate
+
+
+def _agg_cardinality(conf, docs, sub, ctx):
+    return {"value": len(set(_metric_values(conf, docs, ctx)))}
+
+
+def _bucket(key, docs: List[_Doc], sub: Optional[dict], ctx: _Context, **extra) -> dict:
+    bucket = {"key": key, **extra, "doc_count": len(docs)}
+    if sub:
+        bucket.update(aggregate(sub, docs, ctx))
+    return bucket
+
+
+def _agg_terms(conf, docs, sub, ctx):
+    field = conf["field"]
+    size = conf.get("size", 10)
+    missing = conf.get("missing")
+    min_doc_count = conf.get("min_doc_count", 1)
+    groups: Dict[object, List[_Doc]] = defaultdict(list)
+    for doc in docs:
+        values = ctx.values(doc, field)
+        if not values and missing is not None:
+            values = [missing]
+        for value in set(values):
+            groups[value].append(doc)
+
+    order = _clauses(conf.get("order", [{"_count": "desc"}, {"_key": "asc"}]))
+    by_sub_agg = any(path not in ("_count", "_key") for item in order for path in item)
+    # Sub-aggregations of buckets that can't make the cut are skipped unless the order needs them
+    buckets = [{"key": key, "doc_count": len(members), "_docs": members}
+               for key, members in groups.items() if len(members) >= min_doc_count]
+    if by_sub_agg:
+        for bucket in buckets:
+            bucket.update(aggregate(sub, bucket["_docs"], ctx))
+
+    keys = []
+    for item in order:
+        path, direction = next(iter(item.items()))
+        if path == "_count":
+            keys.append((lambda b: b["doc_count"], direction == "desc"))
+        elif path == "_key":
+            keys.append((lambda b: b["key"], direction == "desc"))
+        else:
+            name, _, metric = path.partition(".")
+            keys.append((lambda b, n=name, m=metric or "value": b[n][m], direction == "desc"))
+    buckets = _ordered(buckets, keys)
+
+    top, rest = buckets[:size], buckets[size:]
+    for bucket in top:
+        members = bucket.pop("_docs")
+        if sub and not by_sub_agg:
+            bucket.update(aggregate(sub, members, ctx))
+    return {
+        "doc_count_error_upper_bound": 0,
+        "sum_other_doc_count": sum(bucket["doc_count"] for bucket in rest),
+        "buckets": top,
+    }
+
+
+def _histogram_interval(conf: dict) -> int:
+    for key in ("fixed_interval", "calendar_interval", "interval"):
+        if key in conf:
+            return duration_ms(conf[key])
+    raise _bad_request("[date_histogram] requires an interval")
+
+
+def _agg_date_histogram(conf, docs, sub, ctx):
+    field = conf["field"]
+    interval = _histogram_interval(conf)
+    fmt = conf.get("format")
+    groups: Dict[int, List[_Doc]] = defaultdict(list)
+    for doc in docs:
+        for value in set(value - value % interval for value in ctx.values(doc, field)):
+            groups[value].append(doc)
+
+    keys = sorted(groups)
+    if conf.get("min_doc_count", 0) == 0:
+        bounds = conf.get("extended_bounds") or {}
+        first = [parse_date(bounds["min"], ctx.now_ms)] if "min" in bounds else []
+        last = [parse_date(bounds["max"], ctx.now_ms)] if "max" in bounds else []
+        edges = keys[:1] + keys[-1:] + first + last
+        if edges:
+            lo, hi = min(edges), max(edges)
+            keys = list(range(lo - lo % interval, hi + 1, interval))
+    else:
+        keys = [key for key in keys if len(groups[key]) >= conf["min_doc_count"]]
+
+    buckets = [_bucket(key, groups.get(key, []), sub, ctx, key_as_string=format_date(key, fmt)) for key in keys]
+    if conf.get("order", {}).get("_key") == "desc":
+        buckets.reverse()
+    return {"buckets": buckets}
+
+
+def _composite_source(spec: dict, ctx: _Context):
+    name, source = next(iter(spec.items()))
+    kind, conf = next(iter(source.items()))
+    field = conf["field"]
+    missing_bucket = conf.get("missing_bucket", False)
+    descending = conf.get("order", "asc") == "desc"
+    if kind == "terms":
+        def values(doc):
+            return ctx.values(doc, field) or ([None] if missing_bucket else [])
+    elif kind == "date_histogram":
+        interval = _histogram_interval(conf)
+
+        def values(doc):
+            found = [value - value % interval for value in ctx.values(doc, field)]
+            return found or ([None] if missing_bucket else [])
+    else:
+        raise _bad_request(f"Unsupported composite source [{kind}]")
+    return name, values, descending
+
+
+def _agg_composite(conf, docs, sub, ctx):
+    sources = [_composite_source(spec, ctx) for spec in conf["sources"]]
+    specs = [(name, descending) for name, _, descending in sources]
+    groups: Dict[tuple, List[_Doc]] = defaultdict(list)
+    for doc in docs:
+        for key in set(product(*(values(doc) for _, values, _ in sources))):
+            groups[key].append(doc)
+
+    keys = _ordered(list(groups), [(lambda key, i=i: key[i], descending) for i, (_, descending) in enumerate(specs)])
+    after = conf.get("after")
+    if after:
+        bound = [after.get(name) for name, _ in specs]
+        keys = [key for key in keys if _is_after(list(key), bound, specs)]
+    keys = keys[:conf.get("size", 10)]
+
+    buckets = [_bucket({name: value for (name, _), value in zip(specs, key)}, groups[key], sub, ctx) for key in keys]
+    result = {"buckets": buckets}
+    if buckets:
+        result["after_key"] = dict(buckets[-1]["key"])
+    return result
+
+
+_AGGREGATIONS = {
+    "terms": _agg_terms,
+    "date_histogram": _agg_date_histogram,
+    "composite": _agg_composite,
+    "sum": _agg_sum,
+    "min": _extreme(min),
+    "max": _extreme(max),
+    "avg": _agg_avg,
+    "value_count": _agg_value_count,
+    "cardinality": _agg_cardinality,
+}
+
+
+def aggregate(aggs: dict, docs: List[_Doc], ctx: _Context) -> dict:
+    results = {}
+    for name, spec in aggs.items():
+        sub = spec.get("aggs") or spec.get("aggregations")
+        kinds = [kind for kind in spec if kind in _AGGREGATIONS]
+        if len(kinds) != 1:
+            raise _bad_request(f"Aggregation [{name}]: unsupported or missing type")
+        results[name] = _AGGREGATIONS[kinds[0]](spec[kinds[0]], docs, sub, ctx)
+    return results
+
+
+# --- search -------------------------------------------------------------------------------------------------------
+
+
+def _timestamp_extremes(aggs: dict) -> bool:
+    """Whether every aggregation is a plain min/max of @timestamp (the tailers' "newest")."""
+    return all(
+        len(spec) == 1 and next(iter(spec)) in ("min", "max")
+        and next(iter(spec.values())).get("field") == TIMESTAMP_FIELD
+        for spec in aggs.values()
+    )
+
+
+def _first_match(docs, test) -> list:
+    for doc in docs:
+        if test(doc):
+            return [doc]
+    return []
+
+
+def execute_search(docs: List[_Doc], body: dict, ctx: _Context, max_seq: Optional[int] = None) -> dict:
+    """Run a search body over `docs` (sorted by @timestamp, then insertion order)."""
+    started = time.perf_counter()
+    if max_seq is not None:
+        docs = [doc for doc in docs if doc.seq < max_seq]
+    test = compile_query(body.get("query") or {"match_all": {}}, ctx)
+    # Narrows the hits only; aggregations still see every query match
+    post = compile_query(body["post_filter"], ctx) if body.get("post_filter") else None
+    size = body.get("size", 10)
+    offset = body.get("from", 0)
+    specs = _parse_sort(body.get("sort"))
+    after = body.get("search_after")
+    aggs = body.get("aggs") or body.get("aggregations")
+    track = body.get("track_total_hits", TOTAL_HITS_LIMIT)
+    limit = None if track is True else (0 if track is False else int(track))
+
+    natural = (bool(specs) and specs[0][0] == TIMESTAMP_FIELD
+               and all(field == "_shard_doc" and desc == specs[0][1] for field, desc in specs[1:]))
+    matched = None
+    extremes = natural and aggs and _timestamp_extremes(aggs)
+    if (aggs and not extremes) or not natural:
+        matched = [doc for doc in docs if test(doc)]
+
+    if natural:
+        # Already in (@timestamp, insertion) order: walk from the search_after position, stop once filled
+        descending = specs[0][1]
+        ordered = matched if matched is not None else docs
+        if after is not None:
+            tiebreak = len(after) > 1
+            if descending:
+                position = (bisect_right if tiebreak else bisect_left)(ordered, after[0], key=_ts_of)
+                # Among docs at exactly after[0], _shard_doc (insertion order) decides
+                while tiebreak and position and ordered[position - 1].ts == after[0] \
+                        and ordered[position - 1].seq >= after[1]:
+                    position -= 1
+                candidates = reversed(ordered[:position])
+            else:
+                position = (bisect_left if tiebreak else bisect_right)(ordered, after[0], key=_ts_of)
+                while tiebreak and position < len(ordered) and ordered[position].ts == after[0] \
+                        and ordered[position].seq <= after[1]:
+                    position += 1
+                candidates = iter(ordered[position:])
+        else:
+            candidates = reversed(ordered) if descending else iter(ordered)
+        page: List[_Doc] = []
+        total = 0
+        wanted = offset + size
+        for doc in candidates:
+            if matched is None and not test(doc):
+                continue
+            if post is not None and not post(doc):
+                continue
+            total += 1
+            if len(page) < wanted:
+                page.append(doc)
+            elif limit is not None and total > limit:
+                break
+        if matched is not None:
+            total = len(matched) if post is None else sum(1 for doc in matched if post(doc))
+        page = page[offset:]
+    else:
+        ordered = matched if post is None else [doc for doc in matched if post(doc)]
+        ordered = _ordered(ordered, [(lambda doc, f=field, d=desc: _sort_value(doc, f, d, ctx), desc)
+                                     for field, desc in specs])
+        if after is not None:
+            ordered = [doc for doc in ordered
+                       if _is_after([_sort_value(doc, f, d, ctx) for f, d in specs], after, specs)]
+        total = len(ordered)
+        page = ordered[offset:offset + size]
+
+    source = body.get("_source", True)
+    if isinstance(source, dict):
+        source = source.get("includes", True)
+    if isinstance(source, str):
+        source = [source]
+    hits = []
+    for doc in page:
+        hit = {"_index": doc.index, "_id": doc.id, "_score": None if specs else 1.0}
+        if source is True:
+            hit["_source"] = doc.source
+        elif source:
+            hit["_source"] = _filter_source(doc.source, source)
+        if specs:
+            hit["sort"] = [_sort_value(doc, field, desc, ctx) for field, desc in specs]
+        hits.append(hit)
+
+    response = {
+        "took": int((time.perf_counter() - started) * 1000),
+        "timed_out": False,
+        "_shards": {"total": 1, "successful": 1, "skipped": 0, "failed": 0},
+        "hits": {"max_score": None if specs else 1.0, "hits": hits},
+    }
+    if limit != 0:
+        relation = "gte" if limit is not None and total > limit else "eq"
+        response["hits"]["total"] = {"value": min(total, limit) if limit is not None else total, "relation": relation}
+    if extremes:
+        # Documents are in @timestamp order: the first match from either end is enough
+        response["aggregations"] = {
+            name: aggregate({name: spec}, _first_match(reversed(docs) if "max" in spec else docs, test), ctx)[name]
+            for name, spec in aggs.items()
+        }
+    elif aggs:
+        response["aggregations"] = aggregate(aggs, matched, ctx)
+    return response
+
+
+class _FakeIndices:
+    """The es.indices namespace: enough for scratch indexes (replay, tests)."""
+
+    def __init__(self, es: "FakeElasticsearch"):
+        self._es = es
+
+    async def create(self, index: str, **kwargs):
+        self._es._get_or_create(index)
+        return {"acknowledged": True, "index": index}
+
+    async def exists(self, index: str, **kwargs) -> bool:
+        return index in self._es.indices_by_name
+
+    async def delete(self, index: str, **kwargs):
+        for name in self._es._resolve(index):
+            del self._es.indices_by_name[name]
+        return {"acknowledged": True}
+
+    async def refresh(self, index: Optional[str] = None, **kwargs):
+        return {"_shards": {"total": 1, "successful": 1, "failed": 0}}
+
+
+class FakeElasticsearch:
+    """
+    Drop-in for the AsyncElasticsearch calls this app makes, backed by lists in memory.
+
+    `feed` is an optional coroutine function taking this client; it is started
+    on the first request (there is no running loop at construction time) and
+    cancelled by close().
+    """
+
+    def __init__(self, max_docs: int = FAKE_ES_MAX_DOCS, feed: Optional[Callable] = None):
+        self.max_docs = max_docs
+        self.indices_by_name: Dict[str, _Index] = {}
+        self.indices = _FakeIndices(self)
+        self._seq = count()
+        # pit id -> (index names, first seq it can't see, keep-alive ms, expires at ms)
+        self._pits: Dict[str, Tuple[List[str], int, int, int]] = {}
+        self._feed = feed
+        self._feed_task: Optional[asyncio.Task] = None
+        self.documents_indexed = 0
+        self.searches = 0
+        self.search_seconds = 0.0
+
+    @classmethod
+    def from_env(cls) -> "FakeElasticsearch":
+        """The ES_BACKEND=fake client: FAKE_ES_BACKFILL_DOCS of history, then FAKE_ES_RATE docs/s."""
+        generator = PacketbeatGenerator(clients=FAKE_ES_CLIENTS, seed=FAKE_ES_SEED)
+        es = cls(feed=(lambda client: feed(client, generator, FAKE_ES_INDEX, FAKE_ES_RATE)) if FAKE_ES_RATE > 0 else None)
+        now_ms = time.time() * 1000
+        es.add_documents(FAKE_ES_INDEX, generator.documents(FAKE_ES_BACKFILL_DOCS,
+                                                            now_ms - FAKE_ES_BACKFILL_SECONDS * 1000, now_ms))
+        return es
+
+    def options(self, **kwargs) -> "FakeElasticsearch":
+        # Timeouts and retries have nothing to act on in memory
+        return self
+
+    def _start_feed(self):
+        if self._feed is not None and self._feed_task is None:
+            self._feed_task = asyncio.get_running_loop().create_task(self._feed(self))
+
+    def _get_or_create(self, name: str) -> _Index:
+        index = self.indices_by_name.get(name)
+        if index is None:
+            index = self.indices_by_name[name] = _Index(name, self.max_docs)
+        return index
+
+    def _resolve(self, index) -> List[str]:
+        names = []
+        patterns = index.split(",") if isinstance(index, str) else list(index or ["*"])
+        for pattern in patterns:
+            pattern = pattern.strip()
+            if pattern in ("_all", "*"):
+                names.extend(self.indices_by_name)
+            elif "*" in pattern or "?" in pattern:
+                names.extend(name for name in self.indices_by_name if fnmatchcase(name, pattern))
+            elif pattern in self.indices_by_name:
+                names.append(pattern)
+            else:
+                raise _error(NotFoundError, 404, "index_not_found_exception", f"no such index [{pattern}]")
+        return list(dict.fromkeys(names))
+
+    def add_documents(self, index: str, documents: Iterable[dict], ids: Optional[Iterable[str]] = None) -> int:
+        """Index documents synchronously (they are searchable right away). Returns how many were added."""
+        target = self._get_or_create(index)
+        ids = iter(ids) if ids is not None else None
+        added = 0
+        for source in documents:
+            timestamp = source.get(TIMESTAMP_FIELD)
+            if timestamp is None:
+                raise _bad_request(f"Document without {TIMESTAMP_FIELD}; the fake keeps indexes in time order")
+            seq = next(self._seq)
+            doc_id = str(next(ids)) if ids is not None else f"{seq:020d}"
+            target.add(_Doc(parse_date(timestamp, 0), seq, doc_id, index, source))
+            added += 1
+        target.trim()
+        self.documents_indexed += added
+        return added
+
+    async def index(self, index: str, document: Optional[dict] = None, body: Optional[dict] = None,
+                    id: Optional[str] = None, **kwargs):
+        self._start_feed()
+        doc_id = id if id is not None else uuid.uuid4().hex[:20]
+        self.add_documents(index, [document if document is not None else body], [doc_id])
+        return {"_index": index, "_id": doc_id, "result": "created"}
+
+    async def open_point_in_time(self, index, keep_alive: str = DEFAULT_KEEP_ALIVE, **kwargs):
+        self._start_feed()
+        keep_alive_ms = duration_ms(keep_alive)
+        pit_id = uuid.uuid4().hex
+        self._pits[pit_id] = (self._resolve(index), next(self._seq), keep_alive_ms, int(time.time() * 1000) + keep_alive_ms)
+        return {"id": pit_id}
+
+    async def close_point_in_time(self, id: Optional[str] = None, body: Optional[dict] = None, **kwargs):
+        pit_id = id if id is not None else (body or {}).get("id")
+        freed = self._pits.pop(pit_id, None) is not None
+        return {"succeeded": True, "num_freed": int(freed)}
+
+    def _pit(self, pit: dict, now_ms: int) -> Tuple[List[str], int]:
+        self._pits = {key: value for key, value in self._pits.items() if value[3] > now_ms}
+        entry = self._pits.get(pit.get("id"))
+        if entry is None:
+            raise _error(NotFoundError, 404, "search_context_missing_exception", "No search context found")
+        names, max_seq, keep_alive_ms, _ = entry
+        keep_alive_ms = duration_ms(pit["keep_alive"]) if pit.get("keep_alive") else keep_alive_ms
+        self._pits[pit["id"]] = (names, max_seq, keep_alive_ms, now_ms + keep_alive_ms)
+        return names, max_seq
+
+    async def search(self, index=None, body: Optional[dict] = None, **params):
+        self._start_feed()
+        started = time.perf_counter()
+        body = dict(body or {}, **params)
+        ctx = _Context(int(time.time() * 1000), body.get("runtime_mappings"))
+
+        pit = body.get("pit")
+        max_seq = None
+        if pit is not None:
+            names, max_seq = self._pit(pit, ctx.now_ms)
+        else:
+            names = self._resolve(index)
+
+        # Snapshot the time window on the loop, where ingest and trimming happen; evaluate off it
+        lo, hi = time_bounds(body.get("query"), ctx)
+        windows = [self.indices_by_name[name].window(lo, hi) for name in names if name in self.indices_by_name]
+        if len(windows) == 1:
+            docs = windows[0]
+        else:
+            docs = list(merge(*windows, key=lambda doc: (doc.ts, doc.seq)))
+        response = await asyncio.to_thread(execute_search, docs, body, ctx, max_seq)
+        if pit is not None:
+            response["pit_id"] = pit["id"]
+
+        self.searches += 1
+        self.search_seconds += time.perf_counter() - started
+        return response
+
+    async def ping(self, **kwargs) -> bool:
+        return True
+
+    async def close(self):
+        if self._feed_task is not None:
+            self._feed_task.cancel()
+            self._feed_task = None
+
+    def stats(self) -> dict:
+        return {
+            "indices": {name: len(index.docs) for name, index in self.indices_by_name.items()},
+            "documents_indexed": self.documents_indexed,
+            "searches": self.searches,
+            "search_seconds": round(self.search_seconds, 3),
+            "open_pits": len(self._pits),
+        }
@@ -0,0 +1,243 @@
+from collections import OrderedDict, deque
+from itertools import count
+from typing import Callable, Dict, Optional, Union
+import asyncio
+import json
+import os
+import time
+
+from starlette.websockets import WebSocket
+
+# Frames buffered per socket before the overflow policy kicks in
+SOCKET_QUEUE_SIZE = 100
+# A send that takes longer than this means the browser is gone
+SOCKET_SEND_TIMEOUT = 5.0
+
+ALERT_QUEUE_SIZE = int(os.getenv("ALERT_QUEUE_SIZE", "256"))
+ALERT_OVERFLOW_POLICY = os.getenv("ALERT_OVERFLOW_POLICY", "coalesce")
+
+DROP_OLDEST = "drop_oldest"
+COALESCE = "coalesce"
+DISCONNECT = "disconnect"
+OVERFLOW_POLICIES = (DROP_OLDEST, COALESCE, DISCONNECT)
+
+# Close code sent when a socket is dropped for falling behind
+CLOSE_TRY_AGAIN_LATER = 1013
+
+# Latency samples kept for the percentiles in FanoutMetrics.snapshot()
+LATENCY_SAMPLES = 2048
+
+
+class FanoutMetrics:
+    """Queue depth, send latency and overflow counters shared by a group of senders."""
+
+    def __init__(self):
+        self.sent = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.disconnected = 0
+        self.failed = 0
+        self.max_queue_depth = 0
+        # Seconds from offer() to send_text() returning
+        self.latencies: deque = deque(maxlen=LATENCY_SAMPLES)
+
+    def observe_depth(self, depth: int):
+        if depth > self.max_queue_depth:
+            self.max_queue_depth = depth
+
+    def observe_send(self, latency: float):
+        self.sent += 1
+        self.latencies.append(latency)
+
+    def snapshot(self, senders=()) -> dict:
+        depths = [len(sender) for sender in senders]
+        samples = sorted(self.latencies)
+
+        def percentile(p: float):
+            if not samples:
+                return None
+            return round(samples[min(int(p * len(samples)), len(samples) - 1)] * 1000, 3)
+
+        return {
+            "connections": len(depths),
+            "queue_depth": {
+                "total": sum(depths),
+                "max": max(depths, default=0),
+                "high_water": self.max_queue_depth,
+            },
+            "send_latency_ms": {"p50": percentile(0.5), "p99": percentile(0.99), "max": percentile(1.0)},
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+            "disconnected": self.disconnected,
+            "failed": self.failed,
+        }
+
+
+class SocketSender:
+    """
+    Bounded outbound queue for one websocket, drained by its own writer task.
+
+    Producers call offer(), which never awaits. When a slow browser lets the
+    queue fill up, `overflow` decides what gives:
+
+    - drop_oldest: the oldest queued frame is discarded.
+    - coalesce: a frame offered with a key replaces the queued frame with the
+      same key in place; otherwise the oldest frame is discarded.
+    - disconnect: the socket is closed and the sender stops.
+
+    Either way, whoever is producing for every other socket is never stalled.
+    A send that fails or outlasts SOCKET_SEND_TIMEOUT also closes the socket
+    (code 1013), so a stuck browser reconnects instead of silently missing
+    every later frame.
+    """
+
+    _seq = count()
+
+    def __init__(self, websocket: WebSocket, max_queue: int = SOCKET_QUEUE_SIZE, overflow: str = DROP_OLDEST,
+                 metrics: Optional[FanoutMetrics] = None, on_close: Optional[Callable[["SocketSender"], None]] = None):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy {overflow!r}, expected one of {OVERFLOW_POLICIES}")
+        self.websocket = websocket
+        self.max_queue = max_queue
+        self.overflow = overflow
+        self.metrics = metrics or FanoutMetrics()
+        self.on_close = on_close
+        # key -> (enqueued_at, message); unkeyed frames get a unique key
+        self.queue: "OrderedDict[object, tuple]" = OrderedDict()
+        self.dropped = 0
+        self.sent = 0
+        self.closed = False
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self.queue)
+
+    def start(self):
+        self._task = asyncio.create_task(self._writer())
+        return self
+
+    def offer(self, message: str, key=None) -> bool:
+        if self.closed:
+            return False
+        if key is None or self.overflow != COALESCE:
+            key = next(self._seq)
+        elif key in self.queue:
+            self.queue[key] = (self.queue[key][0], message)
+            self.metrics.coalesced += 1
+            return True
+        if len(self.queue) >= self.max_queue:
+            if self.overflow == DISCONNECT:
+                self.metrics.disconnected += 1
+                self._shutdown()
+                return False
+            self.queue.popitem(last=False)
+            self.dropped += 1
+            self.metrics.dropped += 1
+        self.queue[key] = (time.perf_counter(), message)
+        self.metrics.observe_depth(len(self.queue))
+        self._wakeup.set()
+        return True
+
+    async def _writer(self):
+        try:
+            while True:
+                await self._wakeup.wait()
+                self._wakeup.clear()
+                while self.queue:
+                    _, (enqueued_at, message) = self.queue.popitem(last=False)
+                    await asyncio.wait_for(self.websocket.send_text(message), SOCKET_SEND_TIMEOUT)
+                    self.sent += 1
+                    self.metrics.observe_send(time.perf_counter() - enqueued_at)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # Socket is gone or stuck; a stuck peer would otherwise stay connected and never hear from us again
+            self.metrics.failed += 1
+            self._mark_closed()
+            await self._close_socket()
+        finally:
+            self._mark_closed()
+
+    def _mark_closed(self):
+        was_closed = self.closed
+        self.closed = True
+        self.queue.clear()
+        if not was_closed and self.on_close is not None:
+            self.on_close(self)
+
+    def _shutdown(self):
+        self._mark_closed()
+        if self._task is not None:
+            self._task.cancel()
+        asyncio.create_task(self._close_socket())
+
+    async def _close_socket(self):
+        try:
+            await asyncio.wait_for(self.websocket.close(code=CLOSE_TRY_AGAIN_LATER), SOCKET_SEND_TIMEOUT)
+        except Exception:
+            pass
+
+    def cancel(self):
+        self.closed = True
+        self.queue.clear()
+        if self._task is not None:
+            self._task.cancel()
+
+    async def close(self):
+        self.cancel()
+        if self._task is not None:
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+
+class ConnectionManager:
+    """
+    Alert fan-out to every /ws/alert socket.
+
+    send_alert() serializes the payload once and hands the same string to
+    each connection's SocketSender, so it returns immediately no matter how
+    many analysts are connected or how slow any one of them is.
+    """
+
+    def __init__(self, max_queue: int = ALERT_QUEUE_SIZE, overflow: str = ALERT_OVERFLOW_POLICY):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy {overflow!r}, expected one of {OVERFLOW_POLICIES}")
+        self.max_queue = max_queue
+        self.overflow = overflow
+        self.metrics = FanoutMetrics()
+        self.senders: Dict[WebSocket, SocketSender] = {}
+
+    @property
+    def active_connections(self):
+        return list(self.senders)
+
+    async def connect(self, websocket: WebSocket):
+        await websocket.accept()
+        self.attach(websocket)
+
+    def attach(self, websocket: WebSocket) -> SocketSender:
+        sender = SocketSender(websocket, self.max_queue, self.overflow, self.metrics, on_close=self._forget)
+        self.senders[websocket] = sender.start()
+        return sender
+
+    def _forget(self, sender: SocketSender):
+        if self.senders.get(sender.websocket) is sender:
+            del self.senders[sender.websocket]
+
+    def disconnect(self, websocket: WebSocket):
+        sender = self.senders.pop(websocket, None)
+        if sender is not None:
+            sender.cancel()
+
+    def send_alert(self, message: Union[str, dict], key=None) -> int:
+        """Queue `message` for every connection. Returns how many accepted it."""
+        if not isinstance(message, str):
+            message = json.dumps(message)
+        return sum(sender.offer(message, key) for sender in list(self.senders.values()))
+
+    def stats(self) -> dict:
+        return dict(self.metrics.snapshot(self.senders.values()), overflow=self.overflow, max_queue=self.max_queue)
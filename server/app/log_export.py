@@ -0,0 +1,163 @@
+from datetime import datetime, timezone
+from typing import AsyncIterator, Optional, Tuple
+import csv
+import io
+import json
+import logging
+import os
+import time
+import zlib
+
+from log_projection import LOG_FIELD_MAP, LOG_SOURCE_INCLUDES, project_hit
+from pagination import release_cursor, search_after_page
+
+EXPORT_INDEX = "proxy-logs"
+EXPORT_PAGE_SIZE = 1000
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+EXPORT_COLUMNS = ["id"] + list(LOG_FIELD_MAP)
+GZIP_LEVEL = 6
+# Longest [start, end] span one export may cover (an open end counts up to now)
+EXPORT_MAX_RANGE_DAYS = int(os.getenv("EXPORT_MAX_RANGE_DAYS", "366"))
+# Epoch-millis bounds must have at least this many digits (13 = any time since Sep 2001), so
+# a bare year or epoch seconds is refused instead of silently meaning January 1970
+EPOCH_MILLIS_MIN_DIGITS = 13
+
+logger = logging.getLogger(__name__)
+
+
+class ExportStats:
+    """Running totals plus the throughput of the most recent export."""
+
+    def __init__(self):
+        self.exports = 0
+        self.docs = 0
+        self.last: Optional[dict] = None
+
+    def record(self, client_id: str, docs: int, elapsed: float, completed: bool):
+        self.exports += 1
+        self.docs += docs
+        self.last = {
+            "client_id": client_id,
+            "docs": docs,
+            "seconds": round(elapsed, 3),
+            "docs_per_second": round(docs / elapsed, 1) if elapsed > 0 else None,
+            "completed": completed,
+        }
+
+    def snapshot(self) -> dict:
+        return {"exports": self.exports, "docs": self.docs, "last": self.last}
+
+
+export_stats = ExportStats()
+
+
+class ExportRangeError(ValueError):
+    """Raised for start/end bounds that aren't dates, are out of order or span too much."""
+
+
+def _parse_bound(name: str, value: Optional[str]) -> Optional[int]:
+    if value is None or not value.strip():
+        return None
+    value = value.strip()
+    if value.isdigit() and len(value) >= EPOCH_MILLIS_MIN_DIGITS:
+        return int(value)
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        raise ExportRangeError(f"Invalid {name}: use an ISO 8601 date/time or "
+                               f"epoch milliseconds ({EPOCH_MILLIS_MIN_DIGITS}+ digits)")
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)  # Like ES, read zoneless times as UTC
+    return int(parsed.timestamp() * 1000)
+
+
+def parse_export_range(start: Optional[str], end: Optional[str],
+                       now_ms: Optional[int] = None) -> Tuple[Optional[int], Optional[int]]:
+    """
+    Validate the export's start/end query parameters into epoch millis.
+
+    Done before the response starts: once the stream is under way, an ES
+    error can only cut the body short, not turn into a 400.
+    """
+    start_ms, end_ms = _parse_bound("start", start), _parse_bound("end", end)
+    if start_ms is not None and end_ms is not None and start_ms > end_ms:
+        raise ExportRangeError("start must not be after end")
+    if start_ms is not None:
+        until_ms = end_ms if end_ms is not None else (int(time.time() * 1000) if now_ms is None else now_ms)
+        if until_ms - start_ms > EXPORT_MAX_RANGE_DAYS * 86400 * 1000:
+            raise ExportRangeError(f"Range too large: at most {EXPORT_MAX_RANGE_DAYS} days per export")
+    return start_ms, end_ms
+
+
+def build_export_query(client_field: str, client_id: str, start_ms: Optional[int], end_ms: Optional[int]) -> dict:
+    filters = [{"term": {client_field: client_id}}]
+    time_range = {}
+    if start_ms is not None:
+        time_range["gte"] = start_ms
+    if end_ms is not None:
+        time_range["lte"] = end_ms
+    if time_range:
+        time_range["format"] = "epoch_millis"
+        filters.append({"range": {"@timestamp": time_range}})
+    return {"bool": {"filter": filters}}
+
+
+def _encode_page(hits, fmt: str) -> str:
+    if fmt == "ndjson":
+        return "".join(json.dumps(project_hit(hit)) + "\n" for hit in hits)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerows([row[column] for column in EXPORT_COLUMNS] for row in map(project_hit, hits))
+    return buffer.getvalue()
+
+
+async def stream_client_logs(es, client_field: str, client_id: str, fmt: str = "ndjson", compress: bool = True,
+                             start_ms: Optional[int] = None, end_ms: Optional[int] = None,
+                             index: str = EXPORT_INDEX) -> AsyncIterator[bytes]:
+    """
+    Yield a client's logs over [start_ms, end_ms] as NDJSON or CSV, optionally gzipped.
+
+    Walks the range one EXPORT_PAGE_SIZE page at a time with point-in-time +
+    search_after and encodes/compresses each page as it goes, so memory stays
+    flat regardless of how many logs match.
+    """
+    query = build_export_query(client_field, client_id, start_ms, end_ms)
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS) if compress else None
+
+    def emit(text: str) -> bytes:
+        data = text.encode()
+        return compressor.compress(data) if compressor else data
+
+    docs = 0
+    cursor = None
+    completed = False
+    started = time.perf_counter()
+    try:
+        if fmt == "csv":
+            yield emit(",".join(EXPORT_COLUMNS) + "\r\n")
+
+        while True:
+            hits, cursor = await search_after_page(
+                es, index, query, EXPORT_PAGE_SIZE, cursor, scope=client_id, source=LOG_SOURCE_INCLUDES,
+            )
+            if hits:
+                docs += len(hits)
+                chunk = emit(_encode_page(hits, fmt))
+                if chunk:
+                    yield chunk
+            if cursor is None:
+                break
+
+        if compressor:
+            yield compressor.flush()
+        completed = True
+    finally:
+        if cursor is not None:
+            await release_cursor(es, cursor)  # Client went away mid-export
+        elapsed = time.perf_counter() - started
+        export_stats.record(client_id, docs, elapsed, completed)
+        logger.info(f"Exported {docs} logs for {client_id} in {elapsed:.1f}s "
+                    f"({docs / elapsed if elapsed else 0:.0f} docs/s, completed={completed})")
@@ -0,0 +1,76 @@
+from typing import Dict, List, Tuple
+
+from schemas import Log
+
+# Log field -> (dotted path in the packetbeat _source, default when missing)
+LOG_FIELD_MAP: Dict[str, Tuple[str, object]] = {
+    "timestamp": ("@timestamp", "N/A"),
+    "client_name": ("client_name", "Unknown"),
+    "host_id": ("host.id", "N/A"),
+    "os_platform": ("host.os.platform", "N/A"),
+    "network_transport": ("network.transport", "N/A"),
+    "network_type": ("network.type", "N/A"),
+    "source_bytes": ("source.bytes", 0),
+    "destination_ip": ("destination.ip", "N/A"),
+    "event_action": ("event.action", "N/A"),
+    "event_duration": ("event.duration", 0),
+    "source_mac": ("source.mac", "N/A"),
+    "flow_id": ("flow.id", "N/A"),
+    "server_domain": ("server.domain", "N/A"),
+}
+
+# Sent as `_source` so ES skips HTTP bodies and every other unused field
+LOG_SOURCE_INCLUDES: List[str] = sorted({path for path, _ in LOG_FIELD_MAP.values()})
+
+_EMPTY: dict = {}
+
+
+FieldGroup = Tuple[Tuple[str, ...], List[Tuple[str, str, object]]]
+
+
+def _group_by_parent(field_map: Dict[str, Tuple[str, object]]) -> List[FieldGroup]:
+    """(parent path, [(Log field, key under the parent, default), ...]) per parent object."""
+    groups: Dict[Tuple[str, ...], List[Tuple[str, str, object]]] = {}
+    for field, (path, default) in field_map.items():
+        *parent, key = path.split(".")
+        groups.setdefault(tuple(parent), []).append((field, key, default))
+    return list(groups.items())
+
+
+_FIELD_GROUPS = _group_by_parent(LOG_FIELD_MAP)
+# Copied per hit so the keys come out in LOG_FIELD_MAP order whatever the grouping
+_LOG_TEMPLATE = dict.fromkeys(["id", *LOG_FIELD_MAP])
+
+
+def project_hit(hit: dict) -> dict:
+    """
+    Flatten one hit's (filtered) _source into a Log dict.
+
+    Fields are grouped by their parent object, so each parent (`network`,
+    `event`, ...) is resolved once per hit rather than once per field.
+    """
+    source = hit.get("_source") or _EMPTY
+    log = _LOG_TEMPLATE.copy()
+    log["id"] = hit["_id"]
+    for parent, fields in _FIELD_GROUPS:
+        node = source
+        for key in parent:
+            node = node.get(key) or _EMPTY
+        for field, key, default in fields:
+            log[field] = node.get(key, default)
+    return log
+
+
+def _check_against_schema():
+    # Done once at import so a drifted mapping fails at startup, not per hit
+    fields = getattr(Log, "model_fields", None) or Log.__fields__
+    expected = set(fields) - {"id"}
+    if set(LOG_FIELD_MAP) != expected:
+        raise ValueError(f"LOG_FIELD_MAP does not match the Log schema: {sorted(set(LOG_FIELD_MAP) ^ expected)}")
+
+
+_check_against_schema()
+
+
+def project_hits(hits: List[dict]) -> List[dict]:
+    return [project_hit(hit) for hit in hits]
@@ -0,0 +1,90 @@
+from collections import defaultdict
+from typing import Dict, List, Set
+import asyncio
+import json
+
+from starlette.websockets import WebSocket
+
+from fanout import SocketSender
+from log_projection import LOG_SOURCE_INCLUDES, project_hit
+from metrics import LoopTimer
+from tailer import LogTailer
+
+LOG_STREAM_INDEX = "proxy-logs"
+# Logs per websocket frame
+LOG_STREAM_FRAME_SIZE = 50
+# How often to check for subscribers while nobody is watching
+LOG_STREAM_IDLE_INTERVAL = 1.0
+
+
+def _client_id_of(hit: dict):
+    client_id = hit.get("_source", {}).get("client_id")
+    if isinstance(client_id, list):
+        client_id = client_id[0] if client_id else None
+    return client_id
+
+
+class LogStreamer:
+    """
+    One tailer over proxy-logs feeding every /ws/logs/{client_id} socket.
+
+    New documents are read once, grouped by client_id and pushed in frames of
+    up to LOG_STREAM_FRAME_SIZE logs to that client's subscribers. ES load is
+    a single query stream no matter how many client pages are open.
+    """
+
+    def __init__(self, index: str = LOG_STREAM_INDEX):
+        self.tailer = LogTailer(index=index, source=LOG_SOURCE_INCLUDES + ["client_id"])
+        self.subscribers: Dict[str, Set[SocketSender]] = defaultdict(set)
+
+    def subscribe(self, client_id: str, websocket: WebSocket) -> SocketSender:
+        sender = SocketSender(websocket).start()
+        self.subscribers[client_id].add(sender)
+        return sender
+
+    async def unsubscribe(self, client_id: str, sender: SocketSender):
+        senders = self.subscribers.get(client_id)
+        if senders is not None:
+            senders.discard(sender)
+            if not senders:
+                del self.subscribers[client_id]
+        await sender.close()
+
+    def connection_count(self) -> int:
+        return sum(len(senders) for senders in self.subscribers.values())
+
+    def dispatch(self, hits: List[dict]) -> int:
+        """Group a batch by client and queue frames for subscribed sockets. Returns frames queued."""
+        grouped: Dict[str, List[dict]] = defaultdict(list)
+        for hit in hits:
+            client_id = _client_id_of(hit)
+            if client_id in self.subscribers:
+                grouped[client_id].append(hit)
+
+        frames = 0
+        for client_id, client_hits in grouped.items():
+            for offset in range(0, len(client_hits), LOG_STREAM_FRAME_SIZE):
+                chunk = client_hits[offset:offset + LOG_STREAM_FRAME_SIZE]
+                # Serialized once per frame, shared by every socket for the client
+                message = json.dumps({"type": "logs", "client_id": client_id, "logs": [project_hit(h) for h in chunk]})
+                for sender in list(self.subscribers.get(client_id, ())):
+                    sender.offer(message)
+                frames += 1
+        return frames
+
+    async def run(self, es):
+        timer = LoopTimer("log_stream")
+        while True:
+            if not self.subscribers:
+                # Nobody watching: restart from the newest log once someone subscribes
+                self.tailer.cursor_ms = None
+                await asyncio.sleep(LOG_STREAM_IDLE_INTERVAL)
+                continue
+            timer.begin()
+            try:
+                self.dispatch(await self.tailer.poll(es))
+            except Exception as e:
+                print(f"❌ Error in log stream: {e}")
+            interval = self.tailer.next_interval()
+            timer.end(interval)
+            await asyncio.sleep(interval)
@@ -1,5 +1,6 @@
 from fastapi import FastAPI, HTTPException, Depends, WebSocket, WebSocketDisconnect, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from sqlalchemy.orm import Session
 from starlette.websockets import WebSocketState
 from database import SessionLocal, engine, Base
@@ -10,20 +11,34 @@ from jwt_utils import create_jwt_token, verify_jwt_token
 from password_generator import generate_org_code, generate_password
 from email_service import send_email 
 from validation import is_valid_email
-from typing import Annotated, List, Dict, Set
-from collections import defaultdict
+from presence import PresenceEngine
+from es_client import create_es_client, search
+from visualizations import VisualizationBroadcaster
+from rollups import RollupIngestor, RollupStore, ROLLUP_DB_FILE
+from pagination import CursorError, search_after_page
+from log_projection import LOG_SOURCE_INCLUDES, project_hits
+from log_export import EXPORT_FORMATS, ExportRangeError, export_stats, parse_export_range, stream_client_logs
+from log_stream import LogStreamer
+from fanout import ConnectionManager
+from cooldown import CooldownStore, COOLDOWN_SNAPSHOT_INTERVAL
+from working_hours import WorkingHoursPolicies
+from detection import DetectionPipeline, RuleStats
+from rules import OutsideWorkingHoursRule, RestrictedDomainRule
+from baselines import BaselineRule
+from beaconing import BeaconingRule
+from domain_scoring import DomainScoringRule
+from volume_anomaly import VolumeAnomalyJob, VOLUME_ANOMALY_INTERVAL
+from scoring_pool import ScoringPool
+from metrics import LoopTimer, es_call_site, monitor_event_loop, registry as metrics_registry
+from domains import RestrictedDomainBlocklist, extract_root_domains, read_blocklist_entries, remove_blocklist_entry, root_domain_extractor, write_blocklist_entries
+from typing import Annotated, List, Dict, Optional
 import logging
 import urllib3
 import csv
-import json
 import re
-from elasticsearch import Elasticsearch
-from datetime import datetime, timedelta
 from dateutil import parser
 import asyncio
 import time
-import pytz
-import tldextract
 import random
 import os
 
@@ -33,9 +48,9 @@ app = FastAPI()
 ELASTICSEARCH_URL = "https://localhost:9200"
 USERNAME = "elastic"
 PASSWORD = "YOUR ELASTICSEARCH PASSWORD"  # Replace with your actual password
-INDEX_NAME = "YOUR INDEX NAME"  # Replace with your actual index name
+INDEX_NAME = os.getenv("INDEX_NAME", "YOUR INDEX NAME")  # Replace with your actual index name
 
-RESTRICTED_DOMAINS_FILE = "D:/UEBA/ueba/server/app/restricted_domains.csv"
+RESTRICTED_DOMAINS_FILE = os.getenv("RESTRICTED_DOMAINS_FILE", "D:/UEBA/ueba/server/app/restricted_domains.csv")
 
 URL_FIELD = "destination.domain"
 TIMESTAMP_FIELD = "@timestamp"
@@ -48,16 +63,18 @@ CLIENT_ID_FIELD = "client_id.keyword"
 
 ALERT_COOLDOWN = 300
 
-recent_alerts = defaultdict(dict)
+# Seconds between checks of the restricted-domain CSV's mtime
+BLOCKLIST_WATCH_INTERVAL = 5
+
+# One cooldown per (detector, client[, domain]), shared by both detectors and
+# snapshotted to disk so a restart doesn't re-fire alerts still inside it
+alert_cooldowns = CooldownStore(ttl=ALERT_COOLDOWN)
+alert_cooldowns.load()
 
 logging.getLogger("elastic_transport").setLevel(logging.WARNING)
 logging.getLogger("elastic_transport.transport").setLevel(logging.WARNING)
 
-es = Elasticsearch(
-        [ELASTICSEARCH_URL],
-        basic_auth=(USERNAME, PASSWORD),  # Authentication
-        verify_certs=False  # Set to True for security (if using a valid SSL cert)
-    )
+es = create_es_client(ELASTICSEARCH_URL, USERNAME, PASSWORD)
 
 app.add_middleware(
     CORSMiddleware, 
@@ -69,11 +86,10 @@ app.add_middleware(
 
 # Store active WebSocket connections
 active_connections: List[WebSocket] = []
-# Cache for last seen timestamps and status
-client_last_seen: Dict[str, datetime] = {}
+# Last status pushed over /ws for each client
 client_status_cache: Dict[str, str] = {}
-# Track WebSocket connections by client_id
-client_connections: Dict[str, Set[WebSocket]] = {}
+# Live log subscribers by client_id, fed by one shared tailer
+log_streamer = LogStreamer(index="proxy-logs")
 
 active_connections = []
 
@@ -332,45 +348,41 @@ async def websocket_endpoint(websocket: WebSocket):
     except WebSocketDisconnect:
         active_connections.remove(websocket)
 
-def is_client_online(client_id: str) -> str:
-    time_threshold = (datetime.utcnow() - timedelta(minutes=5)).isoformat() + "Z"
-    
-    query = {
-        "query": {
-            "bool": {
-                "must": [
-                    {"match": {"client_id.keyword": client_id}},
-                    {"range": {"@timestamp": {"gte": time_threshold}}}
-                    #{"range": {"timestamp": {"gte": "2025-02-24T06:31:15.016Z"}}}
-                ]
-            }
-        },
-    }
+presence = PresenceEngine(index="proxy-logs")
 
-    response = es.search(index="proxy-logs", body=query)
-    return "Online" if response["hits"]["total"]["value"] > 0 else "Offline"
+def is_client_online(client_id: str) -> str:
+    # Served from the presence table; refreshed by monitor_client_status()
+    return presence.status(client_id)
 
 # Background task to check status frequently
 async def monitor_client_status():
+    es_call_site.set("presence")
+    timer = LoopTimer("client_status")
     while True:
+        timer.begin()
+        try:
+            await presence.refresh(es)
+        except Exception as e:
+            print(f"❌ Error refreshing client presence: {e}")
+
         db = next(get_db())
         clients = db.query(Clients).all()
+        statuses = presence.statuses(client.id for client in clients)
 
-        for client in clients:
-            current_status = is_client_online(client.id)
-
+        for client_id, current_status in statuses.items():
             # If status changed or new client, notify via WebSocket
-            if client.id not in client_status_cache or client_status_cache[client.id] != current_status:
-                client_status_cache[client.id] = current_status
+            if client_id not in client_status_cache or client_status_cache[client_id] != current_status:
+                client_status_cache[client_id] = current_status
 
                 # Notify all connected clients
                 for connection in active_connections:
                     await connection.send_json({
-                        "client_id": client.id,
+                        "client_id": client_id,
                         "status": current_status
                     })
 
         # Check every 10 seconds for quicker updates
+        timer.end(10)
         await asyncio.sleep(10)
 
 # Original endpoint for initial data load
@@ -381,11 +393,12 @@ async def get_clients(db: Session = Depends(get_db)):
         return []  # Return an empty list if no clients exist
 
     clients = response  # Ensure `clients` is a list
+    statuses = presence.statuses(client.id for client in clients)
 
     client_list = []
     for client in clients:
         client_data = client.__dict__  # Convert to dictionary if necessary
-        client_data["status"] = is_client_online(client.id)
+        client_data["status"] = statuses[client.id]
         client_status_cache[client.id] = client_data["status"]
         client_list.append(client_data)
 
@@ -417,22 +430,22 @@ def put_client(user: ClientInput, db: Session = Depends(get_db)):
 async def websocket_logs(websocket: WebSocket, client_id: str):
     await websocket.accept()
 
-    # Add this connection to the client's connection pool
-    if client_id not in client_connections:
-        client_connections[client_id] = set()
-    client_connections[client_id].add(websocket)
+    # New logs for this client are pushed by log_streamer through a bounded queue
+    sender = log_streamer.subscribe(client_id, websocket)
 
     try:
         # Keep connection open and listen for any client messages
         while True:
             await websocket.receive_text()
     except WebSocketDisconnect:
-        # Remove connection when client disconnects
-        client_connections[client_id].remove(websocket)
-        if not client_connections[client_id]:
-            del client_connections[client_id]
+        pass
+    finally:
+        await log_streamer.unsubscribe(client_id, sender)
 
 # Background task to monitor logs and push updates
+async def stream_client_logs_live():
+    es_call_site.set("log_stream")
+    await log_streamer.run(es)
     
 # Helper function to validate client ID
 def validate_client_id(client_id: str):
@@ -441,6 +454,7 @@ def validate_client_id(client_id: str):
 
 @app.get("/clients/{client_id}")
 async def get_client_details(client_id: str, db: Session = Depends(get_db)):
+    es_call_site.set("get_client_details")
     try:
         validate_client_id(client_id)
         logging.info(f"Fetching details for client ID: {client_id}")
@@ -463,33 +477,16 @@ async def get_client_details(client_id: str, db: Session = Depends(get_db)):
         # Elasticsearch query to get the latest logs
         logs_query = {
             "query": {"match": {CLIENT_ID_FIELD: client.id}},
+            "_source": LOG_SOURCE_INCLUDES,
             "size": LOG_PAGE_SIZE,
             "sort": [{"@timestamp": {"order": "desc"}}]
         }
 
-        logs_response = es.search(index="proxy-logs", body=logs_query)
+        logs_response = await search(es, "proxy-logs", logs_query)
+        hits = logs_response.get("hits", {}).get("hits", [])
 
         # Extract logs
-        logs = []
-        if "hits" in logs_response and "hits" in logs_response["hits"]:
-            for hit in logs_response["hits"]["hits"]:
-                _source = hit["_source"]
-                logs.append({
-                    "id": hit["_id"],
-                    "timestamp": _source.get("@timestamp", "N/A"),
-                    "client_name": _source.get("client_name", "Unknown"),
-                    "host_id": _source.get("host", {}).get("id", "N/A"),
-                    "os_platform": _source.get("host", {}).get("os", {}).get("platform", "N/A"),
-                    "network_transport": _source.get("network", {}).get("transport", "N/A"),
-                    "network_type": _source.get("network", {}).get("type", "N/A"),
-                    "source_bytes": _source.get("source", {}).get("bytes", 0),
-                    "destination_ip": _source.get("destination", {}).get("ip", "N/A"),
-                    "event_action": _source.get("event", {}).get("action", "N/A"),
-                    "event_duration": _source.get("event", {}).get("duration", 0),
-                    "source_mac": _source.get("source", {}).get("mac", "N/A"),
-                    "flow_id": _source.get("flow", {}).get("id", "N/A"),
-                    "server_domain": _source.get("server", {}).get("domain", "N/A")
-                })
+        logs = project_hits(hits)
 
         client_details["logs"] = logs
         return client_details
@@ -501,7 +498,13 @@ async def get_client_details(client_id: str, db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail="An unexpected error occurred. Please try again later.")
 
 @app.get("/clients/{client_id}/refresh")
-async def refresh_logs(client_id: str, start: int = 0, db: Session = Depends(get_db)):
+async def refresh_logs(client_id: str, start: int = 0, cursor: Optional[str] = None, db: Session = Depends(get_db)):
+    """
+    Pages through a client's logs, newest first. Passing `cursor` (empty for
+    the first page) switches from offset paging to search_after paging, and
+    `next_start` becomes an opaque continuation token.
+    """
+    es_call_site.set("refresh_logs")
     try:
         validate_client_id(client_id)
         logging.info(f"Refreshing logs for client ID: {client_id}, start: {start}")
@@ -511,37 +514,30 @@ async def refresh_logs(client_id: str, start: int = 0, db: Session = Depends(get
         if not client:
             raise HTTPException(status_code=404, detail="Client not found")
 
-        # Elasticsearch query for paginated logs
-        logs_query = {
-            "query": {"match": {CLIENT_ID_FIELD: client.id}},
-            "size": LOG_PAGE_SIZE,
-            "from": start,
-            "sort": [{"@timestamp": {"order": "desc"}}]
-        }
+        if cursor is not None:
+            try:
+                hits, next_start = await search_after_page(
+                    es, "proxy-logs", {"match": {CLIENT_ID_FIELD: client.id}},
+                    LOG_PAGE_SIZE, cursor or None, scope=client.id, source=LOG_SOURCE_INCLUDES,
+                )
+            except CursorError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+        else:
+            # Elasticsearch query for paginated logs
+            logs_query = {
+                "query": {"match": {CLIENT_ID_FIELD: client.id}},
+                "_source": LOG_SOURCE_INCLUDES,
+                "size": LOG_PAGE_SIZE,
+                "from": start,
+                "sort": [{"@timestamp": {"order": "desc"}}]
+            }
 
-        logs_response = es.search(index="proxy-logs", body=logs_query)
+            logs_response = await search(es, "proxy-logs", logs_query)
+            hits = logs_response.get("hits", {}).get("hits", [])
+            next_start = start + LOG_PAGE_SIZE if len(hits) == LOG_PAGE_SIZE else None
 
         # Extract logs
-        logs = []
-        if "hits" in logs_response and "hits" in logs_response["hits"]:
-            for hit in logs_response["hits"]["hits"]:
-                _source = hit["_source"]
-                logs.append({
-                    "id": hit["_id"],
-                    "timestamp": _source.get("@timestamp", "N/A"),
-                    "client_name": _source.get("client_name", "Unknown"),
-                    "host_id": _source.get("host", {}).get("id", "N/A"),
-                    "os_platform": _source.get("host", {}).get("os", {}).get("platform", "N/A"),
-                    "network_transport": _source.get("network", {}).get("transport", "N/A"),
-                    "network_type": _source.get("network", {}).get("type", "N/A"),
-                    "source_bytes": _source.get("source", {}).get("bytes", 0),
-                    "destination_ip": _source.get("destination", {}).get("ip", "N/A"),
-                    "event_action": _source.get("event", {}).get("action", "N/A"),
-                    "event_duration": _source.get("event", {}).get("duration", 0),
-                    "source_mac": _source.get("source", {}).get("mac", "N/A"),
-                    "flow_id": _source.get("flow", {}).get("id", "N/A"),
-                    "server_domain": _source.get("server", {}).get("domain", "N/A")
-                })
+        logs = project_hits(hits)
 
         # Prepare response
         client_details = {
@@ -550,7 +546,7 @@ async def refresh_logs(client_id: str, start: int = 0, db: Session = Depends(get
             "role": client.client_role,
             "status": is_client_online(client.id),
             "logs": logs,
-            "next_start": start + LOG_PAGE_SIZE if len(logs) == LOG_PAGE_SIZE else None
+            "next_start": next_start
         }
 
         return client_details
@@ -561,11 +557,33 @@ async def refresh_logs(client_id: str, start: int = 0, db: Session = Depends(get
         logging.error(f"Unexpected error: {e}")
         raise HTTPException(status_code=500, detail="An unexpected error occurred. Please try again later.")
     
+@app.get("/clients/{client_id}/export")
+async def export_logs(client_id: str, format: str = "ndjson", gzip: bool = True,
+                      start: Optional[str] = None, end: Optional[str] = None, db: Session = Depends(get_db)):
+    """Streams every log for a client in [start, end] as NDJSON or CSV, gzipped by default."""
+    es_call_site.set("export_logs")
+    validate_client_id(client_id)
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported format. Use one of: {', '.join(EXPORT_FORMATS)}")
+    try:
+        start_ms, end_ms = parse_export_range(start, end)
+    except ExportRangeError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    client = db.query(Clients).filter(Clients.id == client_id).first()
+    if not client:
+        raise HTTPException(status_code=404, detail="Client not found")
+
+    filename = f"{client.id}-logs.{format}" + (".gz" if gzip else "")
+    return StreamingResponse(
+        stream_client_logs(es, CLIENT_ID_FIELD, client.id, format, gzip, start_ms, end_ms),
+        media_type="application/gzip" if gzip else EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
 def init_csv():
     if not os.path.exists(RESTRICTED_DOMAINS_FILE):
-        with open(RESTRICTED_DOMAINS_FILE, "w", newline="") as f:
-            writer = csv.writer(f)
-            writer.writerow(["url"])
+        write_blocklist_entries(RESTRICTED_DOMAINS_FILE, [])
 
 init_csv()
 
@@ -573,11 +591,7 @@ init_csv()
 def load_restricted_websites():
     websites = set()
     if os.path.exists(RESTRICTED_DOMAINS_FILE):
-        with open(RESTRICTED_DOMAINS_FILE, "r", newline="") as file:
-            reader = csv.reader(file)
-            for row in reader:
-                if row and row[0].strip():  # Ensure the row is not empty
-                    websites.add(row[0].strip())  # Add domain URL to the set
+        websites.update(read_blocklist_entries(RESTRICTED_DOMAINS_FILE))
     return websites
 
 # ✅ Add a website
@@ -591,10 +605,11 @@ def add_website(website: Website):
         return {"message": "Website already exists in the list."}
 
     # Append the new website URL to the CSV file on a new line
-    with open(RESTRICTED_DOMAINS_FILE, "a", newline="") as file:
-        writer = csv.writer(file)
+    with open(RESTRICTED_DOMAINS_FILE, "a", encoding="utf-8", newline="") as file:
+        writer = csv.writer(file, lineterminator="\n")
         writer.writerow([website.url.strip()])  # Strip to ensure no extra spaces
 
+    restricted_blocklist.reload()
     return {"message": "Website added to the list."}
 
 # ✅ Get all restricted websites
@@ -609,291 +624,183 @@ def delete_website(website: Website):
     if not os.path.exists(RESTRICTED_DOMAINS_FILE):
         raise HTTPException(status_code=404, detail="CSV file not found.")
 
-    with open(RESTRICTED_DOMAINS_FILE, "r") as file:
-        rows = list(csv.reader(file))
-
-    if len(rows) <= 1:
+    if not read_blocklist_entries(RESTRICTED_DOMAINS_FILE):
         return {"message": "No websites to delete."}
 
-    header, data = rows[0], rows[1:]
-    updated_data = [row for row in data if row[0] != website.url]
+    remove_blocklist_entry(RESTRICTED_DOMAINS_FILE, website.url)
 
-    with open(RESTRICTED_DOMAINS_FILE, "w", newline="") as file:
-        writer = csv.writer(file)
-        writer.writerow(header)
-        writer.writerows(updated_data)
-    
+    restricted_blocklist.reload()
     return {"message": "Website deleted from the list."}
 
 
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: list[WebSocket] = []
-
-    async def connect(self, websocket: WebSocket):
-        await websocket.accept()
-        self.active_connections.append(websocket)
-
-    def disconnect(self, websocket: WebSocket):
-        if websocket in self.active_connections:
-            self.active_connections.remove(websocket)
-
-    async def send_alert(self, message: str):
-        disconnected_clients = []
-        for connection in self.active_connections:
-            try:
-                await connection.send_text(message)
-            except Exception:
-                print(f"⚠️ Client disconnected: {connection}")
-                disconnected_clients.append(connection)
-
-        # Remove disconnected clients
-        for client in disconnected_clients:
-            self.active_connections.remove(client)
-
 manager = ConnectionManager()
 
-# Function to extract the root domain
-def extract_root_domain(domain):
-    extracted = tldextract.extract(domain)
-    return f"{extracted.domain}.{extracted.suffix}" if extracted.suffix else extracted.domain
-
-class TrieNode:
-    def __init__(self):
-        self.children = defaultdict(TrieNode)
-        self.is_end = False
-
-class DomainTrie:
-    def __init__(self):
-        self.root = TrieNode()
-
-    def insert(self, domain):
-        node = self.root
-        for char in domain[::-1]:  # Reverse for suffix-based search
-            node = node.children[char]
-        node.is_end = True
-
-    def search(self, domain):
-        node = self.root
-        for char in domain[::-1]:  # Reverse search
-            if char not in node.children:
-                return False
-            node = node.children[char]
-            if node.is_end:
-                return True  # Allow subdomain matches
-        return node.is_end
-    
-restricted_domains = DomainTrie()
+restricted_blocklist = RestrictedDomainBlocklist(RESTRICTED_DOMAINS_FILE)
+restricted_blocklist.reload()
 
-# Load restricted domains from CSV file
-def load_restricted_domains():
-    try:
-        with open(RESTRICTED_DOMAINS_FILE, "r", encoding="utf-8") as file:
-            reader = csv.reader(file)
-            for row in reader:
-                if row:
-                    cleaned_domain = extract_root_domain(row[0].strip().lower())
-                    restricted_domains.insert(cleaned_domain)  # 🔧 Fixed insert → add()
-    except FileNotFoundError:
-        print(f"❌ CSV file '{RESTRICTED_DOMAINS_FILE}' not found!")
-        exit(1)
-    except Exception as e:
-        print(f"❌ Error loading restricted domains: {e}")
-
-
-# Detect restricted domains from logs
-async def detect_restricted_domains():
-    if not es:
-        print("❌ Elasticsearch connection not established!")
-        return
-    
+# Rebuild the restricted-domain matcher when the CSV is edited outside the API
+async def watch_restricted_domains():
+    timer = LoopTimer("blocklist_watch")
     while True:
+        timer.begin()
         try:
-            load_restricted_domains()
-
-            if not manager.active_connections:
-                await asyncio.sleep(1)
-                continue
-
-            # Elasticsearch query
-            search_query = {
-                "size": 100,
-                "_source": ["destination.domain", "client_name"],
-                "query": {"exists": {"field": "destination.domain"}},
-                "sort": [{"@timestamp": {"order": "desc"}}]
-            }
-
-            response = es.search(index=INDEX_NAME, body=search_query)
-            if "hits" not in response or "hits" not in response["hits"]:
-                print("⚠️ Invalid Elasticsearch response")
-                await asyncio.sleep(1)
-                continue
-            logs = response["hits"]["hits"]
-
-            surfed_domains = set()
-            for log in logs:
-                _source = log.get("_source", {})
-                domain_value = _source.get("destination", {}).get("domain", "N/A")
-                client_name = _source.get("client_name", "Unknown")
-
-                # Ensure client_name is a string
-                if isinstance(client_name, list):
-                    client_name = client_name[0] if client_name else "Unknown"
-                elif not isinstance(client_name, str):
-                    client_name = str(client_name)
-
-                # Process domain_value if it’s a string
-                if domain_value and isinstance(domain_value, str) and domain_value != "N/A":
-                    root_domain = extract_root_domain(domain_value)
-                    if isinstance(root_domain, str):
-                        surfed_domains.add((client_name, root_domain))
-                    else:
-                        print(f"⚠️ Skipping invalid root_domain: {root_domain}")
-                else:
-                    print(f"⚠️ Invalid domain_value: {domain_value}")
-
-            # Check if the domain is restricted
-            matched_alerts = set()
-            for client, domain in surfed_domains:
-                if isinstance(domain, str) and restricted_domains.search(domain):
-                    matched_alerts.add((client, domain))
-
-            # Send alerts only if they are new (not in cooldown)
-            current_time = time.time()
-            for client, domain in matched_alerts:
-                last_alert_time = recent_alerts.get(client, {}).get(domain, 0)
-                if current_time - last_alert_time > ALERT_COOLDOWN:
-                    alert_message = {
-                        "type": "alert",
-                        "message": f"🚨 ALERT: {client} accessed a restricted domain: {domain}",
-                        "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
-                    }
-                    await manager.send_alert(json.dumps(alert_message))
-                    if client not in recent_alerts:
-                        recent_alerts[client] = {}
-                    recent_alerts[client][domain] = current_time
-
+            restricted_blocklist.reload_if_changed()
         except Exception as e:
-            print(f"❌ Error in detect_restricted_domains: {e}")
-
-        await asyncio.sleep(1)
-
+            print(f"❌ Error reloading restricted domains: {e}")
+        timer.end(BLOCKLIST_WATCH_INTERVAL)
+        await asyncio.sleep(BLOCKLIST_WATCH_INTERVAL)
 
-# Convert UTC timestamp to IST (Indian Standard Time)
-def convert_to_ist(timestamp):
-    # Ensure the timestamp is in UTC
-    timestamp = timestamp.replace(tzinfo=pytz.UTC)  # Add UTC timezone info
-    # Convert to IST
-    ist_timezone = pytz.timezone("Asia/Kolkata")
-    timestamp_ist = timestamp.astimezone(ist_timezone)
-    return timestamp_ist
 
-# Function to check if a timestamp is outside working hours (before 9 AM or after 5 PM)
-def is_outside_working_hours(timestamp):
-    try:
-        if isinstance(timestamp, str):  # Check if it's a string (timestamp in string format)
-            # Convert the string timestamp into a datetime object in UTC
-            timestamp = datetime.strptime(timestamp, "%Y-%m-%dT%H:%M:%S.%fZ")
-            timestamp = convert_to_ist(timestamp)  # Convert to IST
-
-        # Check if the timestamp is outside working hours (before 9 AM or after 5 PM IST)
-        return timestamp.hour < 17 or timestamp.hour >= 19  # Outside working hours: before 9 AM or after 5 PM IST
+# Tails INDEX_NAME so each new log is checked exactly once
+@app.get("/detector-status")
+def detector_status():
+    return {
+        "detection": detection_pipeline.stats(),
+        "blocklist_version": restricted_blocklist.snapshot.version,
+        "root_domain_cache": root_domain_extractor.stats(),
+        "rollups": dict(rollup_ingestor.tailer.stats(), caught_up=rollup_ingestor.caught_up),
+        "exports": export_stats.snapshot(),
+        "alerts_fanout": manager.stats(),
+        "alert_cooldowns": alert_cooldowns.stats(),
+        "working_hours_policies": working_hours_policies.describe(),
+        "behavior_baselines": behavior_baselines.engine.stats(),
+        "beaconing": beaconing.stats(),
+        "domain_scoring": domain_scoring.stats(),
+        "volume_anomalies": volume_anomaly_job.stats(),
+        "scoring_pool": scoring_pool.stats(),
+        "log_stream": dict(log_streamer.tailer.stats(), connections=log_streamer.connection_count()),
+    }
 
-    except Exception as e:
-        print(f"❌ Invalid timestamp format: {timestamp} ({e})")
-        return False
 
-# Main async function to detect access outside working hours
-async def detect_outside_working_hours():
+# Scrape-time views of the counters above, in Prometheus text format
+def _rule_stats():
+    return dict(detection_pipeline.stats_by_rule, volume_anomaly=volume_spike_stats).items()
+
+def _tailers():
+    return {"detection": detection_pipeline.tailer, "rollups": rollup_ingestor.tailer,
+            "log_stream": log_streamer.tailer}.items()
+
+metrics_registry.callback(
+    "ueba_tailer_docs_total", "Documents read by each tailer", ("tailer",),
+    lambda: [((name,), tailer.docs_processed) for name, tailer in _tailers()], kind="counter")
+metrics_registry.callback(
+    "ueba_tailer_lag_seconds", "How far each tailer's cursor trails the newest @timestamp", ("tailer",),
+    lambda: [((name,), tailer.lag_seconds) for name, tailer in _tailers()])
+metrics_registry.callback(
+    "ueba_rule_events_total", "Events evaluated per detection rule", ("rule",),
+    lambda: [((name,), stats.events) for name, stats in _rule_stats()], kind="counter")
+metrics_registry.callback(
+    "ueba_alerts_total", "Alerts sent per rule", ("rule",),
+    lambda: [((name,), stats.alerts) for name, stats in _rule_stats()], kind="counter")
+metrics_registry.callback(
+    "ueba_alerts_suppressed_total", "Alerts dropped by the cooldown per rule", ("rule",),
+    lambda: [((name,), stats.suppressed) for name, stats in _rule_stats()], kind="counter")
+metrics_registry.callback(
+    "ueba_rule_errors_total", "Rule evaluations that raised", ("rule",),
+    lambda: [((name,), stats.errors) for name, stats in _rule_stats()], kind="counter")
+metrics_registry.callback(
+    "ueba_rule_cpu_seconds_total", "CPU time spent per rule", ("rule",),
+    lambda: [((name,), stats.cpu_seconds) for name, stats in _rule_stats()], kind="counter")
+metrics_registry.callback(
+    "ueba_alert_frames_total", "Alert frames by fan-out outcome", ("outcome",),
+    lambda: [((outcome,), getattr(manager.metrics, outcome))
+             for outcome in ("sent", "dropped", "coalesced", "disconnected", "failed")], kind="counter")
+metrics_registry.callback(
+    "ueba_websocket_connections", "Open websocket connections per endpoint", ("endpoint",),
+    lambda: [(("/ws",), len(active_connections)),
+             (("/ws/alert",), len(manager.senders)),
+             (("/ws/logs",), log_streamer.connection_count()),
+             (("/ws/visualizations",), len(visualization_broadcaster.subscribers))])
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    return PlainTextResponse(metrics_registry.render(), media_type="text/plain; version=0.0.4")
+
+
+# Working-hour policy per client_role (WORKING_HOURS_FILE), default for everyone else
+working_hours_policies = WorkingHoursPolicies.load()
+
+def load_client_roles() -> Dict[str, str]:
+    db = SessionLocal()
     try:
-        print("🚀 detect_outside_working_hours started")
+        return {client_id: role for client_id, role in db.query(Clients.id, Clients.client_role) if role}
+    finally:
+        db.close()
 
-        if not es:  # Check if Elasticsearch connection is established
-            print("❌ Elasticsearch connection not established!")
-            return  
+# Worker processes for heavy NumPy scoring, so it never holds this process's GIL
+scoring_pool = ScoringPool()
+
+# Per-client streaming baselines (bytes, flows, destinations, protocol mix)
+behavior_baselines = BaselineRule()
+# Periodic (client, destination) connections, e.g. C2 check-ins
+beaconing = BeaconingRule(pool=scoring_pool)
+# Likely DGA / DNS-tunnel names, scored once per distinct name
+domain_scoring = DomainScoringRule()
+
+# One ingest stream feeds every detection rule; add rules here, not new queries
+detection_pipeline = DetectionPipeline(
+    index=INDEX_NAME,
+    rules=[
+        RestrictedDomainRule(restricted_blocklist),
+        OutsideWorkingHoursRule(working_hours_policies, load_client_roles),
+        behavior_baselines,
+        beaconing,
+        domain_scoring,
+    ],
+    cooldowns=alert_cooldowns,
+    sink=manager.send_alert,
+    root_domains=extract_root_domains,
+)
 
-        while True:
-            print("🔁 Checking for access outside working hours...")
+@app.get("/clients/{client_id}/baseline")
+def client_baseline(client_id: str):
+    validate_client_id(client_id)
+    baseline = behavior_baselines.engine.baseline(client_id)
+    if baseline is None:
+        raise HTTPException(status_code=404, detail="No baseline for this client yet")
+    return baseline
 
-            try:
-                search_query = {
-                    "size": 100,
-                    "_source": ["client_name", "client_id", "destination.domain", "@timestamp"],
-                    "query": {"exists": {"field": "destination.domain"}},
-                    "sort": [{"@timestamp": {"order": "desc"}}]
-                }
-
-                response = es.search(index=INDEX_NAME, body=search_query)  # Query Elasticsearch
-                logs = response.get("hits", {}).get("hits", [])
-        
-                if not logs:
-                    print("⚠️ No logs found in Elasticsearch response")
-                    await asyncio.sleep(200)  # Wait before the next check
-                    continue
-                
-    
-                current_time = time.time()  # Get the current time for alert cooldown
-
-                for log in logs:
-                    source = log.get("_source", {})
-                    timestamp_str = source.get("@timestamp", "")
-                    client_name = source.get("client_name", "Unknown Client")
-                    client_id = source.get("client_id", "Unknown ID")
-
-                   
-
-                    if isinstance(client_id, list):  # Convert client_id if it's a list
-                        client_id = str(client_id)
-
-                    if not timestamp_str:
-                        print(f"⚠️ Missing timestamp for client {client_id}")
-                        continue
-                    
-                    
-
-                    try:
-                        # Check if the timestamp is outside working hours (before 9 AM or after 5 PM IST)
-                        if is_outside_working_hours(timestamp_str):
-                            if client_id not in recent_alerts:
-                                recent_alerts[client_id] = {}
-
-                        
-
-                            last_alert_time = recent_alerts[client_id].get("outside_working_hours", 0)
-                            time_since_last_alert = current_time - last_alert_time
-
-                            if time_since_last_alert > ALERT_COOLDOWN:
-                                alert_message = {
-                                    "type": "warning",
-                                    "message": f"⚠️ {client_name} (ID: {client_id}) accessed outside working hours at {timestamp_str}",
-                                    "timestamp": timestamp_str,
-                                }
-
-                                # Send alert to frontend using the manager
-                                try:
-                                    # Send the alert message to the frontend
-                                    await manager.send_alert(json.dumps(alert_message))
-                                    print("✅ Alert sent to frontend:", alert_message)
-
-                                    # Update the recent_alerts to prevent repeated alerts in the cooldown period
-                                    if client_id not in recent_alerts:
-                                        recent_alerts[client_id] = {}
-                                    recent_alerts[client_id]["outside_working_hours"] = current_time
-                                except Exception as e:
-                                    print(f"❌ Failed to send alert to frontend: {e}")
-                                    print(f"Alert details: {alert_message}")
-                            
-                    except ValueError as e:
-                        print(f"❌ Failed to parse timestamp: {timestamp_str} ({e})")
-                        continue
+rollup_ingestor = RollupIngestor(RollupStore(ROLLUP_DB_FILE))
 
-            except Exception as e:
-                print(f"❌ Error while checking logs: {e}")
+# Byte-volume spikes scored across every client's 30-day 5-minute series (history from the rollups)
+volume_anomaly_job = VolumeAnomalyJob(pool=scoring_pool, rollups=rollup_ingestor)
+# Alerts / cooldown suppressions of the volume scan, reported next to the pipeline's rules
+volume_spike_stats = RuleStats()
 
-            await asyncio.sleep(200)  # Wait 5 minutes before the next check
+async def scan_volume_anomalies():
+    es_call_site.set("volume_anomalies")
+    timer = LoopTimer("volume_anomalies")
+    while True:
+        timer.begin()
+        try:
+            for anomaly in await volume_anomaly_job.run_once(es):
+                # One alert per spike bucket; each run only scores buckets closed since the previous run
+                cooldown_key = ("volume_spike", anomaly["client_id"], anomaly["bucket"])
+                if not alert_cooldowns.check_and_set(cooldown_key):
+                    volume_spike_stats.suppressed += 1
+                else:
+                    volume_spike_stats.alerts += 1
+                    megabytes = anomaly["bytes"] / (1024 * 1024)
+                    manager.send_alert({
+                        "type": "anomaly",
+                        "message": f"📤 {anomaly['client_id']} sent {megabytes:.1f} MB in 5 minutes at {anomaly['bucket']} "
+                                   f"(robust z={anomaly['z']})",
+                        "score": anomaly["z"],
+                        "timestamp": anomaly["bucket"],
+                    }, key=cooldown_key)
+        except Exception as e:
+            volume_spike_stats.errors += 1
+            print(f"❌ Error scanning volume anomalies: {e}")
+        timer.end(VOLUME_ANOMALY_INTERVAL)
+        await asyncio.sleep(VOLUME_ANOMALY_INTERVAL)
 
-    except Exception as e:
-        print(f"🔥 detect_outside_working_hours crashed: {e}")
+# Detect restricted domains, off-hours access, ... from new logs
+async def run_detection():
+    if not es:
+        print("❌ Elasticsearch connection not established!")
+        return
+    es_call_site.set("detection")
+    await detection_pipeline.run(es)
 
 
 @app.websocket("/ws/alert")
@@ -904,216 +811,44 @@ async def websocket_endpoint(websocket: WebSocket):
             await websocket.receive_text()
     except WebSocketDisconnect:
         print(f"ℹ️ Client {websocket.client.host} disconnected")
+    finally:
         manager.disconnect(websocket)
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-@app.websocket("/ws/visualizations")
-async def websocket_endpoint(websocket: WebSocket):
-    await websocket.accept()
+# Persists alert cooldowns so they survive a restart
+async def snapshot_alert_cooldowns():
+    timer = LoopTimer("cooldown_snapshot")
+    while True:
+        await asyncio.sleep(COOLDOWN_SNAPSHOT_INTERVAL)
+        timer.begin()
+        if alert_cooldowns.dirty:
+            try:
+                await asyncio.to_thread(alert_cooldowns.save)
+            except Exception as e:
+                print(f"❌ Error saving alert cooldowns: {e}")
+        timer.end(COOLDOWN_SNAPSHOT_INTERVAL)
 
-    async def fetch_data(initial: bool = False):
+# Folds new proxy-logs documents into the dashboard rollups
+async def run_rollups():
+    es_call_site.set("rollups")
+    timer = LoopTimer("rollups")
+    while True:
+        timer.begin()
+        interval = 1.0
         try:
-            # Shared aggregation structure
-            aggs = {
-                "top_clients": {
-                    "terms": {
-                        "field": "client_id.keyword",
-                        "size": 5,
-                        "order": {"total_bytes": "desc"}
-                    },
-                    "aggs": {
-                        "total_bytes": {
-                            "sum": {"field": "network.bytes"}
-                        }
-                    }
-                },
-                "network_trend": {
-                    "date_histogram": {
-                        "field": "@timestamp",
-                        "fixed_interval": "5m",
-                        "format": "yyyy-MM-dd HH:mm:ss"
-                    },
-                    "aggs": {
-                        "total_bytes": {
-                            "sum": {"field": "network.bytes"}
-                        }
-                    }
-                },
-                "protocol_usage": {
-                    "terms": {
-                        "field": "network.protocol.keyword",
-                        "size": 5,
-                        "order": {"total_bytes": "desc"}
-                    },
-                    "aggs": {
-                        "total_bytes": {
-                            "sum": {"field": "network.bytes"}
-                        }
-                    }
-                },
-                "record_counts_over_time": {
-                    "date_histogram": {
-                        "field": "@timestamp",
-                        "fixed_interval": "12h",
-                        "format": "d MMM yyyy",
-                        "min_doc_count": 0
-                    }
-                },
-                "top_domains": {
-                    "date_histogram": {
-                        "field": "@timestamp",
-                        "fixed_interval": "1d",
-                        "format": "yyyy-MM-dd",
-                        "min_doc_count": 0
-                    },
-                    "aggs": {
-                        "domains": {
-                            "terms": {
-                                "field": "destination.domain.keyword",
-                                "size": 10
-                            },
-                            "aggs": {
-                                "visit_count": {
-                                    "cardinality": {
-                                        "field": "destination.domain.keyword",
-                                        "missing": "unknown"
-                                    }
-                                }
-                            }
-                        }
-                    }
-                }
-            }
+            interval = await rollup_ingestor.step(es)
+        except Exception as e:
+            print(f"❌ Error updating rollups: {e}")
+        timer.end(interval)
+        await asyncio.sleep(interval)
 
-            if initial:
-                initial_query = {
-                    "size": 100,
-                    "query": {
-                        "match_all": {}
-                    },
-                    "sort": [
-                        {"@timestamp": {"order": "asc"}}
-                    ]
-                }
-                initial_response = es.search(index="proxy-logs", body=initial_query)
-
-                if not initial_response["hits"]["hits"]:
-                    return {
-                        "top_clients": [],
-                        "network_trend": [],
-                        "protocol_usage": [],
-                        "record_counts_over_time": [],
-                        "most_visited_domains": []
-                    }
-
-                hits = initial_response["hits"]["hits"]
-                start_time = hits[0]["_source"]["@timestamp"]
-                end_time = hits[-1]["_source"]["@timestamp"]
-
-                query = {
-                    "size": 0,
-                    "query": {
-                        "bool": {
-                            "filter": [
-                                {
-                                    "range": {
-                                        "@timestamp": {
-                                            "gte": start_time,
-                                            "lte": end_time
-                                        }
-                                    }
-                                }
-                            ]
-                        }
-                    },
-                    "aggs": aggs
-                }
-            else:
-                query = {
-                    "size": 0,
-                    "query": {
-                        "bool": {
-                            "filter": [
-                                {
-                                    "range": {
-                                        "@timestamp": {
-                                            "gte": "now-1h",
-                                            "lte": "now"
-                                        }
-                                    }
-                                }
-                            ]
-                        }
-                    },
-                    "aggs": aggs
-                }
-
-            response = es.search(index="proxy-logs", body=query)
-
-            aggregations = response["aggregations"]
-
-            top_clients = [
-                {"client_id": bucket["key"], "bytes": bucket["total_bytes"]["value"]}
-                for bucket in aggregations["top_clients"]["buckets"]
-            ]
-
-            network_trend = [
-                {"timestamp": bucket["key_as_string"], "bytes": bucket["total_bytes"]["value"]}
-                for bucket in aggregations["network_trend"]["buckets"]
-            ]
-
-            protocol_usage = [
-                {"protocol": bucket["key"], "bytes": bucket["total_bytes"]["value"]}
-                for bucket in aggregations["protocol_usage"]["buckets"]
-            ]
-
-            record_counts_over_time = [
-                {
-                    "date": bucket["key_as_string"],
-                    "count": bucket["doc_count"]
-                }
-                for bucket in aggregations["record_counts_over_time"]["buckets"]
-            ]
-
-            most_visited_domains = [
-                {
-                    "month": date_bucket["key_as_string"],
-                    "domains": [
-                        {
-                            "domain": bucket["key"],
-                            "visits": bucket["visit_count"]["value"]
-                        }
-                        for bucket in date_bucket["domains"]["buckets"]
-                    ]
-                }
-                for date_bucket in aggregations["top_domains"]["buckets"]
-            ]
-
-            result = {
-                "top_clients": top_clients,
-                "network_trend": network_trend,
-                "protocol_usage": protocol_usage,
-                "record_counts_over_time": record_counts_over_time,
-                "most_visited_domains": most_visited_domains
-            }
-            # print(f"Sending MainGrid data: {json.dumps({
-            #     'top_clients': top_clients,
-            #     'network_trend': network_trend,
-            #     'protocol_usage': protocol_usage
-            # }, indent=2)}")
-            return result
+visualization_broadcaster = VisualizationBroadcaster(es, rollups=rollup_ingestor)
 
-        except Exception as e:
-            print(f"Elasticsearch error: {str(e)}")
-            return {
-                "top_clients": [],
-                "network_trend": [],
-                "protocol_usage": [],
-                "record_counts_over_time": [],
-                "most_visited_domains": []
-            }
+@app.websocket("/ws/visualizations")
+async def websocket_endpoint(websocket: WebSocket):
+    await websocket.accept()
 
     async def heartbeat():
         """Send custom ping message to keep connection alive."""
@@ -1137,19 +872,16 @@ async def websocket_endpoint(websocket: WebSocket):
 
     try:
         heartbeat_task = asyncio.create_task(heartbeat())
-        data = await fetch_data(initial=True)
-        await websocket.send_json(data)
-
-        while True:
-            data = await fetch_data(initial=False)
-            await websocket.send_json(data)
-            await asyncio.sleep(60)
+        # Snapshots and refreshes come from the shared producer
+        await visualization_broadcaster.subscribe(websocket)
+        await heartbeat_task
 
     except WebSocketDisconnect:
         print("WebSocket disconnected by client")
     except Exception as e:
         print(f"WebSocket error: {str(e)}")
     finally:
+        visualization_broadcaster.unsubscribe(websocket)
         heartbeat_task.cancel()
         try:
             await heartbeat_task
@@ -1162,14 +894,22 @@ async def websocket_endpoint(websocket: WebSocket):
 @app.on_event("startup")
 async def startup_event():
     """Start background tasks when FastAPI starts."""
-    asyncio.create_task(detect_restricted_domains())
-    asyncio.create_task(detect_outside_working_hours())
+    asyncio.create_task(watch_restricted_domains())
+    asyncio.create_task(run_detection())
+    asyncio.create_task(scan_volume_anomalies())
     asyncio.create_task(monitor_client_status())
+    asyncio.create_task(run_rollups())
+    asyncio.create_task(stream_client_logs_live())
+    asyncio.create_task(snapshot_alert_cooldowns())
+    asyncio.create_task(monitor_event_loop())
 
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """Cleanup before shutdown (if needed)."""
+    alert_cooldowns.save()
+    scoring_pool.shutdown()
+    await es.close()
 
 # ✅ Run Server
 if __name__ == "__main__":
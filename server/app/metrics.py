@@ -0,0 +1,210 @@
+"""
+Prometheus text-format metrics for the background loops, ES calls and websockets.
+
+Hand-rolled (the exposition format is a few lines of text) so the hot path
+stays cheap. An observation is one bisect and two in-place additions.
+Buckets are made cumulative only when /metrics is scraped. Numbers the app
+already keeps (rule stats, tailers, fan-out, connection sets) are read by
+callbacks at scrape time instead of being counted a second time.
+"""
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+import asyncio
+import os
+import time
+
+# Seconds; ES round trips and loop iterations
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Seconds a loop or the event loop woke up later than it asked to
+LAG_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+# Event-loop probe period, and lateness beyond which the loop counts as blocked
+LOOP_MONITOR_INTERVAL = float(os.getenv("LOOP_MONITOR_INTERVAL", "0.1"))
+LOOP_BLOCKED_THRESHOLD = 0.01
+
+# Which code path an ES request belongs to; set once at the top of each task or handler
+es_call_site: ContextVar[str] = ContextVar("es_call_site", default="other")
+
+Labels = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _labels(names: Sequence[str], values: Labels, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value) -> str:
+    if isinstance(value, int) and not isinstance(value, bool):
+        return str(value)
+    value = float(value)
+    if value == float("inf"):
+        return "+Inf"
+    return repr(value)
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+
+    def samples(self) -> Iterable[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}", *self.samples()]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, labels: Labels = (), amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self):
+        for labels, value in self._values.items():
+            yield f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}"
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.bounds = tuple(buckets)
+        # labels -> per-bucket (not yet cumulative) counts, the last one being +Inf
+        self._counts: Dict[Labels, List[int]] = {}
+        self._sums: Dict[Labels, float] = {}
+
+    def observe(self, value: float, labels: Labels = ()):
+        counts = self._counts.get(labels)
+        if counts is None:
+            counts = self._counts[labels] = [0] * (len(self.bounds) + 1)
+            self._sums[labels] = 0.0
+        counts[bisect_left(self.bounds, value)] += 1
+        self._sums[labels] += value
+
+    def samples(self):
+        for labels, counts in self._counts.items():
+            cumulative = 0
+            for bound, bucket in zip(self.bounds + (float("inf"),), counts):
+                cumulative += bucket
+                le = 'le="' + _number(bound) + '"'
+                yield f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(self._sums[labels])}"
+            yield f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}"
+
+
+class CallbackMetric(Metric):
+    """A gauge or counter whose values are read from the app's own state at scrape time."""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str], read: Callable[[], Iterable[Tuple[Labels, float]]],
+                 kind: str = "gauge"):
+        super().__init__(name, help, labelnames)
+        self.kind = kind
+        self.read = read
+
+    def samples(self):
+        for labels, value in self.read():
+            if value is not None:
+                yield f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}"
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        if metric.name in self.metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, labelnames, buckets))
+
+    def callback(self, name: str, help: str, labelnames: Sequence[str],
+                 read: Callable[[], Iterable[Tuple[Labels, float]]], kind: str = "gauge") -> CallbackMetric:
+        return self.register(CallbackMetric(name, help, labelnames, read, kind))
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self.metrics.values():
+            try:
+                lines.extend(metric.render())
+            except Exception as e:
+                # One broken callback shouldn't take the whole scrape down
+                lines.append(f"# {metric.name} unavailable: {_escape(e)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+es_request_seconds = registry.histogram(
+    "ueba_es_request_seconds", "Elasticsearch search latency by call site", ("site",))
+es_request_errors = registry.counter(
+    "ueba_es_request_errors_total", "Elasticsearch searches that raised, by call site", ("site",))
+loop_iteration_seconds = registry.histogram(
+    "ueba_loop_iteration_seconds", "Wall time of one background loop iteration", ("loop",))
+loop_lag_seconds = registry.histogram(
+    "ueba_loop_lag_seconds", "How much later than scheduled a background loop iteration started", ("loop",),
+    LAG_BUCKETS)
+event_loop_lag_seconds = registry.histogram(
+    "ueba_event_loop_lag_seconds", "How late a periodic event-loop probe woke up", (), LAG_BUCKETS)
+event_loop_blocked_seconds = registry.counter(
+    "ueba_event_loop_blocked_seconds_total", "Time the event loop was blocked beyond LOOP_BLOCKED_THRESHOLD")
+
+
+class LoopTimer:
+    """
+    Iteration duration and start lag for one background loop.
+
+    Call begin() at the top of each iteration and end(sleep) with the
+    interval about to be slept; the next begin() records how much later than
+    that it actually ran.
+    """
+
+    __slots__ = ("labels", "_started", "_due")
+
+    def __init__(self, loop: str):
+        self.labels = (loop,)
+        self._started = 0.0
+        self._due: Optional[float] = None
+
+    def begin(self):
+        now = time.perf_counter()
+        if self._due is not None:
+            loop_lag_seconds.observe(max(now - self._due, 0.0), self.labels)
+        self._started = now
+
+    def end(self, sleep: float = 0.0):
+        now = time.perf_counter()
+        loop_iteration_seconds.observe(now - self._started, self.labels)
+        self._due = now + sleep
+
+
+async def monitor_event_loop(interval: float = LOOP_MONITOR_INTERVAL):
+    """Probe how late a short sleep wakes up; lateness is time something held the loop."""
+    while True:
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        late = max(time.perf_counter() - started - interval, 0.0)
+        event_loop_lag_seconds.observe(late)
+        if late > LOOP_BLOCKED_THRESHOLD:
+            event_loop_blocked_seconds.inc(amount=late)
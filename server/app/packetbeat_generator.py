@@ -0,0 +1,177 @@
+"""
+Synthetic packetbeat documents for load tests and replay corpora.
+
+A fixed population of clients (client_id, client_name, host, MAC, IP)
+produces flow, DNS, HTTP and TLS events against a Zipf-distributed set of
+destination domains, shaped like the proxy-logs documents the app reads:
+@timestamp, client_id, client_name, destination.domain, network.bytes,
+network.protocol, host.*, source.*, event.*, flow.id, server.domain.
+
+Written as NDJSON it is a corpus for replay.py; fed into a FakeElasticsearch
+(see fake_es.py) it stands in for a live packetbeat pipeline.
+
+    python packetbeat_generator.py --events 100000 --seconds 3600 > corpus.ndjson
+"""
+from itertools import accumulate
+from typing import Dict, List, Optional
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+
+GENERATOR_CLIENTS = 200
+GENERATOR_DOMAINS = 5000
+# Share of each event type; the rest of the fields follow from the type
+EVENT_MIX: Dict[str, float] = {"flow": 0.55, "dns": 0.25, "http": 0.08, "tls": 0.12}
+# Zipf exponent of destination popularity
+DOMAIN_SKEW = 1.1
+# Seconds between feed() batches
+FEED_TICK = 0.1
+
+POPULAR_DOMAINS = (
+    "google.com", "www.google.com", "youtube.com", "microsoft.com", "login.microsoftonline.com",
+    "outlook.office365.com", "github.com", "api.github.com", "slack.com", "zoom.us", "amazonaws.com",
+    "s3.amazonaws.com", "cloudflare.com", "wikipedia.org", "linkedin.com", "chatgpt.com",
+    "example.com", "www.terabox.com", "stackoverflow.com", "windowsupdate.com",
+)
+_WORDS = (
+    "cloud", "data", "shop", "news", "media", "portal", "cdn", "api", "static", "mail",
+    "app", "secure", "login", "store", "files", "sync", "track", "ads", "metrics", "video",
+)
+_SUFFIXES = ("com", "net", "org", "io", "co.in", "ac.in", "de", "co.uk")
+_PLATFORMS = ("windows", "windows", "windows", "darwin", "ubuntu")
+_HTTP_METHODS = ("GET", "GET", "GET", "POST", "PUT")
+_TLS_VERSIONS = ("1.2", "1.3", "1.3")
+
+
+def format_timestamp(epoch_ms: int) -> str:
+    """Packetbeat's @timestamp format, e.g. 2025-03-01T10:15:00.123Z."""
+    return time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(epoch_ms // 1000)) + f".{epoch_ms % 1000:03d}Z"
+
+
+class PacketbeatGenerator:
+    """Reproducible packetbeat-shaped documents for a fixed set of clients and domains."""
+
+    def __init__(self, clients: int = GENERATOR_CLIENTS, domains: int = GENERATOR_DOMAINS,
+                 mix: Optional[Dict[str, float]] = None, seed: Optional[int] = None,
+                 client_prefix: str = "client"):
+        self.rng = random.Random(seed)
+        rng = self.rng
+        self.clients = [
+            {
+                "client_id": f"{client_prefix}-{i:04d}",
+                "client_name": f"{rng.choice(('desktop', 'laptop', 'ws'))}-{i:04d}",
+                "host_id": f"{rng.getrandbits(128):032x}",
+                "platform": rng.choice(_PLATFORMS),
+                "ip": f"10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}",
+                "mac": "-".join(f"{rng.getrandbits(8):02X}" for _ in range(6)),
+            }
+            for i in range(clients)
+        ]
+        self.domains = list(POPULAR_DOMAINS[:domains])
+        while len(self.domains) < domains:
+            word = "".join(rng.sample(_WORDS, rng.randint(1, 2)))
+            self.domains.append(f"{rng.choice(('', 'www.', 'api.', 'cdn.'))}{word}{rng.randint(0, 999)}"
+                                f".{rng.choice(_SUFFIXES)}")
+        self.domain_ips = [f"{rng.randint(11, 223)}.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(1, 254)}"
+                           for _ in self.domains]
+        # Cumulative weights, so each pick is a bisect instead of a pass over every domain
+        self._slots = range(len(self.domains))
+        self._domain_cum = list(accumulate(1.0 / (rank + 1) ** DOMAIN_SKEW for rank in self._slots))
+        mix = mix or EVENT_MIX
+        self._types = list(mix)
+        self._type_cum = list(accumulate(mix[kind] for kind in self._types))
+        self.generated = 0
+
+    def _fill(self, kind: str, doc: dict, domain: str):
+        rng = self.rng
+        if kind == "dns":
+            doc["network"].update(transport="udp", protocol="dns")
+            doc["destination"]["port"] = 53
+            doc["dns"] = {"question": {"name": domain, "type": "A"}, "response_code": "NOERROR"}
+            doc["event"]["action"] = "dns_query"
+        elif kind == "http":
+            doc["network"]["protocol"] = "http"
+            doc["destination"]["port"] = 80
+            doc["http"] = {"request": {"method": rng.choice(_HTTP_METHODS)},
+                           "response": {"status_code": rng.choice((200, 200, 200, 204, 301, 404))}}
+            doc["url"] = {"domain": domain, "path": f"/{rng.choice(_WORDS)}/{rng.randint(1, 9999)}"}
+            doc["server"] = {"domain": domain}
+            doc["event"]["action"] = "http_request"
+        elif kind == "tls":
+            doc["network"]["protocol"] = "tls"
+            doc["destination"]["port"] = 443
+            doc["tls"] = {"version": rng.choice(_TLS_VERSIONS), "client": {"server_name": domain}}
+            doc["server"] = {"domain": domain}
+            doc["event"]["action"] = "tls_handshake"
+        else:
+            doc["destination"]["port"] = rng.choice((443, 443, 80, 8080, 22))
+            doc["flow"] = {"id": f"{rng.getrandbits(64):016x}", "final": rng.random() < 0.3}
+            doc["event"]["action"] = "network_flow"
+
+    def document(self, epoch_ms: int) -> dict:
+        rng = self.rng
+        client = rng.choice(self.clients)
+        kind = rng.choices(self._types, cum_weights=self._type_cum)[0]
+        slot = rng.choices(self._slots, cum_weights=self._domain_cum)[0]
+        domain = self.domains[slot]
+        source_bytes = int(rng.lognormvariate(6.5, 1.2))
+        destination_bytes = int(rng.lognormvariate(8.0, 1.8))
+        doc = {
+            "@timestamp": format_timestamp(epoch_ms),
+            "type": kind,
+            "client_id": client["client_id"],
+            "client_name": client["client_name"],
+            "host": {"id": client["host_id"], "os": {"platform": client["platform"]}},
+            "source": {"ip": client["ip"], "mac": client["mac"], "bytes": source_bytes,
+                       "port": rng.randint(49152, 65535)},
+            "destination": {"ip": self.domain_ips[slot], "domain": domain, "bytes": destination_bytes},
+            "network": {"transport": "tcp", "type": "ipv4", "bytes": source_bytes + destination_bytes},
+            "event": {"dataset": kind, "duration": int(rng.lognormvariate(17, 1.5))},
+        }
+        self._fill(kind, doc, domain)
+        return doc
+
+    def documents(self, count: int, start_ms: float, end_ms: float) -> List[dict]:
+        """`count` documents with @timestamps spread evenly over [start_ms, end_ms), oldest first."""
+        step = (end_ms - start_ms) / count if count else 0
+        self.generated += count
+        return [self.document(int(start_ms + i * step)) for i in range(count)]
+
+
+async def feed(es, generator: PacketbeatGenerator, index: str, rate: float, tick: float = FEED_TICK):
+    """Index `rate` documents per second of wall-clock time into a FakeElasticsearch, until cancelled."""
+    last = time.time()
+    carry = 0.0
+    while True:
+        await asyncio.sleep(tick)
+        now = time.time()
+        carry += (now - last) * rate
+        count = int(carry)
+        carry -= count
+        if count:
+            es.add_documents(index, generator.documents(count, last * 1000, now * 1000))
+        last = now
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=100_000)
+    parser.add_argument("--seconds", type=float, default=3600, help="time span the events cover, ending now")
+    parser.add_argument("--end", type=float, help="epoch seconds of the last event (default: now)")
+    parser.add_argument("--clients", type=int, default=GENERATOR_CLIENTS)
+    parser.add_argument("--domains", type=int, default=GENERATOR_DOMAINS)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    generator = PacketbeatGenerator(clients=args.clients, domains=args.domains, seed=args.seed)
+    end_ms = (args.end if args.end is not None else time.time()) * 1000
+    out = sys.stdout
+    for doc in generator.documents(args.events, end_ms - args.seconds * 1000, end_ms):
+        out.write(json.dumps(doc, separators=(",", ":")) + "\n")
+
+
+if __name__ == "__main__":
+    main()
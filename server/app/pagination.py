@@ -0,0 +1,128 @@
+from typing import List, Optional, Tuple
+import base64
+import binascii
+import json
+
+from elasticsearch import NotFoundError
+
+from es_client import search
+
+# How long an idle point-in-time stays open between page requests
+LOG_PIT_KEEP_ALIVE = "5m"
+
+
+class CursorError(ValueError):
+    """Raised for continuation tokens that are malformed, foreign or expired."""
+
+
+def encode_cursor(state: dict) -> str:
+    raw = json.dumps(state, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(token: str) -> dict:
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        state = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (binascii.Error, ValueError, UnicodeDecodeError):
+        raise CursorError("Malformed cursor")
+    if not isinstance(state, dict) or not _valid_state(state):
+        raise CursorError("Malformed cursor")
+    return state
+
+
+def _valid_state(state: dict) -> bool:
+    after, pit, seen = state.get("after"), state.get("pit"), state.get("seen")
+    if not isinstance(after, list) or not after or not all(isinstance(value, (int, str)) for value in after):
+        return False
+    if pit is not None:
+        return isinstance(pit, str) and len(after) == 2
+    # A first-page cursor: its last @timestamp and the ids already served at it
+    return isinstance(seen, list) and all(isinstance(value, str) for value in seen) and len(after) == 1
+
+
+async def close_pit(es, pit_id: str):
+    try:
+        await es.close_point_in_time(id=pit_id)
+    except Exception:
+        pass  # It expires on its own after LOG_PIT_KEEP_ALIVE
+
+
+async def release_cursor(es, token: str):
+    """Close the point-in-time behind a cursor that won't be followed any further."""
+    try:
+        pit_id = decode_cursor(token).get("pit")
+    except CursorError:
+        return
+    if pit_id:
+        await close_pit(es, pit_id)
+
+
+async def search_after_page(es, index: str, query: dict, size: int, cursor: Optional[str],
+                            scope: str, source=None) -> Tuple[List[dict], Optional[str]]:
+    """
+    Fetch one page of hits, newest first, continuing from an opaque cursor.
+
+    Pages are keyed by search_after instead of an offset, so page N costs
+    the same as page 1 and is not limited by max_result_window. The first
+    page is a plain search on @timestamp: a point-in-time is only opened when
+    a continuation is asked for, so a UI that never scrolls leaves none open.
+    From the second page on, the walk is pinned to that point-in-time (new
+    logs don't shift later pages) with _shard_doc as the tiebreaker (_id is
+    not sortable by default on ES 8); the first page's cursor carries the
+    ids it served at its last @timestamp so the second page skips them. The
+    point-in-time is closed on the last page. `scope` (e.g. the client id)
+    is embedded in the token so it can't be replayed against another query.
+    Returns the hits and the next cursor (None on the last page).
+    """
+    state = decode_cursor(cursor) if cursor else {"scope": scope}
+    if state.get("scope") != scope:
+        raise CursorError("Cursor does not belong to this query")
+
+    body = {"size": size, "query": query, "track_total_hits": False}
+    if source is not None:
+        body["_source"] = source
+
+    if not cursor:
+        body["sort"] = [{"@timestamp": {"order": "desc"}}]
+        hits = (await search(es, index, body)).get("hits", {}).get("hits", [])
+        if len(hits) < size:
+            return hits, None
+        last = hits[-1]["sort"]
+        seen = [hit["_id"] for hit in hits if hit["sort"] == last]
+        return hits, encode_cursor({"scope": scope, "after": last, "seen": seen})
+
+    pit_id = state.get("pit")
+    seen = set(state.get("seen") or ())
+    opened = pit_id is None
+    if opened:
+        response = await es.open_point_in_time(index=index, keep_alive=LOG_PIT_KEEP_ALIVE)
+        pit_id = response["id"]
+        body["query"] = {"bool": {"filter": [
+            query, {"range": {"@timestamp": {"lte": state["after"][0], "format": "epoch_millis"}}},
+        ]}}
+        body["size"] = size + len(seen)
+    else:
+        body["search_after"] = state["after"]
+    body["pit"] = {"id": pit_id, "keep_alive": LOG_PIT_KEEP_ALIVE}
+    body["sort"] = [{"@timestamp": {"order": "desc"}}, {"_shard_doc": {"order": "desc"}}]
+
+    try:
+        # The index is implied by the point-in-time
+        response = await search(es, None, body)
+    except Exception as e:
+        if opened:
+            await close_pit(es, pit_id)
+        elif isinstance(e, NotFoundError):
+            raise CursorError("Cursor expired")
+        raise
+
+    raw_hits = response.get("hits", {}).get("hits", [])
+    pit_id = response.get("pit_id", pit_id)
+    hits = [hit for hit in raw_hits if hit["_id"] not in seen][:size] if seen else raw_hits
+
+    if len(raw_hits) < body["size"]:
+        await close_pit(es, pit_id)
+        return hits, None
+
+    return hits, encode_cursor({"scope": scope, "after": hits[-1]["sort"], "pit": pit_id})
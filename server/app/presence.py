@@ -0,0 +1,90 @@
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Optional
+import time
+
+from es_client import search
+
+PRESENCE_INDEX = "proxy-logs"
+PRESENCE_CLIENT_FIELD = "client_id.keyword"
+PRESENCE_TIMESTAMP_FIELD = "@timestamp"
+
+# A client is "Online" if it produced a log within this window
+ONLINE_WINDOW_SECONDS = 5 * 60
+# How far back the aggregation looks for last-seen times
+PRESENCE_LOOKBACK = "now-1d"
+# Buckets per composite aggregation page
+PRESENCE_PAGE_SIZE = 1000
+
+
+class PresenceEngine:
+    """
+    Keeps an in-memory last-seen table for every client.
+
+    One composite terms/max(@timestamp) aggregation (paged with after_key)
+    replaces the per-client searches, so readers never hit Elasticsearch.
+    """
+
+    def __init__(self, index: str = PRESENCE_INDEX, online_window: int = ONLINE_WINDOW_SECONDS):
+        self.index = index
+        self.online_window = online_window
+        self.last_seen: Dict[str, float] = {}  # client_id -> epoch seconds
+        self.refreshed_at: Optional[float] = None
+
+    def build_query(self, after_key: Optional[dict] = None) -> dict:
+        composite = {
+            "size": PRESENCE_PAGE_SIZE,
+            "sources": [{"client_id": {"terms": {"field": PRESENCE_CLIENT_FIELD}}}],
+        }
+        if after_key:
+            composite["after"] = after_key
+
+        return {
+            "size": 0,
+            "query": {"range": {PRESENCE_TIMESTAMP_FIELD: {"gte": PRESENCE_LOOKBACK}}},
+            "aggs": {
+                "clients": {
+                    "composite": composite,
+                    "aggs": {"last_seen": {"max": {"field": PRESENCE_TIMESTAMP_FIELD}}},
+                }
+            },
+        }
+
+    async def refresh(self, es) -> int:
+        """Reload last-seen times for all clients. Returns the number of clients seen."""
+        seen: Dict[str, float] = {}
+        after_key = None
+
+        while True:
+            response = await search(es, self.index, self.build_query(after_key))
+            agg = response["aggregations"]["clients"]
+
+            for bucket in agg["buckets"]:
+                value = bucket["last_seen"]["value"]
+                if value is not None:
+                    seen[bucket["key"]["client_id"]] = value / 1000.0
+
+            after_key = agg.get("after_key")
+            if not after_key or len(agg["buckets"]) < PRESENCE_PAGE_SIZE:
+                break
+
+        # Keep older last-seen values for clients that fell out of the lookback
+        self.last_seen.update(seen)
+        self.refreshed_at = time.time()
+        return len(seen)
+
+    def status(self, client_id: str, now: Optional[float] = None) -> str:
+        last_seen = self.last_seen.get(client_id)
+        if last_seen is None:
+            return "Offline"
+        now = time.time() if now is None else now
+        return "Online" if now - last_seen <= self.online_window else "Offline"
+
+    def statuses(self, client_ids: Iterable[str]) -> Dict[str, str]:
+        now = time.time()
+        return {client_id: self.status(client_id, now) for client_id in client_ids}
+
+    def last_seen_at(self, client_id: str) -> Optional[datetime]:
+        last_seen = self.last_seen.get(client_id)
+        if last_seen is None:
+            return None
+        return datetime.fromtimestamp(last_seen, tz=timezone.utc)
@@ -0,0 +1,229 @@
+"""
+Replay a recorded NDJSON corpus of packetbeat documents through the detection rules.
+
+Each line is either a bare document (with @timestamp) or an ES hit
+({"_id": ..., "_source": {...}}). By default documents are fed straight
+into a DetectionPipeline in @timestamp order, as fast as they normalize;
+with --es-url the corpus is bulk-indexed into a scratch index on that
+(local) cluster and read back through the pipeline's own LogTailer, so the
+query path is exercised too. Cooldowns run on event time.
+
+Reports events/s, alerts per rule and per-rule CPU; --json prints the
+same as one machine-readable object, --alerts-out writes every alert sent.
+
+    python replay.py corpus.ndjson --blocklist restricted_domains.csv
+    python replay.py corpus.ndjson --es-url http://localhost:9200 --json
+"""
+from collections import Counter
+from datetime import datetime
+from typing import Dict, List, Optional
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+from baselines import BaselineRule
+from beaconing import BeaconingRule
+from cooldown import CooldownStore
+from detection import DetectionPipeline, Rule
+from domain_scoring import DomainScoringRule
+from domains import RestrictedDomainBlocklist, extract_root_domains
+from rules import OutsideWorkingHoursRule, RestrictedDomainRule
+from tailer import TAIL_BATCH_SIZE
+from working_hours import WORKING_HOURS_FILE, WorkingHoursPolicies
+
+REPLAY_COOLDOWN = 300
+REPLAY_BULK_CHUNK = 5000
+
+
+def _epoch_ms(value) -> int:
+    if isinstance(value, (int, float)):
+        return int(value)
+    return int(datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp() * 1000)
+
+
+def load_corpus(path: str) -> List[dict]:
+    """Corpus lines as tailer-style hits ({_id, _source, sort: [epoch ms]}), oldest first."""
+    hits = []
+    with open(path, encoding="utf-8") as file:
+        for number, line in enumerate(file, 1):
+            line = line.strip()
+            if not line:
+                continue
+            doc = json.loads(line)
+            source = doc.get("_source", doc)
+            hits.append({
+                "_id": str(doc.get("_id", number)),
+                "_source": source,
+                "sort": [_epoch_ms(source["@timestamp"])],
+            })
+    hits.sort(key=lambda hit: hit["sort"][0])
+    return hits
+
+
+def build_rules(blocklist_path: Optional[str], working_hours_file: Optional[str],
+                roles: Dict[str, str]) -> List[Rule]:
+    """The production rule set, minus its live dependencies (DB roles, scoring pool)."""
+    blocklist = RestrictedDomainBlocklist(blocklist_path or os.devnull)
+    if blocklist_path:
+        blocklist.reload()
+    hours = OutsideWorkingHoursRule(WorkingHoursPolicies.load(working_hours_file))
+    hours.roles = roles
+    return [
+        RestrictedDomainRule(blocklist),
+        hours,
+        BaselineRule(),
+        BeaconingRule(),
+        DomainScoringRule(),
+    ]
+
+
+class Replay:
+    """Drives one DetectionPipeline over a corpus and collects what it sends."""
+
+    def __init__(self, rules: List[Rule], index: str = "replay", batch_size: int = TAIL_BATCH_SIZE,
+                 cooldown: float = REPLAY_COOLDOWN, alerts_out=None):
+        self.now_ms = 0
+        self.alerts_by_key: Counter = Counter()
+        self.alerts_out = alerts_out
+        self.pipeline = DetectionPipeline(
+            index=index,
+            rules=rules,
+            cooldowns=CooldownStore(ttl=cooldown, path=None),
+            sink=self._sink,
+            root_domains=extract_root_domains,
+            clock=lambda: self.now_ms / 1000,
+        )
+        self.pipeline.tailer.batch_size = batch_size
+        self.batch_size = batch_size
+
+    def _sink(self, payload: dict, key):
+        self.alerts_by_key[key[0] if isinstance(key, tuple) else key] += 1
+        if self.alerts_out is not None:
+            self.alerts_out.write(json.dumps(dict(payload, event_time=self.now_ms), default=str) + "\n")
+
+    async def run_direct(self, hits: List[dict]):
+        for lo in range(0, len(hits), self.batch_size):
+            batch = hits[lo:lo + self.batch_size]
+            self.now_ms = batch[-1]["sort"][0]
+            for rule in self.pipeline.rules:
+                await rule.prepare()
+            self.pipeline.process(self.pipeline.normalize(batch))
+            self.pipeline.collect()
+
+    async def run_es(self, es):
+        """Tail the (already indexed) corpus from the beginning until a poll comes back empty."""
+        self.pipeline.tailer.cursor_ms = 0
+        while True:
+            await self.pipeline.prepare()
+            hits = await self.pipeline.poll(es)
+            if hits:
+                # Like run_direct: the batch is evaluated at the time of its newest event
+                self.now_ms = hits[-1]["sort"][0]
+            self.pipeline.ingest(hits)
+            if not hits:
+                break
+
+    def report(self, events: int, seconds: float, load_seconds: float) -> dict:
+        stats = self.pipeline.stats()
+        return {
+            "events": events,
+            "load_seconds": round(load_seconds, 3),
+            "seconds": round(seconds, 3),
+            "events_per_second": round(events / seconds, 1) if seconds else None,
+            "alerts": sum(self.alerts_by_key.values()),
+            "alerts_by_type": dict(self.alerts_by_key),
+            "ingest": stats["ingest"],
+            "rules": stats["rules"],
+        }
+
+
+async def index_corpus(es, index: str, hits: List[dict]):
+    from elasticsearch.helpers import async_bulk
+
+    actions = ({"_index": index, "_id": hit["_id"], "_source": hit["_source"]} for hit in hits)
+    await async_bulk(es, actions, chunk_size=REPLAY_BULK_CHUNK, refresh="wait_for")
+
+
+def print_report(report: dict):
+    print(f"events   {report['events']:,}  in {report['seconds']:.2f}s  "
+          f"({report['events_per_second']:,.0f} events/s, load {report['load_seconds']:.2f}s)")
+    print(f"alerts   {report['alerts']}  {report['alerts_by_type']}")
+    print(f"{'stage':<24}{'cpu s':>10}{'us/event':>10}{'alerts':>8}{'suppr.':>8}{'errors':>8}")
+    stages = [("ingest (normalize)", report["ingest"])] + list(report["rules"].items())
+    for name, stats in stages:
+        print(f"{name:<24}{stats['cpu_seconds']:>10.3f}{stats['cpu_us_per_event'] or 0:>10.2f}"
+              f"{stats['alerts']:>8}{stats['suppressed']:>8}{stats['errors']:>8}")
+
+
+async def main_async(args) -> dict:
+    started = time.perf_counter()
+    hits = load_corpus(args.corpus)
+    load_seconds = time.perf_counter() - started
+    roles = {}
+    if args.roles:
+        with open(args.roles, encoding="utf-8") as file:
+            roles = json.load(file)
+
+    alerts_out = open(args.alerts_out, "w", encoding="utf-8") if args.alerts_out else None
+    try:
+        rules = build_rules(args.blocklist, args.working_hours, roles)
+        if args.es_url:
+            from es_client import create_es_client
+
+            es = create_es_client(args.es_url, args.es_user, args.es_password)
+            index = args.index or f"replay-{int(time.time())}"
+            try:
+                await index_corpus(es, index, hits)
+                replay = Replay(rules, index=index, batch_size=args.batch_size, cooldown=args.cooldown,
+                                alerts_out=alerts_out)
+                started = time.perf_counter()
+                await replay.run_es(es)
+                seconds = time.perf_counter() - started
+                if not args.keep_index:
+                    await es.indices.delete(index=index)
+            finally:
+                await es.close()
+        else:
+            replay = Replay(rules, batch_size=args.batch_size, cooldown=args.cooldown, alerts_out=alerts_out)
+            started = time.perf_counter()
+            await replay.run_direct(hits)
+            seconds = time.perf_counter() - started
+    finally:
+        if alerts_out is not None:
+            alerts_out.close()
+    return replay.report(len(hits), seconds, load_seconds)
+
+
+def parse_args(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("corpus", help="NDJSON file of packetbeat documents or ES hits")
+    parser.add_argument("--blocklist", help="restricted-domain CSV (default: none)")
+    parser.add_argument("--working-hours", default=WORKING_HOURS_FILE, help="working-hour policy JSON")
+    parser.add_argument("--roles", help="JSON object of client_id -> client_role")
+    parser.add_argument("--batch-size", type=int, default=TAIL_BATCH_SIZE)
+    parser.add_argument("--cooldown", type=float, default=REPLAY_COOLDOWN, help="alert cooldown in event-time seconds")
+    parser.add_argument("--alerts-out", help="write every alert sent as NDJSON")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    parser.add_argument("--es-url", help="replay through this ES cluster instead of directly")
+    parser.add_argument("--es-user", default="elastic")
+    parser.add_argument("--es-password", default="")
+    parser.add_argument("--index", help="scratch index for --es-url (default: replay-<epoch>)")
+    parser.add_argument("--keep-index", action="store_true")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None):
+    args = parse_args(argv)
+    report = asyncio.run(main_async(args))
+    if args.json:
+        json.dump(report, sys.stdout)
+        print()
+    else:
+        print_report(report)
+
+
+if __name__ == "__main__":
+    main()
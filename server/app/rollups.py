@@ -0,0 +1,321 @@
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List, Optional, Tuple
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from data_dir import DATA_DIR, ensure_parent
+from tailer import LogTailer
+
+ROLLUP_INDEX = "proxy-logs"
+ROLLUP_DB_FILE = os.getenv("ROLLUP_DB_FILE", os.path.join(DATA_DIR, "rollups.sqlite3"))
+ROLLUP_RETENTION_DAYS = int(os.getenv("ROLLUP_RETENTION_DAYS", "30"))
+ROLLUP_BATCH_SIZE = 2000
+
+# Buckets are kept at two resolutions: 5-minute for trends and window edges,
+# daily so that long ranges read ~1 row per key per day instead of 288
+BUCKET_SECONDS = 300
+DAY_SECONDS = 86400
+HALF_DAY_SECONDS = 43200
+
+# "total" has a single empty key and carries overall bytes/doc counts
+DIMENSIONS = ("total", "client", "protocol", "domain")
+ROLLUP_SOURCE_FIELDS = ["@timestamp", "client_id", "network.bytes", "network.protocol", "destination.domain"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS rollup (
+    resolution INTEGER NOT NULL,
+    dimension TEXT NOT NULL,
+    bucket INTEGER NOT NULL,
+    key TEXT NOT NULL,
+    bytes INTEGER NOT NULL,
+    docs INTEGER NOT NULL,
+    PRIMARY KEY (resolution, dimension, bucket, key)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS rollup_state (
+    name TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+UPSERT = """
+INSERT INTO rollup (resolution, dimension, bucket, key, bytes, docs) VALUES (?, ?, ?, ?, ?, ?)
+ON CONFLICT (resolution, dimension, bucket, key)
+DO UPDATE SET bytes = bytes + excluded.bytes, docs = docs + excluded.docs
+"""
+
+
+def _first(value):
+    if isinstance(value, list):
+        return value[0] if value else None
+    return value
+
+
+def _hit_epoch_seconds(hit: dict) -> Optional[float]:
+    sort = hit.get("sort")
+    if sort:
+        return sort[0] / 1000.0
+    timestamp = hit.get("_source", {}).get("@timestamp")
+    if not timestamp:
+        return None
+    return datetime.fromisoformat(timestamp.replace("Z", "+00:00")).timestamp()
+
+
+def _fmt(epoch: int, pattern: str) -> str:
+    return datetime.fromtimestamp(epoch, tz=timezone.utc).strftime(pattern)
+
+
+def _fmt_day_month_year(epoch: int) -> str:
+    # Matches the ES "d MMM yyyy" format (no zero padding on the day)
+    moment = datetime.fromtimestamp(epoch, tz=timezone.utc)
+    return f"{moment.day} {moment.strftime('%b %Y')}"
+
+
+class RollupStore:
+    """
+    SQLite-backed store of pre-aggregated bytes/doc counts per 5-minute and
+    per-day bucket, for the total and per client, protocol and domain.
+    The tailer cursor is committed in the same transaction as the counts,
+    so a restart resumes without double counting.
+    """
+
+    def __init__(self, path: str = ROLLUP_DB_FILE):
+        self.path = path
+        self._conn = sqlite3.connect(ensure_parent(path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._lock = threading.Lock()
+
+    def fold(self, hits: List[dict], cursor: Optional[dict] = None) -> int:
+        """Add a batch of raw log hits into the buckets. Returns the number of docs folded."""
+        counts: Dict[Tuple[int, str, int, str], List[int]] = defaultdict(lambda: [0, 0])
+        folded = 0
+
+        for hit in hits:
+            epoch = _hit_epoch_seconds(hit)
+            if epoch is None:
+                continue
+            source = hit.get("_source", {})
+            network = source.get("network", {})
+            nbytes = _first(network.get("bytes")) or 0
+            keys = (
+                ("total", ""),
+                ("client", _first(source.get("client_id"))),
+                ("protocol", _first(network.get("protocol"))),
+                ("domain", _first(source.get("destination", {}).get("domain"))),
+            )
+
+            bucket = int(epoch) - int(epoch) % BUCKET_SECONDS
+            day = int(epoch) - int(epoch) % DAY_SECONDS
+            for dimension, key in keys:
+                if key is None:
+                    continue  # Same as a terms aggregation: docs without the field are skipped
+                for resolution, start in ((BUCKET_SECONDS, bucket), (DAY_SECONDS, day)):
+                    entry = counts[(resolution, dimension, start, str(key))]
+                    entry[0] += int(nbytes)
+                    entry[1] += 1
+            folded += 1
+
+        rows = [(*key, value[0], value[1]) for key, value in counts.items()]
+        with self._lock, self._conn:
+            self._conn.executemany(UPSERT, rows)
+            if cursor is not None:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO rollup_state (name, value) VALUES ('cursor', ?)",
+                    (json.dumps(cursor),),
+                )
+        return folded
+
+    def load_cursor(self) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM rollup_state WHERE name = 'cursor'").fetchone()
+        return json.loads(row[0]) if row else None
+
+    def prune(self, retention_days: int = ROLLUP_RETENTION_DAYS) -> int:
+        cutoff = int(time.time()) - retention_days * DAY_SECONDS
+        with self._lock, self._conn:
+            return self._conn.execute("DELETE FROM rollup WHERE bucket < ?", (cutoff - cutoff % DAY_SECONDS,)).rowcount
+
+    def oldest_bucket(self) -> Optional[int]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT MIN(bucket) FROM rollup WHERE resolution = ? AND dimension = 'total'", (BUCKET_SECONDS,)
+            ).fetchone()
+        return row[0]
+
+    def _query(self, sql: str, params: tuple) -> list:
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def iter_client_series(self, start: int, end: int, page: int = 10000) -> Iterator[List[Tuple[str, int, int]]]:
+        """
+        (client_id, 5-minute bucket start, bytes) over [start, end), `page` rows at a time.
+
+        Reads on a connection of its own: WAL lets it run next to fold()
+        without holding the store's lock for the whole scan.
+        """
+        conn = sqlite3.connect(self.path)
+        try:
+            cursor = conn.execute(
+                "SELECT key, bucket, bytes FROM rollup "
+                "WHERE resolution = ? AND dimension = 'client' AND bucket >= ? AND bucket < ?",
+                (BUCKET_SECONDS, start, end),
+            )
+            while True:
+                rows = cursor.fetchmany(page)
+                if not rows:
+                    break
+                yield rows
+        finally:
+            conn.close()
+
+    def _split_days(self, start: int, end: int):
+        """Whole days inside [start, end) are read from the daily tier, the edges from 5-minute buckets."""
+        first_day = -(-start // DAY_SECONDS) * DAY_SECONDS
+        last_day = end - end % DAY_SECONDS
+        if last_day <= first_day:
+            return None, [(start, end)]
+        return (first_day, last_day), [(start, first_day), (last_day, end)]
+
+    def _range_filter(self, start: int, end: int) -> Tuple[str, tuple]:
+        days, edges = self._split_days(start, end)
+        clauses, params = [], []
+        if days:
+            clauses.append("(resolution = ? AND bucket >= ? AND bucket < ?)")
+            params += [DAY_SECONDS, days[0], days[1]]
+        for edge_start, edge_end in edges:
+            if edge_end > edge_start:
+                clauses.append("(resolution = ? AND bucket >= ? AND bucket < ?)")
+                params += [BUCKET_SECONDS, edge_start, edge_end]
+        return "(" + " OR ".join(clauses or ["0"]) + ")", tuple(params)
+
+    def top_keys(self, dimension: str, start: int, end: int, limit: int) -> List[Tuple[str, int]]:
+        where, params = self._range_filter(start, end)
+        return self._query(
+            f"SELECT key, SUM(bytes) AS total FROM rollup WHERE dimension = ? AND {where} "
+            "GROUP BY key ORDER BY total DESC LIMIT ?",
+            (dimension, *params, limit),
+        )
+
+    def series(self, start: int, end: int, interval: int) -> List[Tuple[int, int, int]]:
+        """
+        (bucket_start, bytes, docs) for the total, regrouped to `interval` seconds.
+
+        Whole-day intervals read complete days from the daily tier, so only
+        the partial days at either end of the range touch 5-minute buckets.
+        """
+        if interval % DAY_SECONDS == 0:
+            where, params = self._range_filter(start, end)
+        else:
+            where, params = "resolution = ? AND bucket >= ? AND bucket < ?", (BUCKET_SECONDS, start, end)
+        return self._query(
+            f"SELECT bucket - bucket % ?, SUM(bytes), SUM(docs) FROM rollup WHERE dimension = 'total' AND {where} "
+            "GROUP BY 1 ORDER BY 1",
+            (interval, *params),
+        )
+
+    def top_keys_per_day(self, dimension: str, start: int, end: int, limit: int) -> Dict[int, List[str]]:
+        where, params = self._range_filter(start, end)
+        rows = self._query(
+            "SELECT day, key FROM ("
+            "  SELECT day, key, ROW_NUMBER() OVER (PARTITION BY day ORDER BY total DESC, key) AS rank FROM ("
+            f"    SELECT bucket - bucket % ? AS day, key, SUM(docs) AS total FROM rollup WHERE dimension = ? AND {where} "
+            "    GROUP BY 1, key"
+            "  )"
+            ") WHERE rank <= ? ORDER BY day, rank",
+            (DAY_SECONDS, dimension, *params, limit),
+        )
+        per_day: Dict[int, List[str]] = defaultdict(list)
+        for day, key in rows:
+            per_day[day].append(key)
+        return per_day
+
+    def dashboard(self, start: int, end: int) -> dict:
+        """Build the /ws/visualizations payload for [start, end) from the buckets."""
+
+        def filled(rows, interval):
+            # date_histogram returns empty buckets between the first and last hit
+            if not rows:
+                return []
+            by_bucket = {row[0]: row for row in rows}
+            return [by_bucket.get(b, (b, 0, 0)) for b in range(rows[0][0], rows[-1][0] + interval, interval)]
+
+        trend = filled(self.series(start, end, BUCKET_SECONDS), BUCKET_SECONDS)
+        half_days = filled(self.series(start, end, HALF_DAY_SECONDS), HALF_DAY_SECONDS)
+        days = filled(self.series(start, end, DAY_SECONDS), DAY_SECONDS)
+        domains_per_day = self.top_keys_per_day("domain", start, end, 10)
+
+        return {
+            "top_clients": [
+                {"client_id": key, "bytes": total} for key, total in self.top_keys("client", start, end, 5)
+            ],
+            "network_trend": [
+                {"timestamp": _fmt(bucket, "%Y-%m-%d %H:%M:%S"), "bytes": nbytes} for bucket, nbytes, _ in trend
+            ],
+            "protocol_usage": [
+                {"protocol": key, "bytes": total} for key, total in self.top_keys("protocol", start, end, 5)
+            ],
+            "record_counts_over_time": [
+                {"date": _fmt_day_month_year(bucket), "count": docs} for bucket, _, docs in half_days
+            ],
+            "most_visited_domains": [
+                {
+                    "month": _fmt(day, "%Y-%m-%d"),
+                    # Same as the ES cardinality-of-own-key sub-aggregation: one per listed domain
+                    "domains": [{"domain": domain, "visits": 1} for domain in domains_per_day.get(day, [])],
+                }
+                for day, _, _ in days
+            ],
+        }
+
+
+class RollupIngestor:
+    """Tails proxy-logs and folds every new document into a RollupStore."""
+
+    def __init__(self, store: RollupStore, index: str = ROLLUP_INDEX):
+        self.store = store
+        cursor = store.load_cursor()
+        if cursor:
+            start_ms = cursor["cursor_ms"]
+        else:
+            # Empty store: backfill the retention window incrementally
+            start_ms = int((time.time() - ROLLUP_RETENTION_DAYS * DAY_SECONDS) * 1000)
+
+        self.tailer = LogTailer(index=index, source=ROLLUP_SOURCE_FIELDS,
+                                batch_size=ROLLUP_BATCH_SIZE, start_ms=start_ms)
+        if cursor:
+            self.tailer.boundary_ids = set(cursor["boundary_ids"])
+        self.last_pruned = 0.0
+
+    async def step(self, es) -> float:
+        """Fold one batch. Returns how long to wait before the next step."""
+        hits = await self.tailer.poll(es)
+        # The upserts and the prune are SQLite writes; keep them off the event loop
+        if hits:
+            await asyncio.to_thread(self.store.fold, hits, {
+                "cursor_ms": self.tailer.cursor_ms,
+                "boundary_ids": sorted(self.tailer.boundary_ids),
+            })
+        if time.time() - self.last_pruned > 3600:
+            await asyncio.to_thread(self.store.prune)
+            self.last_pruned = time.time()
+        return self.tailer.next_interval()
+
+    @property
+    def caught_up(self) -> bool:
+        """True once the backfill has reached the head of the index."""
+        return self.tailer.last_poll_at is not None and self.tailer.lag_seconds < BUCKET_SECONDS
+
+    def dashboard(self, initial: bool = False) -> dict:
+        end = int(time.time()) + 1
+        if initial:
+            start = self.store.oldest_bucket() or end - 3600
+        else:
+            start = end - 3600
+            start -= start % BUCKET_SECONDS  # Whole buckets, like now-1h on a 5m histogram
+        return self.store.dashboard(start, end)
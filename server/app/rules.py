@@ -0,0 +1,96 @@
+from typing import Callable, Dict, List, Optional
+import asyncio
+import time
+
+import numpy as np
+
+from detection import Alert, EventBatch, Rule
+from domains import RestrictedDomainBlocklist
+from working_hours import WorkingHoursPolicies
+
+# Seconds between reloads of the client_id -> client_role map
+CLIENT_ROLE_REFRESH_INTERVAL = 60
+
+
+class RestrictedDomainRule(Rule):
+    """Alerts when a client reaches a root domain on the restricted blocklist."""
+
+    name = "restricted_domain"
+    query = {"exists": {"field": "destination.domain"}}
+
+    def __init__(self, blocklist: RestrictedDomainBlocklist):
+        self.blocklist = blocklist
+
+    def evaluate(self, batch: EventBatch) -> List[Alert]:
+        has_domain = batch.root_domain != ""
+        if not has_domain.any():
+            return []
+
+        surfed = list(dict.fromkeys(zip(batch.client_name[has_domain], batch.root_domain[has_domain])))
+
+        # Check if the domain is restricted against one consistent snapshot
+        snapshot = self.blocklist.snapshot
+        matches = snapshot.match_many(domain for _, domain in surfed)
+
+        alerts = []
+        for (client, domain), matched in zip(surfed, matches):
+            if matched:
+                alerts.append(Alert(("restricted_domain", client, domain), {
+                    "type": "alert",
+                    "message": f"🚨 ALERT: {client} accessed a restricted domain: {domain}",
+                    "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+                }))
+        return alerts
+
+
+class OutsideWorkingHoursRule(Rule):
+    """
+    Alerts when a client is active outside its role's working hours.
+
+    The pushdown filter from WorkingHoursPolicies becomes this rule's query,
+    so ES only returns events it could alert on (unless another rule asks
+    for more); the exact per-role check is vectorized in evaluate().
+    """
+
+    name = "outside_working_hours"
+
+    def __init__(self, policies: WorkingHoursPolicies, load_roles: Optional[Callable[[], Dict[str, str]]] = None):
+        self.policies = policies
+        self.load_roles = load_roles
+        self.roles: Dict[str, str] = {}
+        self.roles_loaded_at: Optional[float] = None
+        self.query = {"bool": {"filter": [{"exists": {"field": "destination.domain"}}, policies.pushdown_query()]}}
+        self.runtime_mappings = policies.runtime_mappings()
+
+    async def prepare(self):
+        if self.load_roles is None:
+            return
+        if self.roles_loaded_at is None or time.monotonic() - self.roles_loaded_at > CLIENT_ROLE_REFRESH_INTERVAL:
+            self.roles = await asyncio.to_thread(self.load_roles)
+            self.roles_loaded_at = time.monotonic()
+
+    def evaluate(self, batch: EventBatch) -> List[Alert]:
+        has_domain = batch.domain != ""
+        if not has_domain.any():
+            return []
+
+        outside = np.zeros(len(batch), dtype=bool)
+        outside[has_domain] = self.policies.evaluate(
+            batch.timestamp_ms[has_domain], batch.client_id[has_domain], self.roles,
+        )
+
+        alerts = []
+        seen = set()
+        for i in np.flatnonzero(outside):
+            client_id = batch.client_id[i]
+            if client_id in seen:
+                continue
+            seen.add(client_id)
+            timestamp = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(batch.timestamp_ms[i] / 1000))
+            timestamp_str = f"{timestamp}.{batch.timestamp_ms[i] % 1000:03d}Z"
+            alerts.append(Alert(("outside_working_hours", client_id), {
+                "type": "warning",
+                "message": f"⚠️ {batch.client_name[i]} (ID: {client_id}) accessed outside working hours at {timestamp_str}",
+                "timestamp": timestamp_str,
+            }))
+        return alerts
@@ -0,0 +1,214 @@
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Callable, Dict, List, Optional, Tuple
+import asyncio
+import multiprocessing
+import os
+import time
+
+import numpy as np
+
+# Worker processes for CPU-heavy scoring (0 = run in a thread of this process instead)
+SCORING_POOL_SIZE = int(os.getenv("SCORING_POOL_SIZE", str(max(1, (os.cpu_count() or 2) // 2))))
+# Rows of a columnar batch handed to one worker task
+SCORING_BATCH_ROWS = int(os.getenv("SCORING_BATCH_ROWS", "2048"))
+
+# name -> (dtype, shape, byte offset) of each column inside the shared block
+Layout = Dict[str, Tuple[str, Tuple[int, ...], int]]
+
+
+def _allocate(specs: Dict[str, Tuple[Tuple[int, ...], np.dtype]]) -> Tuple[shared_memory.SharedMemory, Layout]:
+    """One new zero-filled shared-memory block holding a column per (shape, dtype), 64-byte aligned."""
+    layout: Layout = {}
+    size = 0
+    for name, (shape, dtype) in specs.items():
+        dtype = np.dtype(dtype)
+        if dtype.hasobject:
+            raise TypeError(f"Column {name} has dtype {dtype}; only fixed-size dtypes can be shared")
+        layout[name] = (dtype.str, tuple(shape), size)
+        size += (int(np.prod(shape, dtype=np.int64)) * dtype.itemsize + 63) // 64 * 64
+    return shared_memory.SharedMemory(create=True, size=max(size, 1)), layout
+
+
+def _pack(columns: Dict[str, np.ndarray]) -> Tuple[shared_memory.SharedMemory, Layout]:
+    """Copy columns into one new shared-memory block."""
+    block, layout = _allocate({name: (column.shape, column.dtype) for name, column in columns.items()})
+    for name, column in columns.items():
+        dtype, shape, offset = layout[name]
+        np.ndarray(shape, dtype=dtype, buffer=block.buf, offset=offset)[...] = column
+    return block, layout
+
+
+class SharedColumns:
+    """
+    Zero-filled columns to build a batch in place, for map_rows() to use without copying.
+
+    Backed by a shared-memory block for a process pool, by plain arrays
+    otherwise. Drop every reference to `arrays` before release(): a block
+    can't be closed while NumPy views of it are alive.
+    """
+
+    def __init__(self, specs: Dict[str, Tuple[Tuple[int, ...], np.dtype]], shared: bool = True):
+        self.block: Optional[shared_memory.SharedMemory] = None
+        self.layout: Layout = {}
+        if shared:
+            self.block, self.layout = _allocate(specs)
+            self.arrays = {
+                name: np.ndarray(shape, dtype=dtype, buffer=self.block.buf, offset=offset)
+                for name, (dtype, shape, offset) in self.layout.items()
+            }
+        else:
+            self.arrays = {name: np.zeros(shape, dtype=dtype) for name, (shape, dtype) in specs.items()}
+
+    def release(self):
+        self.arrays = {}
+        if self.block is not None:
+            try:
+                self.block.close()
+            except BufferError:
+                pass  # A view outlived us (e.g. in a traceback); the mapping goes with it
+            self.block.unlink()
+            self.block = None
+
+
+def _run_chunk(func: Callable, block_name: str, layout: Layout, lo: int, hi: int, params: dict):
+    """Worker side: map the block, run `func` on rows [lo, hi) of every column, copy the result out."""
+    # Workers share the parent's resource tracker, so attaching doesn't add an owner; the parent unlinks
+    block = shared_memory.SharedMemory(name=block_name)
+    views = result = None
+    try:
+        views = {
+            name: np.ndarray(shape, dtype=dtype, buffer=block.buf, offset=offset)[lo:hi]
+            for name, (dtype, shape, offset) in layout.items()
+        }
+        result = func(**views, **params)
+        # Results may be views of the inputs; copy them out before the mapping closes
+        if isinstance(result, tuple):
+            return tuple(np.array(part) for part in result)
+        return np.array(result)
+    finally:
+        views = result = None
+        block.close()
+
+
+def _concat(parts: List):
+    if isinstance(parts[0], tuple):
+        return tuple(np.concatenate(column) for column in zip(*parts))
+    return np.concatenate(parts)
+
+
+class ScoringPool:
+    """
+    Runs row-parallel NumPy scoring functions in worker processes.
+
+    map_rows() copies a batch's columns into one shared-memory block (or
+    takes SharedColumns built in one, see allocate()), splits the rows
+    into SCORING_BATCH_ROWS chunks and runs `func` on each chunk in
+    a ProcessPoolExecutor. Only the block's name and layout are pickled,
+    never the data, and the event loop (API, websockets, detection) keeps
+    its GIL. `func` must be a module-level function taking the columns as
+    keyword arguments (plus `params`) and returning an array or tuple of
+    arrays with one row per input row. Small results come back pickled.
+
+    With size 0 the chunks run in a thread of this process instead.
+    """
+
+    def __init__(self, size: int = SCORING_POOL_SIZE, batch_rows: int = SCORING_BATCH_ROWS):
+        self.size = size
+        self.batch_rows = batch_rows
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self.calls = 0
+        self.chunks = 0
+        self.rows = 0
+        self.errors = 0
+        self.busy_seconds = 0.0
+        self.last_call_ms = 0.0
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn, not fork: the parent runs threads (ES client, to_thread workers)
+            self._executor = ProcessPoolExecutor(self.size, mp_context=multiprocessing.get_context("spawn"))
+        return self._executor
+
+    def allocate(self, specs: Dict[str, Tuple[Tuple[int, ...], np.dtype]]) -> SharedColumns:
+        """Zero-filled columns to fill in place and pass to map_rows(); the caller release()s them."""
+        return SharedColumns(specs, shared=self.size > 0)
+
+    async def map_rows(self, func: Callable, columns, **params):
+        """
+        func(**columns, **params) over row chunks, results concatenated in row order.
+
+        `columns` is a dict of arrays, or SharedColumns from allocate(), which
+        are handed to the workers as they are instead of being copied.
+        """
+        shared = columns if isinstance(columns, SharedColumns) else None
+        if shared is not None:
+            columns = shared.arrays
+        rows = len(next(iter(columns.values())))
+        if any(len(column) != rows for column in columns.values()):
+            raise ValueError("All columns must have the same number of rows")
+        if not rows:
+            return func(**columns, **params)
+
+        started = time.perf_counter()
+        self.calls += 1
+        bounds = [(lo, min(lo + self.batch_rows, rows)) for lo in range(0, rows, self.batch_rows)]
+        try:
+            if self.size <= 0:
+                parts = [await asyncio.to_thread(func, **{name: column[lo:hi] for name, column in columns.items()},
+                                                 **params) for lo, hi in bounds]
+            else:
+                parts = await self._map_shared(func, columns, bounds, params, shared)
+        except Exception:
+            self.errors += 1
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            self.busy_seconds += elapsed
+            self.last_call_ms = elapsed * 1000
+        self.chunks += len(bounds)
+        self.rows += rows
+        return _concat(parts)
+
+    async def _map_shared(self, func: Callable, columns: Dict[str, np.ndarray], bounds, params: dict,
+                          shared: Optional[SharedColumns] = None) -> List:
+        loop = asyncio.get_running_loop()
+        executor = self._get_executor()
+        owned = shared is None or shared.block is None
+        if owned:
+            block, layout = await asyncio.to_thread(_pack, columns)
+        else:
+            block, layout = shared.block, shared.layout
+        try:
+            futures = [
+                loop.run_in_executor(executor, _run_chunk, func, block.name, layout, lo, hi, params)
+                for lo, hi in bounds
+            ]
+            # Let every chunk finish before the block goes away, even if one fails
+            parts = await asyncio.gather(*futures, return_exceptions=True)
+            for part in parts:
+                if isinstance(part, BaseException):
+                    raise part
+            return parts
+        finally:
+            if owned:
+                block.close()
+                block.unlink()
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> dict:
+        return {
+            "size": self.size,
+            "batch_rows": self.batch_rows,
+            "started": self._executor is not None,
+            "calls": self.calls,
+            "chunks": self.chunks,
+            "rows": self.rows,
+            "errors": self.errors,
+            "busy_seconds": round(self.busy_seconds, 3),
+            "last_call_ms": round(self.last_call_ms, 3),
+        }
@@ -0,0 +1,174 @@
+from datetime import datetime, timezone
+from typing import List, Optional, Set
+import os
+import time
+
+from es_client import search
+
+TIMESTAMP_FIELD = "@timestamp"
+
+# Documents fetched per poll
+TAIL_BATCH_SIZE = 500
+# Poll interval used while ingest is heavy (last batch was full)
+TAIL_BUSY_INTERVAL = 0.1
+# Poll interval after a partial batch; doubles while idle up to the max
+TAIL_BASE_INTERVAL = 1.0
+TAIL_MAX_INTERVAL = 10.0
+# Seconds the tailer stays behind the newest document (and the wall clock), so
+# documents that become searchable a little after newer ones are not skipped
+TAIL_SETTLE_DELAY = float(os.getenv("TAIL_SETTLE_DELAY", "3"))
+
+
+class LogTailer:
+    """
+    Incrementally tails an index in @timestamp order.
+
+    The cursor is the last processed @timestamp (epoch millis) plus the _ids
+    already seen at exactly that timestamp. Each poll resumes from the cursor
+    (range gte + skipping the boundary ids), so every document is handed out
+    once in bounded batches instead of re-reading the newest N every time.
+    The boundary set stands in for a sortable tiebreaker: _id is not sortable
+    by default on ES 8, and a point-in-time would hide newly indexed docs.
+
+    Documents don't become searchable in @timestamp order (refresh interval,
+    beats flushing late, clock skew between hosts), and one that shows up
+    below the cursor would never be read. So hits are only handed out up to
+    settle_ms behind the newest document and the wall clock; once the index
+    goes quiet, up to settle_ms behind the wall clock alone. Anything later
+    than that still slips past; raise TAIL_SETTLE_DELAY for slow shippers.
+    """
+
+    def __init__(self, index: str, query: Optional[dict] = None, source: Optional[list] = None,
+                 batch_size: int = TAIL_BATCH_SIZE, start_ms: Optional[int] = None,
+                 runtime_mappings: Optional[dict] = None, settle_delay: float = TAIL_SETTLE_DELAY):
+        self.index = index
+        self.query = query or {"match_all": {}}
+        self.source = source
+        # Search-time fields the query may filter on (e.g. a computed local hour)
+        self.runtime_mappings = runtime_mappings
+        self.batch_size = batch_size
+        self.settle_ms = int(settle_delay * 1000)
+
+        self.cursor_ms: Optional[int] = start_ms
+        self.boundary_ids: Set[str] = set()
+        self.newest_ms: Optional[int] = None
+        self.interval = TAIL_BASE_INTERVAL
+
+        self.docs_processed = 0
+        self.last_batch_size = 0
+        self.last_poll_at: Optional[float] = None
+
+    def _with_runtime_mappings(self, body: dict) -> dict:
+        if self.runtime_mappings:
+            body["runtime_mappings"] = self.runtime_mappings
+        return body
+
+    def settled_until(self, now_ms: int) -> int:
+        """Newest @timestamp (epoch millis) that is safe to hand out."""
+        horizon = now_ms - self.settle_ms
+        if self.newest_ms is not None and self.newest_ms > horizon:
+            # Documents are still landing: stay settle_ms behind the newest one as well
+            horizon = min(horizon, self.newest_ms - self.settle_ms)
+        return horizon
+
+    def build_query(self, now_ms: Optional[int] = None) -> dict:
+        if now_ms is None:
+            now_ms = int(time.time() * 1000)
+        return self._with_runtime_mappings({
+            "size": self.batch_size + len(self.boundary_ids),
+            "_source": self.source if self.source is not None else True,
+            "track_total_hits": False,
+            "query": {
+                "bool": {
+                    "filter": [
+                        self.query,
+                        {"range": {TIMESTAMP_FIELD: {"gte": self.cursor_ms, "format": "epoch_millis"}}},
+                    ]
+                }
+            },
+            # Only the hits are held back; "newest" still sees everything past the cursor
+            "post_filter": {"range": {TIMESTAMP_FIELD: {"lte": self.settled_until(now_ms), "format": "epoch_millis"}}},
+            "sort": [{TIMESTAMP_FIELD: {"order": "asc"}}],
+            "aggs": {"newest": {"max": {"field": TIMESTAMP_FIELD}}},
+        })
+
+    async def prime(self, es):
+        """Start tailing from the newest existing document instead of replaying history."""
+        response = await search(es, self.index, self._with_runtime_mappings({
+            "size": 1,
+            "_source": False,
+            "query": self.query,
+            "sort": [{TIMESTAMP_FIELD: {"order": "desc"}}],
+        }))
+        hits = response.get("hits", {}).get("hits", [])
+        if hits:
+            self.cursor_ms = int(hits[0]["sort"][0])
+            self.boundary_ids = {hits[0]["_id"]}
+        else:
+            self.cursor_ms = int(time.time() * 1000)
+        self.newest_ms = self.cursor_ms
+
+    async def poll(self, es) -> List[dict]:
+        """Fetch the next batch of unseen documents and advance the cursor."""
+        if self.cursor_ms is None:
+            await self.prime(es)
+
+        response = await search(es, self.index, self.build_query())
+        hits = response.get("hits", {}).get("hits", [])
+        newest = response.get("aggregations", {}).get("newest", {}).get("value")
+        if newest is not None:
+            self.newest_ms = int(newest)
+
+        batch = []
+        for hit in hits:
+            if hit["_id"] in self.boundary_ids:
+                continue
+            batch.append(hit)
+            if len(batch) == self.batch_size:
+                break
+
+        for hit in batch:
+            sort_ms = int(hit["sort"][0])
+            if sort_ms != self.cursor_ms:
+                self.cursor_ms = sort_ms
+                self.boundary_ids = set()
+            self.boundary_ids.add(hit["_id"])
+
+        self.docs_processed += len(batch)
+        self.last_batch_size = len(batch)
+        self.last_poll_at = time.time()
+        self._adjust_interval(len(batch))
+        return batch
+
+    def _adjust_interval(self, batch_len: int):
+        # Newer documents exist that are still settling: don't back off past them
+        pending = self.newest_ms is not None and self.cursor_ms is not None and self.newest_ms > self.cursor_ms
+        if batch_len >= self.batch_size:
+            self.interval = TAIL_BUSY_INTERVAL
+        elif batch_len or pending:
+            self.interval = TAIL_BASE_INTERVAL
+        else:
+            self.interval = min(max(self.interval, TAIL_BASE_INTERVAL) * 2, TAIL_MAX_INTERVAL)
+
+    def next_interval(self) -> float:
+        return self.interval
+
+    @property
+    def lag_seconds(self) -> float:
+        """How far the cursor trails the newest matching @timestamp."""
+        if self.cursor_ms is None or self.newest_ms is None:
+            return 0.0
+        return max(self.newest_ms - self.cursor_ms, 0) / 1000.0
+
+    def stats(self) -> dict:
+        cursor = None
+        if self.cursor_ms is not None:
+            cursor = datetime.fromtimestamp(self.cursor_ms / 1000.0, tz=timezone.utc).isoformat()
+        return {
+            "cursor": cursor,
+            "lag_seconds": self.lag_seconds,
+            "docs_processed": self.docs_processed,
+            "last_batch_size": self.last_batch_size,
+            "poll_interval": self.interval,
+            "last_poll_at": self.last_poll_at,
+        }
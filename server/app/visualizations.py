@@ -0,0 +1,300 @@
+from typing import Optional, Set
+import asyncio
+import json
+import time
+
+from starlette.websockets import WebSocket
+
+from es_client import search, ES_AGGREGATION_TIMEOUT
+from fanout import CLOSE_TRY_AGAIN_LATER
+from metrics import LoopTimer, es_call_site
+
+VISUALIZATION_INDEX = "proxy-logs"
+# Seconds between dashboard refreshes; also how long the initial and live snapshots are reused
+VISUALIZATION_REFRESH_INTERVAL = 60
+# A subscriber that can't take a frame within this many seconds is closed and dropped
+VISUALIZATION_SEND_TIMEOUT = 5
+
+
+def empty_result() -> dict:
+    return {
+        "top_clients": [],
+        "network_trend": [],
+        "protocol_usage": [],
+        "record_counts_over_time": [],
+        "most_visited_domains": []
+    }
+
+
+def build_aggregations() -> dict:
+    # Shared aggregation structure
+    return {
+        "top_clients": {
+            "terms": {
+                "field": "client_id.keyword",
+                "size": 5,
+                "order": {"total_bytes": "desc"}
+            },
+            "aggs": {
+                "total_bytes": {
+                    "sum": {"field": "network.bytes"}
+                }
+            }
+        },
+        "network_trend": {
+            "date_histogram": {
+                "field": "@timestamp",
+                "fixed_interval": "5m",
+                "format": "yyyy-MM-dd HH:mm:ss"
+            },
+            "aggs": {
+                "total_bytes": {
+                    "sum": {"field": "network.bytes"}
+                }
+            }
+        },
+        "protocol_usage": {
+            "terms": {
+                "field": "network.protocol.keyword",
+                "size": 5,
+                "order": {"total_bytes": "desc"}
+            },
+            "aggs": {
+                "total_bytes": {
+                    "sum": {"field": "network.bytes"}
+                }
+            }
+        },
+        "record_counts_over_time": {
+            "date_histogram": {
+                "field": "@timestamp",
+                "fixed_interval": "12h",
+                "format": "d MMM yyyy",
+                "min_doc_count": 0
+            }
+        },
+        "top_domains": {
+            "date_histogram": {
+                "field": "@timestamp",
+                "fixed_interval": "1d",
+                "format": "yyyy-MM-dd",
+                "min_doc_count": 0
+            },
+            "aggs": {
+                "domains": {
+                    "terms": {
+                        "field": "destination.domain.keyword",
+                        "size": 10
+                    },
+                    "aggs": {
+                        "visit_count": {
+                            "cardinality": {
+                                "field": "destination.domain.keyword",
+                                "missing": "unknown"
+                            }
+                        }
+                    }
+                }
+            }
+        }
+    }
+
+
+def shape_result(aggregations: dict) -> dict:
+    top_clients = [
+        {"client_id": bucket["key"], "bytes": bucket["total_bytes"]["value"]}
+        for bucket in aggregations["top_clients"]["buckets"]
+    ]
+
+    network_trend = [
+        {"timestamp": bucket["key_as_string"], "bytes": bucket["total_bytes"]["value"]}
+        for bucket in aggregations["network_trend"]["buckets"]
+    ]
+
+    protocol_usage = [
+        {"protocol": bucket["key"], "bytes": bucket["total_bytes"]["value"]}
+        for bucket in aggregations["protocol_usage"]["buckets"]
+    ]
+
+    record_counts_over_time = [
+        {
+            "date": bucket["key_as_string"],
+            "count": bucket["doc_count"]
+        }
+        for bucket in aggregations["record_counts_over_time"]["buckets"]
+    ]
+
+    most_visited_domains = [
+        {
+            "month": date_bucket["key_as_string"],
+            "domains": [
+                {
+                    "domain": bucket["key"],
+                    "visits": bucket["visit_count"]["value"]
+                }
+                for bucket in date_bucket["domains"]["buckets"]
+            ]
+        }
+        for date_bucket in aggregations["top_domains"]["buckets"]
+    ]
+
+    return {
+        "top_clients": top_clients,
+        "network_trend": network_trend,
+        "protocol_usage": protocol_usage,
+        "record_counts_over_time": record_counts_over_time,
+        "most_visited_domains": most_visited_domains
+    }
+
+
+async def fetch_visualization_data(es, initial: bool = False) -> dict:
+    try:
+        if initial:
+            initial_query = {
+                "size": 100,
+                "query": {
+                    "match_all": {}
+                },
+                "sort": [
+                    {"@timestamp": {"order": "asc"}}
+                ]
+            }
+            initial_response = await search(es, VISUALIZATION_INDEX, initial_query)
+
+            if not initial_response["hits"]["hits"]:
+                return empty_result()
+
+            hits = initial_response["hits"]["hits"]
+            start_time = hits[0]["_source"]["@timestamp"]
+            end_time = hits[-1]["_source"]["@timestamp"]
+            time_range = {"gte": start_time, "lte": end_time}
+        else:
+            time_range = {"gte": "now-1h", "lte": "now"}
+
+        query = {
+            "size": 0,
+            "query": {
+                "bool": {
+                    "filter": [
+                        {"range": {"@timestamp": time_range}}
+                    ]
+                }
+            },
+            "aggs": build_aggregations()
+        }
+
+        response = await search(es, VISUALIZATION_INDEX, query, timeout=ES_AGGREGATION_TIMEOUT)
+        return shape_result(response["aggregations"])
+
+    except Exception as e:
+        print(f"Elasticsearch error: {str(e)}")
+        return empty_result()
+
+
+class VisualizationBroadcaster:
+    """
+    Computes dashboard data once per refresh window and fans it out to every
+    /ws/visualizations subscriber. Late joiners get the cached snapshots right
+    away (refetched first if older than one refresh interval, e.g. after the
+    producer sat idle), so Elasticsearch load does not grow with the number
+    of dashboards. With a RollupIngestor attached, data is read from its
+    buckets instead. A subscriber whose send fails or times out is closed
+    (code 1013) so its dashboard reconnects instead of freezing.
+    """
+
+    def __init__(self, es, interval: float = VISUALIZATION_REFRESH_INTERVAL, rollups=None):
+        self.es = es
+        self.rollups = rollups
+        self.interval = interval
+        self.subscribers: Set[WebSocket] = set()
+
+        self.initial_snapshot: Optional[str] = None
+        self.initial_at = 0.0
+        self.live_snapshot: Optional[str] = None
+        self.live_at = 0.0
+        self.live_version = 0
+
+        self._initial_lock = asyncio.Lock()
+        self._live_lock = asyncio.Lock()
+        self._producer: Optional[asyncio.Task] = None
+
+    async def fetch(self, initial: bool = False) -> dict:
+        es_call_site.set("visualizations")
+        # Pre-aggregated buckets once the rollup backfill has caught up, raw aggregations until then
+        if self.rollups is not None and self.rollups.caught_up:
+            try:
+                return await asyncio.to_thread(self.rollups.dashboard, initial)
+            except Exception as e:
+                print(f"⚠️ Rollup query failed, falling back to Elasticsearch: {e}")
+        return await fetch_visualization_data(self.es, initial=initial)
+
+    async def get_initial_snapshot(self) -> str:
+        # The lock makes concurrent joiners share one computation
+        async with self._initial_lock:
+            if self.initial_snapshot is None or time.time() - self.initial_at >= self.interval:
+                data = await self.fetch(initial=True)
+                self.initial_snapshot = json.dumps(data)
+                self.initial_at = time.time()
+            return self.initial_snapshot
+
+    def _set_live(self, data: dict) -> str:
+        self.live_snapshot = json.dumps(data)
+        self.live_at = time.time()
+        self.live_version += 1
+        return self.live_snapshot
+
+    async def get_live_snapshot(self) -> Optional[str]:
+        """The cached live snapshot, refetched if older than one refresh interval (None before the first one)."""
+        async with self._live_lock:
+            if self.live_snapshot is not None and time.time() - self.live_at >= self.interval:
+                self._set_live(await self.fetch(initial=False))
+            return self.live_snapshot
+
+    async def subscribe(self, websocket: WebSocket):
+        await websocket.send_text(await self.get_initial_snapshot())
+
+        sent_version = 0
+        live_snapshot = await self.get_live_snapshot()
+        if live_snapshot is not None:
+            sent_version = self.live_version
+            await websocket.send_text(live_snapshot)
+
+        self.subscribers.add(websocket)
+        # Catch up if a broadcast happened while we were sending snapshots
+        if self.live_version != sent_version and self.live_snapshot is not None:
+            await websocket.send_text(self.live_snapshot)
+
+        if self._producer is None or self._producer.done():
+            self._producer = asyncio.create_task(self._produce())
+
+    def unsubscribe(self, websocket: WebSocket):
+        self.subscribers.discard(websocket)
+        if not self.subscribers and self._producer is not None:
+            self._producer.cancel()
+            self._producer = None
+
+    async def _send(self, websocket: WebSocket, message: str):
+        try:
+            await asyncio.wait_for(websocket.send_text(message), timeout=VISUALIZATION_SEND_TIMEOUT)
+        except Exception:
+            self.unsubscribe(websocket)
+            try:
+                await asyncio.wait_for(websocket.close(code=CLOSE_TRY_AGAIN_LATER), timeout=VISUALIZATION_SEND_TIMEOUT)
+            except Exception:
+                pass
+
+    async def broadcast(self, message: str):
+        # Serialized once, sent to every subscriber concurrently
+        await asyncio.gather(*(self._send(ws, message) for ws in list(self.subscribers)))
+
+    async def _produce(self):
+        timer = LoopTimer("visualizations")
+        # A snapshot a joiner just refetched is not due again for a full interval
+        await asyncio.sleep(max(self.live_at + self.interval - time.time(), 0))
+        while self.subscribers:
+            timer.begin()
+            async with self._live_lock:
+                live_snapshot = self._set_live(await self.fetch(initial=False))
+            await self.broadcast(live_snapshot)
+            timer.end(self.interval)
+            await asyncio.sleep(self.interval)
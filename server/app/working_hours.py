@@ -0,0 +1,177 @@
+from datetime import datetime
+from functools import lru_cache
+from typing import Dict, List, Mapping, Optional, Sequence
+import json
+import os
+
+import numpy as np
+import pytz
+
+WORKING_HOURS_FILE = os.getenv("WORKING_HOURS_FILE")
+
+# Policy applied to clients whose role has none of its own.
+# Hours are local, end exclusive: 17 <= hour < 19 is working time.
+DEFAULT_TIMEZONE = "Asia/Kolkata"
+DEFAULT_START_HOUR = 17
+DEFAULT_END_HOUR = 19
+
+TIMESTAMP_FIELD = "@timestamp"
+LOCAL_HOUR_FIELD = "local_hour"
+
+# Painless for the per-timezone local-hour runtime fields used in the pushdown filter
+LOCAL_HOUR_SCRIPT = (
+    f"if (doc['{TIMESTAMP_FIELD}'].size() > 0) "
+    f"{{ emit(doc['{TIMESTAMP_FIELD}'].value.withZoneSameInstant(ZoneId.of(params.tz)).getHour()); }}"
+)
+
+HOUR = np.timedelta64(1, "h")
+
+
+@lru_cache(maxsize=None)
+def get_timezone(name: str):
+    return pytz.timezone(name)
+
+
+def _utc_offset_seconds(timezone, epoch_seconds: int) -> int:
+    return int(datetime.fromtimestamp(epoch_seconds, timezone).utcoffset().total_seconds())
+
+
+def local_hours(epoch_ms: np.ndarray, timezone: str) -> np.ndarray:
+    """
+    Local hour of day for each UTC epoch-millis value.
+
+    The UTC offset is resolved once per distinct UTC hour in the window
+    (DST changes happen on hour boundaries), then applied to the whole
+    window with datetime64 arithmetic.
+    """
+    timestamps = np.asarray(epoch_ms, dtype=np.int64).astype("datetime64[ms]")
+    if not len(timestamps):
+        return np.empty(0, dtype=np.int8)
+
+    tz = get_timezone(timezone)
+    utc_hours, inverse = np.unique(timestamps.astype("datetime64[h]"), return_inverse=True)
+    offsets = np.array(
+        [_utc_offset_seconds(tz, int(hour)) for hour in utc_hours.astype("datetime64[s]").astype(np.int64)],
+        dtype="timedelta64[s]",
+    )
+    local = timestamps + offsets[inverse]
+    return ((local - local.astype("datetime64[D]")) // HOUR).astype(np.int8)
+
+
+class WorkingHoursPolicy:
+    """A daily working window in a timezone. Windows with start > end wrap past midnight."""
+
+    __slots__ = ("start_hour", "end_hour", "timezone", "hours_mask")
+
+    def __init__(self, start_hour: int, end_hour: int, timezone: str = DEFAULT_TIMEZONE):
+        if not (0 <= start_hour <= 24 and 0 <= end_hour <= 24):
+            raise ValueError(f"Working hours must be within 0-24, got {start_hour}-{end_hour}")
+        get_timezone(timezone)  # Unknown zones fail at load time, not per event
+
+        self.start_hour = start_hour
+        self.end_hour = end_hour
+        self.timezone = timezone
+
+        hours = np.arange(24)
+        if start_hour <= end_hour:
+            self.hours_mask = (hours >= start_hour) & (hours < end_hour)
+        else:
+            self.hours_mask = (hours >= start_hour) | (hours < end_hour)
+
+    @classmethod
+    def from_dict(cls, data: Mapping, default_timezone: str = DEFAULT_TIMEZONE) -> "WorkingHoursPolicy":
+        return cls(int(data["start"]), int(data["end"]), data.get("timezone", default_timezone))
+
+    def to_dict(self) -> dict:
+        return {"start": self.start_hour, "end": self.end_hour, "timezone": self.timezone}
+
+    def is_outside(self, timestamp: datetime) -> bool:
+        """Scalar check for a single (naive = UTC) datetime."""
+        if timestamp.tzinfo is None:
+            timestamp = pytz.UTC.localize(timestamp)
+        return not self.hours_mask[timestamp.astimezone(get_timezone(self.timezone)).hour]
+
+
+class WorkingHoursPolicies:
+    """
+    Working-hour policies keyed by client_role, with a default for everyone else.
+
+    Loaded from WORKING_HOURS_FILE when set:
+
+        {"default": {"start": 9, "end": 17, "timezone": "Asia/Kolkata"},
+         "roles": {"night-ops": {"start": 22, "end": 6}}}
+
+    Role policies inherit the default's timezone unless they name one.
+    """
+
+    def __init__(self, default: WorkingHoursPolicy, roles: Optional[Dict[str, WorkingHoursPolicy]] = None):
+        self.default = default
+        self.roles = dict(roles or {})
+
+        # Index 0 is the default; evaluate() works on these parallel arrays
+        self._policies: List[WorkingHoursPolicy] = [default] + list(self.roles.values())
+        self._role_index = {role: i for i, role in enumerate(self.roles, start=1)}
+        self.timezones: List[str] = sorted({policy.timezone for policy in self._policies})
+        tz_index = {tz: i for i, tz in enumerate(self.timezones)}
+        self._policy_tz = np.array([tz_index[policy.timezone] for policy in self._policies], dtype=np.intp)
+        self._masks = np.stack([policy.hours_mask for policy in self._policies])
+
+    @classmethod
+    def load(cls, path: Optional[str] = WORKING_HOURS_FILE) -> "WorkingHoursPolicies":
+        default = WorkingHoursPolicy(DEFAULT_START_HOUR, DEFAULT_END_HOUR, DEFAULT_TIMEZONE)
+        if not path:
+            return cls(default)
+        with open(path, encoding="utf-8") as file:
+            config = json.load(file)
+        if "default" in config:
+            default = WorkingHoursPolicy.from_dict(config["default"])
+        roles = {role: WorkingHoursPolicy.from_dict(data, default.timezone)
+                 for role, data in config.get("roles", {}).items()}
+        return cls(default, roles)
+
+    def policy_for(self, role: Optional[str]) -> WorkingHoursPolicy:
+        return self.roles.get(role, self.default)
+
+    def runtime_mappings(self) -> dict:
+        """One local-hour runtime field per timezone in use."""
+        return {
+            f"{LOCAL_HOUR_FIELD}_{i}": {"type": "long", "script": {"source": LOCAL_HOUR_SCRIPT, "params": {"tz": tz}}}
+            for i, tz in enumerate(self.timezones)
+        }
+
+    def pushdown_query(self) -> dict:
+        """
+        Filter that lets ES drop events which are working time under every policy.
+
+        Per timezone, the hours that are working time for all of its policies
+        can never alert, so only events whose local hour falls outside that
+        intersection are returned. The exact per-role check runs in evaluate().
+        """
+        should = []
+        for i, tz in enumerate(self.timezones):
+            always_working = np.logical_and.reduce(self._masks[self._policy_tz == i])
+            candidate_hours = np.flatnonzero(~always_working).tolist()
+            if candidate_hours:
+                should.append({"terms": {f"{LOCAL_HOUR_FIELD}_{i}": candidate_hours}})
+        return {"bool": {"should": should, "minimum_should_match": 1}}
+
+    def evaluate(self, epoch_ms: Sequence[int], client_ids: Sequence[str], roles: Mapping[str, str]) -> np.ndarray:
+        """Boolean mask of events outside working hours for their client's role."""
+        count = len(client_ids)
+        epoch_ms = np.asarray(epoch_ms, dtype=np.int64)
+        policy_index = np.fromiter(
+            (self._role_index.get(roles.get(client_id), 0) for client_id in client_ids), dtype=np.intp, count=count,
+        )
+        if len(self.timezones) == 1:
+            hours = local_hours(epoch_ms, self.timezones[0])
+        else:
+            hours = np.empty(count, dtype=np.int8)
+            event_tz = self._policy_tz[policy_index]
+            for i, tz in enumerate(self.timezones):
+                selected = event_tz == i
+                if selected.any():
+                    hours[selected] = local_hours(epoch_ms[selected], tz)
+        return ~self._masks[policy_index, hours]
+
+    def describe(self) -> dict:
+        return {"default": self.default.to_dict(), "roles": {role: p.to_dict() for role, p in self.roles.items()}}
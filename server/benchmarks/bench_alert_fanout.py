@@ -0,0 +1,159 @@
+"""
+Alert fan-out to thousands of simulated /ws/alert sockets.
+
+A fraction of the sockets are slow (every send takes --slow-ms) and a few
+are hung (send never completes). "before" is the sequential send loop the
+old ConnectionManager ran inline in the detector; "after" is the queued
+ConnectionManager from fanout.py under each overflow policy.
+
+Reported per run: how long the detector is blocked inside send_alert(),
+delivery latency to the healthy sockets, and the manager's own metrics.
+
+    python benchmarks/bench_alert_fanout.py --sockets 5000 --alerts 50
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+import fanout  # noqa: E402
+from fanout import OVERFLOW_POLICIES, ConnectionManager  # noqa: E402
+
+
+class FakeSocket:
+    def __init__(self, delay: float = 0.0, hung: bool = False):
+        self.delay = delay
+        self.hung = hung
+        self.received = []
+        self.closed = False
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, message: str):
+        if self.hung:
+            await asyncio.Event().wait()
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        self.received.append((time.perf_counter(), message))
+
+    async def close(self, code: int = 1000):
+        self.closed = True
+
+
+def make_sockets(args, rng: random.Random):
+    sockets = []
+    for _ in range(args.sockets):
+        roll = rng.random()
+        if roll < args.hung_ratio:
+            sockets.append(FakeSocket(hung=True))
+        elif roll < args.hung_ratio + args.slow_ratio:
+            sockets.append(FakeSocket(delay=args.slow_ms / 1000))
+        else:
+            sockets.append(FakeSocket())
+    return sockets
+
+
+def alert(i: int) -> dict:
+    return {"type": "alert", "message": f"🚨 ALERT: client-{i % 7} accessed a restricted domain: bad{i}.example",
+            "timestamp": time.strftime("%Y-%m-%d %H:%M:%S")}
+
+
+async def legacy_send_alert(sockets, message: str):
+    for socket in sockets:
+        try:
+            await asyncio.wait_for(socket.send_text(message), fanout.SOCKET_SEND_TIMEOUT)
+        except Exception:
+            pass
+
+
+def healthy_latencies(sockets, sent_at):
+    latencies = []
+    for socket in sockets:
+        if socket.delay or socket.hung:
+            continue
+        for received_at, message in socket.received:
+            latencies.append(received_at - sent_at[json.loads(message)["message"]])
+    return latencies
+
+
+def summarize(name, blocked, latencies, extra=""):
+    blocked_ms = [b * 1000 for b in blocked]
+    latency_ms = sorted(lat * 1000 for lat in latencies) or [float("nan")]
+    p99 = latency_ms[min(int(0.99 * len(latency_ms)), len(latency_ms) - 1)]
+    print(f"{name:<22} blocked/alert {statistics.mean(blocked_ms):>9.2f}ms  max {max(blocked_ms):>9.2f}ms  "
+          f"healthy p50 {statistics.median(latency_ms):>8.2f}ms  p99 {p99:>8.2f}ms  {extra}")
+
+
+async def run_legacy(args):
+    sockets = make_sockets(args, random.Random(args.seed))
+    blocked, sent_at = [], {}
+    for i in range(args.legacy_alerts):
+        payload = alert(i)
+        sent_at[payload["message"]] = time.perf_counter()
+        started = time.perf_counter()
+        await legacy_send_alert(sockets, json.dumps(payload))
+        blocked.append(time.perf_counter() - started)
+    summarize("before (sequential)", blocked, healthy_latencies(sockets, sent_at),
+              f"({args.legacy_alerts} alerts, capped by hung sockets)")
+
+
+async def run_manager(args, policy: str):
+    sockets = make_sockets(args, random.Random(args.seed))
+    manager = ConnectionManager(max_queue=args.queue, overflow=policy)
+    for socket in sockets:
+        await manager.connect(socket)
+
+    blocked, sent_at = [], {}
+    for i in range(args.alerts):
+        payload = alert(i)
+        sent_at[payload["message"]] = time.perf_counter()
+        started = time.perf_counter()
+        manager.send_alert(payload, key=("bench", i % args.distinct_keys))
+        blocked.append(time.perf_counter() - started)
+        await asyncio.sleep(args.interval_ms / 1000)
+    await asyncio.sleep(args.drain_ms / 1000)
+
+    stats = manager.stats()
+    summarize(f"after ({policy})", blocked, healthy_latencies(sockets, sent_at),
+              f"connections {stats['connections']}  dropped {stats['dropped']}  coalesced {stats['coalesced']}  "
+              f"disconnected {stats['disconnected']}  high_water {stats['queue_depth']['high_water']}")
+    for socket in list(manager.active_connections):
+        manager.disconnect(socket)
+    await asyncio.sleep(0)
+
+
+async def main_async(args):
+    fanout.SOCKET_SEND_TIMEOUT = args.send_timeout
+    print(f"sockets {args.sockets} (slow {args.slow_ratio:.0%} @ {args.slow_ms}ms, hung {args.hung_ratio:.1%}), "
+          f"queue {args.queue}")
+    await run_legacy(args)
+    for policy in OVERFLOW_POLICIES:
+        await run_manager(args, policy)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sockets", type=int, default=5000)
+    parser.add_argument("--alerts", type=int, default=50)
+    parser.add_argument("--legacy-alerts", type=int, default=3)
+    parser.add_argument("--slow-ratio", type=float, default=0.05)
+    parser.add_argument("--slow-ms", type=float, default=100)
+    parser.add_argument("--hung-ratio", type=float, default=0.002)
+    parser.add_argument("--send-timeout", type=float, default=0.5)
+    parser.add_argument("--queue", type=int, default=16)
+    parser.add_argument("--distinct-keys", type=int, default=8)
+    parser.add_argument("--interval-ms", type=float, default=5)
+    parser.add_argument("--drain-ms", type=float, default=1500)
+    parser.add_argument("--seed", type=int, default=11)
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
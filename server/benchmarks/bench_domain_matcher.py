@@ -0,0 +1,87 @@
+"""
+Memory and lookup-rate comparison of DomainTrie vs DomainSuffixMatcher.
+
+    python benchmarks/bench_domain_matcher.py --sizes 10000 100000 300000
+"""
+import argparse
+import gc
+import os
+import random
+import string
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+from domains import DomainTrie, DomainSuffixMatcher  # noqa: E402
+
+TLDS = ["com", "net", "org", "io", "in", "co.uk", "com.au", "de", "ru", "info"]
+
+
+def random_domain(rng: random.Random) -> str:
+    label = "".join(rng.choices(string.ascii_lowercase + string.digits, k=rng.randint(5, 14)))
+    return f"{label}.{rng.choice(TLDS)}"
+
+
+def make_queries(rng: random.Random, blocklist, count: int):
+    queries = []
+    for _ in range(count):
+        roll = rng.random()
+        if roll < 0.25:
+            queries.append(rng.choice(blocklist))  # exact hit
+        elif roll < 0.5:
+            queries.append(f"cdn{rng.randint(0, 99)}.{rng.choice(blocklist)}")  # subdomain hit
+        else:
+            queries.append(f"www.{random_domain(rng)}")  # miss
+    return queries
+
+
+def build(factory, domains):
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+    matcher = factory()
+    for domain in domains:
+        matcher.insert(domain)
+    elapsed = time.perf_counter() - started
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return matcher, current, elapsed
+
+
+def lookup_rate(search, queries) -> float:
+    started = time.perf_counter()
+    for query in queries:
+        search(query)
+    return len(queries) / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--queries", type=int, default=200_000)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    print(f"{'size':>8} {'matcher':<20} {'memory MB':>10} {'build s':>8} {'lookups/s':>12}")
+    for size in args.sizes:
+        rng = random.Random(args.seed)
+        domains = list({random_domain(rng) for _ in range(size)})
+        queries = make_queries(rng, domains, args.queries)
+
+        for name, factory in (("DomainTrie", DomainTrie), ("DomainSuffixMatcher", DomainSuffixMatcher)):
+            matcher, memory, build_time = build(factory, domains)
+            rate = lookup_rate(matcher.search, queries)
+            print(f"{size:>8} {name:<20} {memory / 1e6:>10.1f} {build_time:>8.2f} {rate:>12,.0f}")
+            del matcher
+
+        matcher = DomainSuffixMatcher(domains)
+        started = time.perf_counter()
+        matcher.match_many(queries)
+        rate = len(queries) / (time.perf_counter() - started)
+        print(f"{size:>8} {'  .match_many':<20} {'':>10} {'':>8} {rate:>12,.0f}")
+
+
+if __name__ == "__main__":
+    main()
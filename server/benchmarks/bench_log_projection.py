@@ -0,0 +1,117 @@
+"""
+Bytes transferred and per-hit CPU for the client log projection.
+
+"before" is the full packetbeat _source flattened with the nested .get()
+chain the endpoints used to inline; "after" is the LOG_SOURCE_INCLUDES
+filtered _source flattened with project_hit().
+
+    python benchmarks/bench_log_projection.py --hits 20000
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+from log_projection import LOG_SOURCE_INCLUDES, project_hit  # noqa: E402
+
+
+def legacy_projection(hit):
+    _source = hit["_source"]
+    return {
+        "id": hit["_id"],
+        "timestamp": _source.get("@timestamp", "N/A"),
+        "client_name": _source.get("client_name", "Unknown"),
+        "host_id": _source.get("host", {}).get("id", "N/A"),
+        "os_platform": _source.get("host", {}).get("os", {}).get("platform", "N/A"),
+        "network_transport": _source.get("network", {}).get("transport", "N/A"),
+        "network_type": _source.get("network", {}).get("type", "N/A"),
+        "source_bytes": _source.get("source", {}).get("bytes", 0),
+        "destination_ip": _source.get("destination", {}).get("ip", "N/A"),
+        "event_action": _source.get("event", {}).get("action", "N/A"),
+        "event_duration": _source.get("event", {}).get("duration", 0),
+        "source_mac": _source.get("source", {}).get("mac", "N/A"),
+        "flow_id": _source.get("flow", {}).get("id", "N/A"),
+        "server_domain": _source.get("server", {}).get("domain", "N/A"),
+    }
+
+
+def packetbeat_doc(rng: random.Random, i: int) -> dict:
+    doc = {
+        "@timestamp": f"2025-02-24T06:{i // 60 % 60:02d}:{i % 60:02d}.016Z",
+        "client_id": "clientA",
+        "client_name": "Jeff Bezos",
+        "host": {"id": "3f1c2a", "name": "WS-01", "os": {"platform": "windows", "version": "10.0", "kernel": "10.0.19045"}},
+        "agent": {"type": "packetbeat", "version": "8.12.0", "id": "a1b2c3", "ephemeral_id": "e4f5"},
+        "network": {"transport": "tcp", "type": "ipv4", "protocol": "http", "bytes": rng.randint(200, 90000),
+                    "community_id": "1:abc=", "direction": "egress"},
+        "source": {"ip": "10.0.0.12", "port": rng.randint(1024, 65535), "bytes": rng.randint(100, 5000), "mac": "00-11-22-33-44-55"},
+        "destination": {"ip": "93.184.216.34", "port": 80, "bytes": rng.randint(100, 80000), "domain": "example.com"},
+        "event": {"action": "network_flow", "duration": rng.randint(1000, 10**9), "dataset": "http", "kind": "event"},
+        "flow": {"id": f"EQIA{i:08d}", "final": False},
+        "server": {"domain": "example.com", "ip": "93.184.216.34"},
+    }
+    if rng.random() < 0.6:
+        # include_body_for is on for JSON/HTML, so HTTP docs carry bodies
+        doc["http"] = {
+            "request": {"method": "GET", "body": {"content": "x" * rng.randint(200, 2000)}},
+            "response": {"status_code": 200, "body": {"content": "<html>" + "y" * rng.randint(2000, 16000)}},
+        }
+    return doc
+
+
+def filter_source(doc: dict, includes) -> dict:
+    """What ES returns for `_source: includes`."""
+    out: dict = {}
+    for path in includes:
+        keys = path.split(".")
+        value = doc
+        for key in keys:
+            if not isinstance(value, dict) or key not in value:
+                break
+            value = value[key]
+        else:
+            target = out
+            for key in keys[:-1]:
+                target = target.setdefault(key, {})
+            target[keys[-1]] = value
+    return out
+
+
+def per_hit_us(fn, hits) -> float:
+    started = time.perf_counter()
+    for hit in hits:
+        fn(hit)
+    return (time.perf_counter() - started) / len(hits) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--hits", type=int, default=20_000)
+    parser.add_argument("--seed", type=int, default=3)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    docs = [packetbeat_doc(rng, i) for i in range(args.hits)]
+    full_hits = [{"_id": str(i), "_source": doc} for i, doc in enumerate(docs)]
+    slim_hits = [{"_id": str(i), "_source": filter_source(doc, LOG_SOURCE_INCLUDES)} for i, doc in enumerate(docs)]
+
+    assert all(legacy_projection(f) == project_hit(s) for f, s in zip(full_hits, slim_hits))
+
+    full_bytes = len(json.dumps(full_hits))
+    slim_bytes = len(json.dumps(slim_hits))
+    # Decoding the response is part of the per-hit cost on our side
+    full_decode = per_hit_us(json.loads, [json.dumps(hit) for hit in full_hits])
+    slim_decode = per_hit_us(json.loads, [json.dumps(hit) for hit in slim_hits])
+
+    print(f"hits: {args.hits}")
+    print(f"{'':<8} {'bytes/hit':>10} {'decode us/hit':>14} {'project us/hit':>15}")
+    print(f"{'before':<8} {full_bytes / args.hits:>10.0f} {full_decode:>14.2f} {per_hit_us(legacy_projection, full_hits):>15.2f}")
+    print(f"{'after':<8} {slim_bytes / args.hits:>10.0f} {slim_decode:>14.2f} {per_hit_us(project_hit, slim_hits):>15.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Event-loop latency while a heavy scoring pass runs.
+
+Runs the volume-anomaly score_matrix() over a synthetic --clients x --days
+matrix and samples loop lag (how late a 10ms sleep wakes up, i.e. the
+extra latency every API request and websocket send sees) during the pass:
+
+  idle     no scoring, the reference
+  inline   scored directly on the event loop
+  thread   asyncio.to_thread (what VolumeAnomalyJob did before)
+  pool     ScoringPool worker processes over shared memory
+
+    python benchmarks/bench_scoring_pool.py --clients 5000 --days 30 --pool-size 2
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+from scoring_pool import SCORING_BATCH_ROWS, SCORING_POOL_SIZE, ScoringPool  # noqa: E402
+from volume_anomaly import VOLUME_BUCKET_SECONDS, hour_of_week, score_matrix  # noqa: E402
+
+PROBE_INTERVAL = 0.01
+
+
+async def probe_lag(stop: asyncio.Event, samples: list):
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(PROBE_INTERVAL)
+        samples.append(time.perf_counter() - started - PROBE_INTERVAL)
+
+
+def summarize(name: str, samples: list, elapsed: float):
+    samples = sorted(samples) or [0.0]
+    p50 = statistics.median(samples) * 1000
+    p99 = samples[min(int(len(samples) * 0.99), len(samples) - 1)] * 1000
+    print(f"{name:<7} loop lag p50={p50:7.2f}ms p99={p99:7.2f}ms max={samples[-1] * 1000:8.2f}ms  "
+          f"scoring {elapsed:6.2f}s")
+
+
+async def run_phase(name: str, work, idle_seconds: float):
+    stop = asyncio.Event()
+    samples: list = []
+    probe = asyncio.create_task(probe_lag(stop, samples))
+    await asyncio.sleep(0.05)
+    started = time.perf_counter()
+    if work is None:
+        await asyncio.sleep(idle_seconds)
+    else:
+        await work()
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await probe
+    summarize(name, samples, elapsed)
+
+
+async def main_async(args):
+    rng = np.random.default_rng(args.seed)
+    buckets = args.days * 86400 // VOLUME_BUCKET_SECONDS
+    matrix = rng.lognormal(12, 1.5, (args.clients, buckets)).astype(np.float32)
+    how = hour_of_week(1_740_000_000_000, buckets)
+    print(f"matrix {args.clients} x {buckets} ({matrix.nbytes / 1e6:.0f}MB)  pool size {args.pool_size}  "
+          f"batch rows {args.batch_rows}  cpus {os.cpu_count()}")
+
+    pool = ScoringPool(size=args.pool_size, batch_rows=args.batch_rows)
+    # Start the workers (spawn + imports) outside the measured pass
+    await pool.map_rows(score_matrix, {"matrix": matrix[:args.pool_size * 2]}, how=how)
+
+    async def inline():
+        score_matrix(matrix, how)
+
+    async def thread():
+        await asyncio.to_thread(score_matrix, matrix, how)
+
+    async def pooled():
+        await pool.map_rows(score_matrix, {"matrix": matrix}, how=how)
+
+    await run_phase("idle", None, args.idle_seconds)
+    await run_phase("inline", inline, 0)
+    await run_phase("thread", thread, 0)
+    await run_phase("pool", pooled, 0)
+    pool.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=5000)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--pool-size", type=int, default=SCORING_POOL_SIZE)
+    parser.add_argument("--batch-rows", type=int, default=SCORING_BATCH_ROWS)
+    parser.add_argument("--idle-seconds", type=float, default=2.0)
+    parser.add_argument("--seed", type=int, default=3)
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
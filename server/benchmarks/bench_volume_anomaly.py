@@ -0,0 +1,102 @@
+"""
+Volume-anomaly scan over synthetic per-client 5-minute byte series.
+
+Builds composite-aggregation style pages for --clients x --days (diurnal
+and weekend seasonality, lognormal noise, a --fill share of non-empty
+buckets), assembles them with MatrixBuilder, scores every client with
+score_matrix() and checks that the injected exfiltration spikes are the
+ones reported.
+
+    python benchmarks/bench_volume_anomaly.py --clients 10000 --days 30
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+from volume_anomaly import (  # noqa: E402
+    VOLUME_BUCKET_SECONDS, VOLUME_PAGE_SIZE, VOLUME_RECENT_BUCKETS, MatrixBuilder, VolumeAnomalyJob, hour_of_week,
+)
+
+
+def synthetic_series(rng, clients: int, buckets: int, start_ms: int, fill: float) -> np.ndarray:
+    how = hour_of_week(start_ms, buckets)
+    hour, weekday = how % 24, how // 24
+    active = np.where((hour >= 9) & (hour < 19), 1.0, 0.08) * np.where(weekday >= 5, 0.3, 1.0)
+    level = rng.lognormal(14, 1.0, clients).astype(np.float32)  # ~1.2MB per busy bucket
+    matrix = level[:, None] * active[None, :].astype(np.float32)
+    matrix *= rng.lognormal(0, 0.35, (clients, buckets)).astype(np.float32)
+    matrix[rng.random((clients, buckets)) > fill] = 0
+    return matrix
+
+
+def composite_pages(matrix: np.ndarray, start_ms: int, bucket_ms: int):
+    rows, cols = np.nonzero(matrix)
+    keys_ms = start_ms + cols.astype(np.int64) * bucket_ms
+    for lo in range(0, len(rows), VOLUME_PAGE_SIZE):
+        hi = lo + VOLUME_PAGE_SIZE
+        yield [
+            {"key": {"client": f"client-{r}", "bucket": int(k)}, "doc_count": 1, "bytes": {"value": float(v)}}
+            for r, k, v in zip(rows[lo:hi].tolist(), keys_ms[lo:hi].tolist(), matrix[rows[lo:hi], cols[lo:hi]].tolist())
+        ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=10_000)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--fill", type=float, default=0.25, help="share of client buckets with traffic")
+    parser.add_argument("--spikes", type=int, default=20)
+    parser.add_argument("--skip-assembly", action="store_true", help="score a dense matrix built in NumPy directly")
+    parser.add_argument("--seed", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    bucket_ms = VOLUME_BUCKET_SECONDS * 1000
+    buckets = args.days * 86400 // VOLUME_BUCKET_SECONDS
+    now_s = 1_740_000_000 // VOLUME_BUCKET_SECONDS * VOLUME_BUCKET_SECONDS
+    start_ms = (now_s - args.days * 86400) * 1000
+
+    matrix = synthetic_series(rng, args.clients, buckets, start_ms, 1.0 if args.skip_assembly else args.fill)
+    spiked = rng.choice(args.clients, args.spikes, replace=False)
+    for client in spiked:
+        column = buckets - 1 - rng.integers(0, VOLUME_RECENT_BUCKETS)
+        matrix[client, column] = 400 * 1024 * 1024  # a 400MB upload in one bucket
+    expected = {f"client-{c}" for c in spiked}
+
+    print(f"clients {args.clients}  buckets {buckets} ({args.days}d x 5m)  non-empty {np.count_nonzero(matrix):,}")
+
+    if args.skip_assembly:
+        clients = [f"client-{i}" for i in range(args.clients)]
+        assembled = matrix
+    else:
+        # Pages are generated lazily (17M+ dicts don't fit in memory at once); only
+        # the builder's own work is timed
+        builder = MatrixBuilder(start_ms, buckets, bucket_ms)
+        elapsed, pages = 0.0, 0
+        for page in composite_pages(matrix, start_ms, bucket_ms):
+            started = time.perf_counter()
+            builder.add_page(page)
+            elapsed += time.perf_counter() - started
+            pages += 1
+        started = time.perf_counter()
+        clients, assembled = builder.build()
+        elapsed += time.perf_counter() - started
+        print(f"assemble  {elapsed:7.2f}s  ({pages} composite pages)")
+
+    print(f"matrix    {assembled.nbytes / 1e6:7.0f}MB float32")
+    started = time.perf_counter()
+    anomalies = VolumeAnomalyJob().find_anomalies(clients, assembled, start_ms)
+    print(f"score     {time.perf_counter() - started:7.2f}s")
+
+    found = {a["client_id"] for a in anomalies}
+    print(f"anomalies {len(anomalies)}  injected {len(expected)}  recall {len(found & expected) / len(expected):.0%}  "
+          f"false positives {len(found - expected)}")
+
+
+if __name__ == "__main__":
+    main()
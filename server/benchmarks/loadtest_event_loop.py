@@ -0,0 +1,114 @@
+"""
+Event-loop latency while heavy aggregations run against Elasticsearch.
+
+Samples loop lag (how late a 10ms sleep wakes up) while N concurrent
+dashboard-style aggregations run, first through the shared async layer and
+then, with --compare-sync, through a blocking client called from the loop.
+
+    python benchmarks/loadtest_event_loop.py --url https://localhost:9200 \
+        --password secret --index proxy-logs --concurrency 8 --duration 20
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+from es_client import create_es_client, search, ES_AGGREGATION_TIMEOUT  # noqa: E402
+
+PROBE_INTERVAL = 0.01
+
+HEAVY_QUERY = {
+    "size": 0,
+    "query": {"range": {"@timestamp": {"gte": "now-30d"}}},
+    "aggs": {
+        "per_client": {
+            "terms": {"field": "client_id.keyword", "size": 500},
+            "aggs": {
+                "trend": {
+                    "date_histogram": {"field": "@timestamp", "fixed_interval": "5m"},
+                    "aggs": {"bytes": {"sum": {"field": "network.bytes"}}},
+                }
+            },
+        },
+        "domains": {"terms": {"field": "destination.domain.keyword", "size": 1000}},
+    },
+}
+
+
+async def probe_lag(stop: asyncio.Event, samples: list):
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(PROBE_INTERVAL)
+        samples.append(time.perf_counter() - started - PROBE_INTERVAL)
+
+
+def summarize(name: str, samples: list, requests: int, errors: int, duration: float):
+    samples = sorted(samples) or [0.0]
+    p50 = statistics.median(samples) * 1000
+    p99 = samples[min(int(len(samples) * 0.99), len(samples) - 1)] * 1000
+    print(f"{name:<8} loop lag p50={p50:7.2f}ms p99={p99:7.2f}ms max={samples[-1] * 1000:7.2f}ms "
+          f"aggregations={requests} ({requests / duration:.1f}/s) errors={errors}")
+
+
+async def run_phase(name: str, worker, concurrency: int, duration: float):
+    stop = asyncio.Event()
+    samples: list = []
+    counter = [0, 0]
+
+    async def loop_worker():
+        while not stop.is_set():
+            try:
+                await worker()
+                counter[0] += 1
+            except Exception:
+                counter[1] += 1
+                await asyncio.sleep(0.1)
+
+    probe = asyncio.create_task(probe_lag(stop, samples))
+    workers = [asyncio.create_task(loop_worker()) for _ in range(concurrency)] if worker else []
+    await asyncio.sleep(duration)
+    stop.set()
+    await asyncio.gather(probe, *workers, return_exceptions=True)
+    summarize(name, samples, counter[0], counter[1], duration)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="https://localhost:9200")
+    parser.add_argument("--user", default="elastic")
+    parser.add_argument("--password", default="")
+    parser.add_argument("--index", default="proxy-logs")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=20.0)
+    parser.add_argument("--compare-sync", action="store_true")
+    args = parser.parse_args()
+
+    es = create_es_client(args.url, args.user, args.password)
+
+    async def async_aggregation():
+        await search(es, args.index, HEAVY_QUERY, timeout=ES_AGGREGATION_TIMEOUT)
+
+    await run_phase("idle", None, 0, args.duration / 4)
+    await run_phase("async", async_aggregation, args.concurrency, args.duration)
+
+    if args.compare_sync:
+        from elasticsearch import Elasticsearch
+
+        sync_es = Elasticsearch([args.url], basic_auth=(args.user, args.password), verify_certs=False)
+
+        async def blocking_aggregation():
+            sync_es.search(index=args.index, body=HEAVY_QUERY)
+            await asyncio.sleep(0)
+
+        await run_phase("sync", blocking_aggregation, args.concurrency, args.duration)
+        sync_es.close()
+
+    await es.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,199 @@
+"""
+Websocket load against a running server, fed by the in-memory ES stand-in.
+
+Start the app on the fake backend (FAKE_ES_RATE synthetic packetbeat events/s,
+see app/fake_es.py), with the detection pipeline tailing the same index:
+
+    cd server/app
+    ES_BACKEND=fake FAKE_ES_RATE=5000 INDEX_NAME=proxy-logs RESTRICTED_DOMAINS_FILE=restricted_domains.csv \
+        DATABASE_URL=sqlite:///./loadtest.db uvicorn main:app --port 8000
+
+then open subscribers against it:
+
+    python benchmarks/loadtest_websockets.py --url http://localhost:8000 \
+        --logs 500 --alerts 50 --status 50 --dashboards 50 --duration 60
+
+Every --report-interval seconds, prints per endpoint the open connections,
+frames/s, log lines/s and, for /ws/logs, the delivery delay (arrival time
+minus the log's @timestamp: tailer settle delay + polling + fan-out +
+socket). Ends with the server's /detector-status tailer lag and fan-out
+counters.
+"""
+from collections import defaultdict
+from datetime import datetime
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+import aiohttp
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+from fake_es import FAKE_ES_CLIENTS  # noqa: E402
+
+# Delay samples kept per reporting interval
+DELAY_SAMPLES = 20000
+
+
+class EndpointStats:
+    def __init__(self):
+        self.open = 0
+        self.connects = 0
+        self.failures = 0
+        self.closed_by_server = 0
+        self.close_codes = defaultdict(int)
+        self.frames = 0
+        self.items = 0
+        self.bytes = 0
+        self.delays = []
+
+    def take(self) -> tuple:
+        """Counters since the last call, plus the delay samples."""
+        frames, items, delays = self.frames, self.items, self.delays
+        self.frames = self.items = 0
+        self.delays = []
+        return frames, items, delays
+
+
+def percentile(samples: list, p: float):
+    if not samples:
+        return None
+    samples = sorted(samples)
+    return samples[min(int(p * len(samples)), len(samples) - 1)]
+
+
+def log_delays(message: dict, received: float) -> list:
+    delays = []
+    for log in message.get("logs", ()):
+        try:
+            sent = datetime.fromisoformat(log["timestamp"]).timestamp()
+        except (KeyError, TypeError, ValueError):
+            continue
+        delays.append(received - sent)
+    return delays
+
+
+async def subscriber(session, url: str, kind: str, stats: EndpointStats, stop: asyncio.Event):
+    try:
+        ws = await session.ws_connect(url, max_msg_size=0)
+    except (aiohttp.ClientError, asyncio.TimeoutError):
+        stats.failures += 1
+        return
+    stats.connects += 1
+    stats.open += 1
+    try:
+        while not stop.is_set():
+            try:
+                msg = await asyncio.wait_for(ws.receive(), timeout=1.0)
+            except asyncio.TimeoutError:
+                continue
+            if msg.type in (aiohttp.WSMsgType.CLOSE, aiohttp.WSMsgType.CLOSED, aiohttp.WSMsgType.ERROR):
+                stats.closed_by_server += 1
+                stats.close_codes[ws.close_code] += 1
+                break
+            received = time.time()
+            stats.frames += 1
+            stats.bytes += len(msg.data)
+            payload = json.loads(msg.data)
+            if kind == "logs":
+                delays = log_delays(payload, received)
+                stats.items += len(delays)
+                if len(stats.delays) < DELAY_SAMPLES:
+                    stats.delays.extend(delays)
+            elif kind == "dashboards" and isinstance(payload, dict) and payload.get("type") == "ping":
+                await ws.send_json({"type": "pong"})
+            else:
+                stats.items += 1
+    finally:
+        stats.open -= 1
+        await ws.close()
+
+
+def report(elapsed: float, interval: float, endpoints: dict):
+    parts = []
+    for kind, stats in endpoints.items():
+        frames, items, delays = stats.take()
+        line = f"{kind} {stats.open} open {frames / interval:,.0f} fr/s"
+        if kind == "logs":
+            p50, p99 = percentile(delays, 0.5), percentile(delays, 0.99)
+            line += f" {items / interval:,.0f} logs/s"
+            if p50 is not None:
+                line += f" delay p50={p50:.2f}s p99={p99:.2f}s"
+        parts.append(line)
+    print(f"[{elapsed:6.1f}s] " + " | ".join(parts), flush=True)
+
+
+async def main_async(args):
+    http_url = args.url.rstrip("/")
+    ws_url = http_url.replace("http://", "ws://").replace("https://", "wss://")
+    client_ids = [f"{args.client_prefix}-{i:04d}" for i in range(args.clients)]
+    plan = (
+        [("logs", f"{ws_url}/ws/logs/{client_ids[i % len(client_ids)]}") for i in range(args.logs)]
+        + [("alerts", f"{ws_url}/ws/alert")] * args.alerts
+        + [("status", f"{ws_url}/ws")] * args.status
+        + [("dashboards", f"{ws_url}/ws/visualizations")] * args.dashboards
+    )
+    endpoints = {kind: EndpointStats() for kind in dict.fromkeys(kind for kind, _ in plan)}
+    stop = asyncio.Event()
+    connector = aiohttp.TCPConnector(limit=0)
+
+    async with aiohttp.ClientSession(connector=connector) as session:
+        started = time.perf_counter()
+        tasks = []
+        for kind, url in plan:
+            tasks.append(asyncio.create_task(subscriber(session, url, kind, endpoints[kind], stop)))
+            if args.ramp:
+                await asyncio.sleep(args.ramp / len(plan))
+
+        for kind, stats in endpoints.items():
+            stats.take()
+        last = time.perf_counter()
+        while time.perf_counter() - started < args.duration:
+            await asyncio.sleep(args.report_interval)
+            now = time.perf_counter()
+            report(now - started, now - last, endpoints)
+            last = now
+
+        stop.set()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+        print()
+        for kind, stats in endpoints.items():
+            codes = dict(stats.close_codes) if stats.close_codes else {}
+            print(f"{kind:<11} connects={stats.connects} failed={stats.failures} "
+                  f"closed_by_server={stats.closed_by_server} {codes} received={stats.bytes / 1e6:.1f}MB")
+        try:
+            async with session.get(f"{http_url}/detector-status") as response:
+                status = await response.json()
+        except aiohttp.ClientError as e:
+            print(f"detector-status unavailable: {e}")
+            return
+        detection = status.get("detection", {}).get("tailer", {})
+        print(f"detection  docs={detection.get('docs_processed')} lag={detection.get('lag_seconds')}s")
+        stream = status.get("log_stream", {})
+        print(f"log stream docs={stream.get('docs_processed')} lag={stream.get('lag_seconds')}s "
+              f"connections={stream.get('connections')}")
+        print(f"alerts     {json.dumps(status.get('alerts_fanout'))}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--logs", type=int, default=200, help="/ws/logs/{client_id} subscribers")
+    parser.add_argument("--alerts", type=int, default=20, help="/ws/alert subscribers")
+    parser.add_argument("--status", type=int, default=20, help="/ws client-status subscribers")
+    parser.add_argument("--dashboards", type=int, default=20, help="/ws/visualizations subscribers")
+    parser.add_argument("--clients", type=int, default=FAKE_ES_CLIENTS, help="client ids the generator uses")
+    parser.add_argument("--client-prefix", default="client")
+    parser.add_argument("--duration", type=float, default=60.0)
+    parser.add_argument("--ramp", type=float, default=5.0, help="seconds over which connections are opened")
+    parser.add_argument("--report-interval", type=float, default=5.0)
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
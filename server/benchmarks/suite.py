@@ -0,0 +1,352 @@
+"""
+Benchmark suite for the backend hot paths, with baseline comparison.
+
+Every case runs on synthetic packetbeat-shaped data at each size from
+10^3 up to --max-size (10^6 with --full). A case is timed best-of-N after
+one warm-up call, with the GC paused, and reported as seconds per call,
+ns per item and items/s.
+
+Results are written as JSON (--output). Against a stored baseline
+(--baseline) any case slower than the baseline by more than --tolerance
+is listed as a REGRESSION and the run exits with status 1. Baselines are
+machine-specific; record one on the box that runs the comparison:
+
+    python benchmarks/suite.py --save-baseline benchmarks/baseline.json
+    python benchmarks/suite.py --baseline benchmarks/baseline.json
+    python benchmarks/suite.py --cases domain_suffix_search log_projection --full
+"""
+from typing import Callable, Dict, List, Optional, Tuple
+import argparse
+import asyncio
+import contextlib
+import gc
+import io
+import json
+import os
+import platform
+import random
+import string
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+from detection import EventBatch  # noqa: E402
+from domains import DomainSuffixMatcher, DomainTrie, RestrictedDomainBlocklist, RootDomainExtractor  # noqa: E402
+from fanout import ConnectionManager  # noqa: E402
+from log_projection import project_hits  # noqa: E402
+from visualizations import shape_result  # noqa: E402
+from working_hours import WorkingHoursPolicies, WorkingHoursPolicy  # noqa: E402
+
+SIZES = (10**3, 10**4, 10**5, 10**6)
+DEFAULT_MAX_SIZE = 10**5
+DEFAULT_TOLERANCE = 0.25
+MIN_TIME = 0.5
+MAX_REPEATS = 25
+
+TLDS = ("com", "net", "org", "io", "in", "co.uk", "com.au", "de")
+PROTOCOLS = ("dns", "http", "tls", "tcp", "udp", "icmp")
+START_MS = 1_740_000_000_000
+
+# A case's setup(size, rng) returns (timed callable, items per call, cleanup or None)
+Setup = Callable[[int, random.Random], Tuple[Callable[[], object], int, Optional[Callable[[], None]]]]
+CASES: Dict[str, Tuple[Setup, int]] = {}
+
+
+def case(name: str, max_size: int = SIZES[-1]):
+    def register(setup: Setup) -> Setup:
+        CASES[name] = (setup, max_size)
+        return setup
+    return register
+
+
+def random_domain(rng: random.Random) -> str:
+    label = "".join(rng.choices(string.ascii_lowercase + string.digits, k=rng.randint(5, 14)))
+    sub = rng.choice(("", "www.", "api.", "cdn.", "mail."))
+    return f"{sub}{label}.{rng.choice(TLDS)}"
+
+
+def packetbeat_hit(rng: random.Random, i: int, domains: List[str]) -> dict:
+    """An ES hit shaped like a proxy-logs packetbeat flow document."""
+    client = rng.randrange(500)
+    timestamp_ms = START_MS + i * 50
+    return {
+        "_id": f"doc-{i}",
+        "sort": [timestamp_ms],
+        "_source": {
+            "@timestamp": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(timestamp_ms / 1000)) + ".000Z",
+            "client_id": f"client-{client}",
+            "client_name": f"host-{client}",
+            "host": {"id": f"h{client}", "os": {"platform": "windows"}},
+            "network": {"transport": "tcp", "type": "ipv4", "protocol": rng.choice(PROTOCOLS),
+                        "bytes": rng.randrange(64, 1_000_000)},
+            "source": {"bytes": rng.randrange(64, 100_000), "mac": "00-11-22-33-44-55"},
+            "destination": {"domain": rng.choice(domains), "ip": f"10.0.{rng.randrange(256)}.{rng.randrange(256)}"},
+            "event": {"action": "network_flow", "duration": rng.randrange(10**9)},
+            "flow": {"id": f"flow-{i}"},
+            "server": {"domain": rng.choice(domains)},
+        },
+    }
+
+
+def packetbeat_hits(size: int, rng: random.Random) -> List[dict]:
+    domains = [random_domain(rng) for _ in range(min(size, 5000))]
+    return [packetbeat_hit(rng, i, domains) for i in range(size)]
+
+
+@case("domain_trie_insert")
+def _domain_trie_insert(size, rng):
+    domains = [random_domain(rng) for _ in range(size)]
+
+    def run():
+        trie = DomainTrie()
+        for domain in domains:
+            trie.insert(domain)
+    return run, size, None
+
+
+@case("domain_trie_search")
+def _domain_trie_search(size, rng):
+    blocklist = [random_domain(rng) for _ in range(size)]
+    trie = DomainTrie()
+    for domain in blocklist:
+        trie.insert(domain)
+    queries = [rng.choice(blocklist) if rng.random() < 0.1 else random_domain(rng) for _ in range(size)]
+    return lambda: [trie.search(q) for q in queries], size, None
+
+
+@case("domain_suffix_search")
+def _domain_suffix_search(size, rng):
+    blocklist = [random_domain(rng) for _ in range(size)]
+    matcher = DomainSuffixMatcher(blocklist)
+    queries = [rng.choice(blocklist) if rng.random() < 0.1 else random_domain(rng) for _ in range(size)]
+    return lambda: matcher.match_many(queries), size, None
+
+
+@case("extract_root_domain_cold")
+def _extract_root_domain_cold(size, rng):
+    extractor = RootDomainExtractor(cache_size=size)
+    hosts = [random_domain(rng) for _ in range(size)]
+
+    def run():
+        extractor.clear()
+        extractor.extract_many(hosts)
+    return run, size, None
+
+
+@case("extract_root_domain_warm")
+def _extract_root_domain_warm(size, rng):
+    extractor = RootDomainExtractor()
+    popular = [random_domain(rng) for _ in range(1000)]
+    hosts = [rng.choice(popular) for _ in range(size)]
+    extractor.extract_many(popular)
+    return lambda: extractor.extract_many(hosts), size, None
+
+
+@case("load_restricted_domains")
+def _load_restricted_domains(size, rng):
+    directory = tempfile.TemporaryDirectory()
+    path = os.path.join(directory.name, "restricted_domains.csv")
+    with open(path, "w", encoding="utf-8") as file:
+        file.write("\n".join(random_domain(rng) for _ in range(size)))
+
+    def run():
+        with contextlib.redirect_stdout(io.StringIO()):
+            RestrictedDomainBlocklist(path).reload()
+    return run, size, directory.cleanup
+
+
+@case("log_projection")
+def _log_projection(size, rng):
+    hits = packetbeat_hits(size, rng)
+    return lambda: project_hits(hits), size, None
+
+
+@case("event_normalize")
+def _event_normalize(size, rng):
+    hits = packetbeat_hits(size, rng)
+    extractor = RootDomainExtractor()
+    return lambda: EventBatch.from_hits(hits, extractor.extract_many), size, None
+
+
+@case("working_hours_evaluate")
+def _working_hours_evaluate(size, rng):
+    policies = WorkingHoursPolicies(
+        WorkingHoursPolicy(9, 18, "Asia/Kolkata"),
+        {"night-ops": WorkingHoursPolicy(22, 6, "Asia/Kolkata"), "us-support": WorkingHoursPolicy(9, 17, "America/New_York")},
+    )
+    epoch_ms = START_MS + np.sort(np.random.default_rng(rng.randrange(2**32)).integers(0, 30 * 86400 * 1000, size))
+    client_ids = [f"client-{rng.randrange(500)}" for _ in range(size)]
+    roles = {f"client-{i}": rng.choice(("night-ops", "us-support")) for i in range(0, 500, 3)}
+    return lambda: policies.evaluate(epoch_ms, client_ids, roles), size, None
+
+
+class _IdleSocket:
+    async def accept(self):
+        pass
+
+    async def send_text(self, message: str):
+        pass
+
+    async def close(self, code: int = 1000):
+        pass
+
+
+@case("alert_fanout", max_size=10**5)
+def _alert_fanout(size, rng):
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    manager = ConnectionManager()
+
+    async def attach_all():
+        # Writers start parked; the timed send_alert() is the synchronous enqueue the detector pays
+        for _ in range(size):
+            manager.attach(_IdleSocket())
+    loop.run_until_complete(attach_all())
+    alert = {"type": "alert", "message": "🚨 ALERT: host-1 accessed a restricted domain: example.com",
+             "timestamp": "2025-02-19 12:00:00"}
+
+    def cleanup():
+        for sender in list(manager.senders.values()):
+            sender.cancel()
+        loop.run_until_complete(asyncio.sleep(0))
+        loop.close()
+        asyncio.set_event_loop(None)
+    return lambda: manager.send_alert(alert), size, cleanup
+
+
+@case("visualization_shape")
+def _visualization_shape(size, rng):
+    # `size` buckets spread over the five aggregations, as fetch_visualization_data receives them
+    per_agg = max(size // 5, 1)
+    days = max(per_agg // 10, 1)
+    aggregations = {
+        "top_clients": {"buckets": [{"key": f"client-{i}", "total_bytes": {"value": float(i)}} for i in range(per_agg)]},
+        "network_trend": {"buckets": [{"key_as_string": f"2025-02-19 {i % 24:02d}:00:00", "total_bytes": {"value": 1.0}}
+                                      for i in range(per_agg)]},
+        "protocol_usage": {"buckets": [{"key": rng.choice(PROTOCOLS), "total_bytes": {"value": 1.0}} for _ in range(per_agg)]},
+        "record_counts_over_time": {"buckets": [{"key_as_string": f"{i % 28 + 1} Feb 2025", "doc_count": i}
+                                                for i in range(per_agg)]},
+        "top_domains": {"buckets": [
+            {"key_as_string": f"2025-02-{d % 28 + 1:02d}",
+             "domains": {"buckets": [{"key": random_domain(rng), "visit_count": {"value": 1}} for _ in range(10)]}}
+            for d in range(days)
+        ]},
+    }
+    return lambda: shape_result(aggregations), size, None
+
+
+def measure(run: Callable[[], object], min_time: float = MIN_TIME, max_repeats: int = MAX_REPEATS) -> Tuple[float, int]:
+    """Best-of-N seconds per call after a warm-up call; repeats until min_time or max_repeats."""
+    run()
+    timings = []
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        while len(timings) < max_repeats and (sum(timings) < min_time or len(timings) < 3):
+            started = time.perf_counter()
+            run()
+            timings.append(time.perf_counter() - started)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    return min(timings), len(timings)
+
+
+def metadata() -> dict:
+    commit = None
+    with contextlib.suppress(Exception):
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "commit": commit,
+        "finished_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+    }
+
+
+def run_suite(names: List[str], max_size: int, seed: int) -> dict:
+    results = {}
+    for name in names:
+        setup, case_max = CASES[name]
+        for size in SIZES:
+            if size > min(max_size, case_max):
+                continue
+            run, items, cleanup = setup(size, random.Random(seed))
+            try:
+                seconds, repeats = measure(run)
+            finally:
+                if cleanup is not None:
+                    cleanup()
+            key = f"{name}@{size}"
+            results[key] = {
+                "case": name,
+                "size": size,
+                "seconds": seconds,
+                "ns_per_item": seconds / items * 1e9,
+                "items_per_second": items / seconds if seconds else None,
+                "repeats": repeats,
+            }
+            print(f"{key:<36}{seconds * 1000:>12.3f}ms{seconds / items * 1e9:>12.1f}ns/item"
+                  f"{items / seconds:>16,.0f}/s", flush=True)
+    return {"meta": metadata(), "results": results}
+
+
+def compare(current: dict, baseline: dict, tolerance: float) -> List[str]:
+    """Print the comparison; returns the keys that regressed beyond `tolerance`."""
+    regressions = []
+    print(f"\nvs baseline ({baseline.get('meta', {}).get('commit')}, tolerance +{tolerance:.0%})")
+    for key, result in current["results"].items():
+        before = baseline.get("results", {}).get(key)
+        if before is None:
+            print(f"{key:<36}{'new':>12}")
+            continue
+        ratio = result["seconds"] / before["seconds"]
+        status = "ok"
+        if ratio > 1 + tolerance:
+            status = "REGRESSION"
+            regressions.append(key)
+        elif ratio < 1 / (1 + tolerance):
+            status = "faster"
+        print(f"{key:<36}{ratio:>11.2f}x  {status}")
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cases", nargs="+", choices=sorted(CASES), default=list(CASES))
+    parser.add_argument("--max-size", type=int, default=DEFAULT_MAX_SIZE)
+    parser.add_argument("--full", action="store_true", help=f"run up to {SIZES[-1]:,} items")
+    parser.add_argument("--output", help="write results JSON here")
+    parser.add_argument("--baseline", help="compare against this results JSON; regressions exit 1")
+    parser.add_argument("--save-baseline", help="write results JSON here as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="allowed slowdown (0.25 = 25%%)")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    results = run_suite(args.cases, SIZES[-1] if args.full else args.max_size, args.seed)
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, "w", encoding="utf-8") as file:
+                json.dump(results, file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as file:
+            baseline = json.load(file)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\n❌ {len(regressions)} benchmark(s) regressed: {', '.join(regressions)}", file=sys.stderr)
+            return 1
+        print("\n✅ No regressions")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,45 @@
+import atexit
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+# The app modules import each other as top-level modules (run from server/app)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+# Settings are read at import time, so they are pinned here, before any app module loads:
+# state files go to a scratch directory and ES is the empty in-memory stand-in
+_SCRATCH = tempfile.mkdtemp(prefix="ueba-tests-")
+atexit.register(shutil.rmtree, _SCRATCH, ignore_errors=True)
+for name, value in {
+    "DATABASE_URL": f"sqlite:///{os.path.join(_SCRATCH, 'ueba.db')}",
+    "JWT_EXPIRATION": "30",
+    "RESTRICTED_DOMAINS_FILE": os.path.join(_SCRATCH, "restricted_domains.csv"),
+    "UEBA_DATA_DIR": os.path.join(_SCRATCH, "data"),
+    "ES_BACKEND": "fake",
+    "FAKE_ES_RATE": "0",
+    "FAKE_ES_BACKFILL_DOCS": "0",
+}.items():
+    os.environ.setdefault(name, value)
+
+TEST_CLIENT_ID = "client-0001"
+
+
+@pytest.fixture(scope="session")
+def api():
+    """A TestClient on the app (background tasks not started) and a client id registered in its DB."""
+    from fastapi.testclient import TestClient
+
+    import main
+    from models import Clients
+
+    db = main.SessionLocal()
+    try:
+        if db.get(Clients, TEST_CLIENT_ID) is None:
+            db.add(Clients(id=TEST_CLIENT_ID, client_name="Test client", client_role="staff"))
+            db.commit()
+    finally:
+        db.close()
+    return TestClient(main.app), TEST_CLIENT_ID
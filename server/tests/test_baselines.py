@@ -0,0 +1,54 @@
+import numpy as np
+
+from baselines import FEATURES, BaselineEngine, hll_add, hll_count, _destination_hashes
+from detection import EventBatch
+from domains import extract_root_domains
+
+WINDOW_MS = 300_000
+DESTINATIONS = FEATURES.index("destinations")
+
+
+def _batch(window, client_id, destinations, domain=True):
+    hits = []
+    for i, destination in enumerate(destinations):
+        target = {"domain": destination} if domain else {"ip": destination}
+        hits.append({"_id": f"{client_id}-{window}-{i}", "sort": [window * WINDOW_MS + i],
+                     "_source": {"client_id": client_id, "destination": target,
+                                 "network": {"bytes": 100, "protocol": "tls"}}})
+    return EventBatch.from_hits(hits, extract_root_domains)
+
+
+def _destinations_of_first_window(engine, client_id):
+    # The first window seeds the mean, so it holds log1p(distinct destinations) of that window
+    return float(np.expm1(engine.mean[engine.slots[client_id], DESTINATIONS]))
+
+
+def test_hll_counts_distinct_destinations_closely():
+    for count in (1, 3, 10, 40, 300):
+        registers = np.zeros((1, 128), dtype=np.uint8)
+        names = [f"host-{i}.example.org" for i in range(count)]
+        hll_add(registers, np.zeros(count * 2, dtype=np.intp), _destination_hashes(names * 2))
+        assert abs(hll_count(registers)[0] - count) <= max(0.5, 0.15 * count)
+
+    registers = np.zeros((1, 128), dtype=np.uint8)
+    hll_add(registers, np.zeros(10000, dtype=np.intp), _destination_hashes([f"d{i}.example" for i in range(10000)]))
+    assert abs(hll_count(registers)[0] - 10000) < 0.3 * 10000
+
+
+def test_ip_only_clients_count_their_destinations():
+    engine = BaselineEngine(capacity=4)
+    ips = [f"10.0.{i // 250}.{i % 250}" for i in range(12)]
+    engine.update(_batch(0, "ip-only", ips + ips, domain=False))
+    engine.update(_batch(1, "ip-only", ips[:1], domain=False))
+    assert abs(_destinations_of_first_window(engine, "ip-only") - 12) < 2
+
+
+def test_state_does_not_grow_with_distinct_destinations():
+    engine = BaselineEngine(capacity=4)
+    engine.update(_batch(0, "client", ["example.com"]))
+    before = engine.stats()["state_bytes"]
+    engine.update(_batch(0, "client", [f"site-{i}.example.net" for i in range(5000)]))
+    assert engine.stats()["state_bytes"] == before
+    engine.update(_batch(1, "client", ["example.com"]))
+    # Root domains: example.com plus the 5000 distinct *.example.net names collapse to example.net
+    assert round(_destinations_of_first_window(engine, "client")) == 2
@@ -0,0 +1,84 @@
+import numpy as np
+
+from beaconing import BeaconingRule, BeaconTracker, score_periodicity
+from detection import EventBatch
+from domains import extract_root_domains
+
+START_MS = 1760313600000
+
+
+def _batch(events):
+    """events: (epoch_ms, client_id, domain, flow_id)"""
+    hits = [{"_id": str(i), "sort": [ms],
+             "_source": {"client_id": client_id, "client_name": client_id, "destination": {"domain": domain},
+                         "flow": {"id": flow_id}}}
+            for i, (ms, client_id, domain, flow_id) in enumerate(sorted(events))]
+    return EventBatch.from_hits(hits, extract_root_domains)
+
+
+def _beacon(client_id, domain, period_s, count, jitter_s=0.0, seed=0):
+    rng = np.random.default_rng(seed)
+    times = START_MS + (np.arange(count) * period_s + rng.uniform(-jitter_s, jitter_s, count)) * 1000
+    return [(int(ms), client_id, domain, f"{client_id}-{domain}-{i}") for i, ms in enumerate(times)]
+
+
+def _random(client_id, domain, count, seed=1):
+    rng = np.random.default_rng(seed)
+    times = START_MS + np.sort(rng.uniform(0, count * 60, count)) * 1000
+    return [(int(ms), client_id, domain, f"{client_id}-{domain}-{i}") for i, ms in enumerate(times)]
+
+
+def test_score_periodicity_separates_a_beacon_from_random_traffic():
+    rows = [np.arange(40) * 60.0, np.sort(np.random.default_rng(1).uniform(0, 2400, 40))]
+    times = np.stack(rows)
+    valid = np.ones_like(times, dtype=bool)
+    mean, jitter, periodicity = score_periodicity(times, valid)
+
+    assert mean[0] == 60.0
+    assert jitter[0] == 0.0
+    assert jitter[1] > 0.5
+    assert periodicity[0] > 2 * periodicity[1]
+
+
+def test_partially_filled_rows_are_scored_on_their_valid_entries():
+    times = np.array([[0.0, 0.0, 100.0, 130.0, 160.0, 190.0]])
+    valid = np.array([[False, False, True, True, True, True]])
+    mean, jitter, _ = score_periodicity(times, valid)
+    assert mean[0] == 30.0
+    assert jitter[0] == 0.0
+
+
+def test_rule_flags_the_beaconing_pair_only():
+    rule = BeaconingRule(tracker=BeaconTracker(max_pairs=16))
+    events = (_beacon("infected", "c2.example.net", 60, 48, jitter_s=2)
+              + _random("browsing", "news.example.org", 48)
+              + _beacon("chatty", "api.example.com", 1, 48))
+    alerts = rule.evaluate(_batch(events))
+    # The first batch only starts the scoring clock; a later event past the interval triggers a pass
+    alerts += rule.evaluate(_batch([(START_MS + 3600_000, "browsing", "news.example.org", "late")]))
+
+    assert [alert.key for alert in alerts] == [("beaconing", "infected", "example.net")]
+    assert 55 <= alerts[0].payload["period_seconds"] <= 65
+
+
+def test_a_long_lived_flow_reported_every_period_is_not_a_beacon():
+    tracker = BeaconTracker(max_pairs=4)
+    events = _beacon("client", "video.example.com", 30, 40)
+    tracker.add(_batch([(ms, client_id, domain, "one-flow") for ms, client_id, domain, _ in events]))
+
+    assert tracker.stats()["duplicate_flows"] == 39
+    assert len(tracker.score()[0]) == 0
+
+
+def test_tracker_stays_bounded_and_evicts_the_least_active_pair():
+    tracker = BeaconTracker(max_pairs=2, history=8)
+    tracker.add(_batch(_beacon("a", "busy.example.com", 60, 20)))
+    tracker.add(_batch(_beacon("b", "quiet.example.com", 60, 2, seed=2)))
+    tracker.add(_batch(_beacon("c", "new.example.com", 60, 3, seed=3)))
+
+    assert len(tracker) == 2
+    assert tracker.stats()["evicted"] == 1
+    assert set(tracker.slots) == {("a", "example.com"), ("c", "example.com")}
+    # The newcomer inherits the evicted pair's count (space-saving)
+    assert tracker.counts[tracker.slots[("c", "example.com")]] == 5
+    assert tracker.filled[tracker.slots[("a", "example.com")]] == 8
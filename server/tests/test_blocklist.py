@@ -0,0 +1,61 @@
+import pytest
+
+from domains import DomainSuffixMatcher, read_blocklist_csv, read_blocklist_entries, remove_blocklist_entry
+
+BOM = b"\xef\xbb\xbf"
+
+
+def _write(tmp_path, text: str):
+    path = tmp_path / "restricted_domains.csv"
+    path.write_bytes(BOM + text.encode("utf-8"))
+    return str(path)
+
+
+def test_first_entry_of_bom_csv_can_be_deleted(tmp_path):
+    path = _write(tmp_path, "google.com\nchatgpt.com\nexample.com\n")
+    assert read_blocklist_entries(path) == ["google.com", "chatgpt.com", "example.com"]
+
+    assert remove_blocklist_entry(path, "google.com")
+
+    assert read_blocklist_entries(path) == ["chatgpt.com", "example.com"]
+    assert "google.com" not in read_blocklist_csv(path)
+    with open(path, "rb") as file:
+        assert file.read() == BOM + b"chatgpt.com\nexample.com\n"
+
+
+def test_missing_entry_leaves_file_alone(tmp_path):
+    path = _write(tmp_path, "google.com\n")
+    assert not remove_blocklist_entry(path, "github.com")
+    assert read_blocklist_entries(path) == ["google.com"]
+
+
+def test_legacy_url_header_is_not_an_entry(tmp_path):
+    path = _write(tmp_path, "url\ngoogle.com\n")
+    assert read_blocklist_entries(path) == ["google.com"]
+    assert remove_blocklist_entry(path, "google.com")
+    assert read_blocklist_entries(path) == []
+
+
+@pytest.mark.parametrize("domain, blocked", [
+    ("google.com", True),
+    ("mail.google.com", True),
+    ("a.b.mail.google.com", True),
+    ("MAIL.Google.COM", True),
+    ("notgoogle.com", False),
+    ("google.com.evil.net", False),
+    ("com", False),
+    ("bbc.co.uk", True),
+    ("news.bbc.co.uk", True),
+    ("co.uk", False),
+])
+def test_suffix_matcher_matches_on_label_boundaries(domain, blocked):
+    matcher = DomainSuffixMatcher(["google.com", " .BBC.co.uk. ", ""])
+    assert matcher.search(domain) is blocked
+    assert (domain in matcher) is blocked
+
+
+def test_suffix_matcher_batches_like_single_lookups():
+    matcher = DomainSuffixMatcher(["google.com"])
+    domains = ["google.com", "notgoogle.com", "docs.google.com"]
+    assert len(matcher) == 1
+    assert matcher.match_many(domains) == [matcher.search(domain) for domain in domains] == [True, False, True]
@@ -0,0 +1,78 @@
+import json
+import time
+
+from cooldown import CooldownStore
+
+
+def test_key_is_suppressed_until_its_ttl_runs_out():
+    store = CooldownStore(ttl=60, path=None)
+    key = ("restricted_domain", "client-0001", "example.com")
+
+    assert store.check_and_set(key, now=1000)
+    assert not store.check_and_set(key, now=1059)
+    assert store.is_cooling_down(key, now=1059)
+    assert not store.is_cooling_down(key, now=1060)
+    assert store.check_and_set(key, now=1060)
+    assert store.stats()["fired"] == 2
+    assert store.stats()["suppressed"] == 1
+
+
+def test_expired_entries_are_dropped_instead_of_accumulating():
+    store = CooldownStore(ttl=10, path=None)
+    for i in range(100):
+        store.check_and_set(("rule", f"client-{i}"), now=1000 + i)
+
+    store.check_and_set(("rule", "late"), now=1200)
+    assert len(store) == 1
+    assert store.stats()["expired"] == 100
+
+
+def test_cap_evicts_the_entries_closest_to_expiry():
+    store = CooldownStore(ttl=60, max_entries=3, path=None)
+    for i in range(5):
+        assert store.check_and_set(("rule", i), now=1000 + i)
+
+    assert len(store) == 3
+    assert store.stats()["evicted"] == 2
+    assert not store.is_cooling_down(("rule", 0), now=1010)
+    assert store.is_cooling_down(("rule", 4), now=1010)
+
+
+def test_snapshot_round_trips_live_entries_only(tmp_path):
+    path = str(tmp_path / "cooldowns.json")
+    now = time.time()
+    store = CooldownStore(ttl=60, path=path)
+    store.check_and_set(("restricted_domain", "client-0001", "example.com"), now=now)
+    store.check_and_set("legacy-key", now=now)
+    store.check_and_set(("working_hours", "client-0002"), now=now - 120)
+    store.save()
+    assert not store.dirty
+
+    restored = CooldownStore(ttl=60, path=path)
+    restored.load()
+
+    assert len(restored) == 2
+    assert restored.is_cooling_down(("restricted_domain", "client-0001", "example.com"))
+    assert restored.is_cooling_down("legacy-key")
+    assert not restored.check_and_set(("restricted_domain", "client-0001", "example.com"))
+    assert restored.check_and_set(("working_hours", "client-0002"))
+
+
+def test_restart_keeps_only_the_newest_entries_under_a_smaller_cap(tmp_path):
+    path = tmp_path / "cooldowns.json"
+    now = time.time()
+    path.write_text(json.dumps({"ttl": 60, "entries": [[["rule", i], now + i] for i in range(1, 6)]}))
+
+    restored = CooldownStore(ttl=60, max_entries=2, path=str(path))
+    restored.load()
+
+    assert len(restored) == 2
+    assert restored.is_cooling_down(("rule", 5)) and restored.is_cooling_down(("rule", 4))
+
+
+def test_unreadable_snapshot_is_ignored(tmp_path):
+    path = tmp_path / "cooldowns.json"
+    path.write_text("{not json")
+    store = CooldownStore(ttl=60, path=str(path))
+    store.load()
+    assert len(store) == 0
@@ -0,0 +1,100 @@
+import asyncio
+import time
+
+from baselines import BaselineRule
+from beaconing import BeaconingRule
+from cooldown import CooldownStore
+from detection import DetectionPipeline, EventBatch, Rule
+from domains import RestrictedDomainBlocklist, extract_root_domains
+from fake_es import FakeElasticsearch
+from packetbeat_generator import format_timestamp
+from rules import OutsideWorkingHoursRule, RestrictedDomainRule
+from working_hours import WorkingHoursPolicies
+
+INDEX = "proxy-logs"
+
+
+class RecordingRule(Rule):
+    def __init__(self, name, query=None):
+        self.name = name
+        self.query = query
+        self.seen = []
+
+    def evaluate(self, batch):
+        self.seen.extend(batch.ids)
+        return []
+
+
+def _pipeline(rules):
+    return DetectionPipeline(index=INDEX, rules=rules, cooldowns=CooldownStore(ttl=300, path=None),
+                             sink=lambda payload, key: None, root_domains=extract_root_domains)
+
+
+def _blocklist_rule(tmp_path):
+    blocklist_file = tmp_path / "restricted_domains.csv"
+    blocklist_file.write_text("example.com\n")
+    blocklist = RestrictedDomainBlocklist(str(blocklist_file))
+    blocklist.reload()
+    return RestrictedDomainRule(blocklist)
+
+
+def test_selective_rules_are_pushed_down():
+    hours = OutsideWorkingHoursRule(WorkingHoursPolicies.load(None))
+    pipeline = _pipeline([hours])
+    assert pipeline.tailer.query == hours.query
+    assert pipeline.tailer.runtime_mappings == hours.runtime_mappings
+
+    other = RecordingRule("other", {"term": {"network.protocol": "dns"}})
+    pipeline = _pipeline([hours, other])
+    assert pipeline.tailer.query == {"bool": {"should": [hours.query, other.query], "minimum_should_match": 1}}
+    assert pipeline.tailer.runtime_mappings == hours.runtime_mappings
+
+
+def test_covered_query_and_its_runtime_fields_are_dropped(tmp_path):
+    restricted = _blocklist_rule(tmp_path)
+    pipeline = _pipeline([restricted, OutsideWorkingHoursRule(WorkingHoursPolicies.load(None))])
+    # Every working-hours candidate has a domain, so the OR is just the exists filter
+    assert pipeline.tailer.query == restricted.query
+    assert pipeline.tailer.runtime_mappings is None
+    assert pipeline.stats()["tailer"]["pushed_down"] == ["restricted_domain"]
+
+
+def test_match_all_rule_tails_everything_without_runtime_fields(tmp_path):
+    rules = [_blocklist_rule(tmp_path), OutsideWorkingHoursRule(WorkingHoursPolicies.load(None)),
+             BaselineRule(), BeaconingRule()]
+    pipeline = _pipeline(rules)
+    assert pipeline.tailer.query == {"match_all": {}}
+    assert pipeline.tailer.runtime_mappings is None
+    assert pipeline.stats()["tailer"]["pushed_down"] == []
+
+
+def test_each_hit_is_normalized_once_and_seen_by_every_rule(monkeypatch):
+    normalized = []
+    from_hits = EventBatch.from_hits.__func__
+
+    def counting_from_hits(cls, hits, root_domains):
+        normalized.extend(hit["_id"] for hit in hits)
+        return from_hits(cls, hits, root_domains)
+
+    monkeypatch.setattr(EventBatch, "from_hits", classmethod(counting_from_hits))
+
+    async def run():
+        es = FakeElasticsearch()
+        now_ms = int(time.time() * 1000)
+        docs = [{"@timestamp": format_timestamp(now_ms - 60_000 + i), "client_id": "client-0001",
+                 "destination": {"ip": "10.0.0.1", **({"domain": "example.com"} if i % 2 else {})}}
+                for i in range(10)]
+        es.add_documents(INDEX, docs)
+        rules = [RecordingRule("selective", {"exists": {"field": "destination.domain"}}), RecordingRule("all")]
+        pipeline = _pipeline(rules)
+        pipeline.tailer.cursor_ms = 0
+        pipeline.tailer.batch_size = 4
+        for _ in range(5):
+            await pipeline.step(es)
+        assert pipeline.tailer.docs_processed == len(docs)
+        return rules
+
+    rules = asyncio.run(run())
+    assert len(normalized) == len(set(normalized)) == 10
+    for rule in rules:
+        assert rule.seen == normalized
@@ -0,0 +1,62 @@
+import pytest
+
+from domain_scoring import BENIGN, DGA, TUNNEL, DomainScorer
+from domains import extract_root_domains
+
+# Two base32 chunks of "exfiltrated" data, the way DNS tunnels pack it into labels
+TUNNELLED = "mv4gm2lmorzgc5dfmqqhaylzojxwy3bamrqxiyja.nvxxezjaonswg4tfoqqge6lumvzsa2dfojssa33l.t.example.com"
+# One 64-char label: near the DNS limit on its own
+LONG_LABEL = "aaab3c9d8e7f6a5b4c3d2e1f0a9b8c7d6e5f4a3b2c1d0e9f8a7b6c5d4e3f2a1.tunnel.example.org"
+
+
+@pytest.fixture(scope="module")
+def scorer():
+    return DomainScorer()
+
+
+@pytest.mark.parametrize("domain, verdict", [
+    ("google.com", BENIGN),
+    ("mail.google.com", BENIGN),
+    ("www.example.co.uk", BENIGN),
+    ("weather-forecast-online.com", BENIGN),
+    ("cdn77.org", BENIGN),
+    # Random-looking, but too short to call
+    ("xkq.com", BENIGN),
+    # Long cloud hostnames are not tunnels
+    ("my-bucket.s3.dualstack.us-east-1.amazonaws.com", BENIGN),
+    ("xjw3kq9zpl2vbn.com", DGA),
+    ("qzxvbnkpwtrfgh.net", DGA),
+    ("kd8f2nq0vz7xw3.info", DGA),
+    (TUNNELLED, TUNNEL),
+    (LONG_LABEL, TUNNEL),
+])
+def test_score_names_verdicts(scorer, domain, verdict):
+    [(got, _)] = scorer.score_names([domain], extract_root_domains([domain]))
+    assert got == verdict
+
+
+def test_scores_are_likelihood_for_dga_and_entropy_for_tunnels(scorer):
+    names = ["google.com", "xjw3kq9zpl2vbn.com", TUNNELLED]
+    (_, benign), (_, dga), (_, tunnel) = scorer.score_names(names, extract_root_domains(names))
+    # -likelihood: a random label is less likely under the bigram model than a real one
+    assert dga > benign
+    assert tunnel >= 3.8
+
+
+def test_batch_scoring_matches_one_name_at_a_time(scorer):
+    names = ["google.com", "xjw3kq9zpl2vbn.com", TUNNELLED, "xkq.com", LONG_LABEL]
+    roots = extract_root_domains(names)
+    assert scorer.score_names(names, roots) == [scorer.score_names([n], [r])[0] for n, r in zip(names, roots)]
+
+
+def test_repeated_names_are_scored_once():
+    scorer = DomainScorer(cache_size=2)
+    names = ["xjw3kq9zpl2vbn.com", "google.com", "xjw3kq9zpl2vbn.com"]
+    first = scorer.score(names, extract_root_domains(names))
+    assert first[0] == first[2]
+    assert scorer.stats()["misses"] == 2
+    assert scorer.stats()["dga_names"] == 1
+
+    assert scorer.score(names[:1], extract_root_domains(names[:1])) == first[:1]
+    assert scorer.stats()["hits"] == 1
+    assert scorer.stats()["size"] == 2
@@ -0,0 +1,57 @@
+import asyncio
+import time
+
+import fanout
+from fanout import CLOSE_TRY_AGAIN_LATER, DROP_OLDEST, ConnectionManager
+
+
+class FakeSocket:
+    def __init__(self, hung: bool = False, broken: bool = False):
+        self.hung = hung
+        self.broken = broken
+        self.received = []
+        self.close_code = None
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, message: str):
+        if self.hung:
+            await asyncio.Event().wait()
+        if self.broken:
+            raise RuntimeError("connection reset")
+        self.received.append((time.perf_counter(), message))
+
+    async def close(self, code: int = 1000):
+        self.close_code = code
+
+
+def test_stuck_sockets_are_closed_without_delaying_healthy_ones(monkeypatch):
+    monkeypatch.setattr(fanout, "SOCKET_SEND_TIMEOUT", 1.0)
+
+    async def run():
+        manager = ConnectionManager(max_queue=16, overflow=DROP_OLDEST)
+        healthy = [FakeSocket() for _ in range(2000)]
+        stuck = [FakeSocket(hung=True) for _ in range(50)] + [FakeSocket(broken=True) for _ in range(50)]
+        for socket in stuck[::2] + healthy + stuck[1::2]:
+            await manager.connect(socket)
+
+        started = time.perf_counter()
+        for i in range(5):
+            assert manager.send_alert({"type": "alert", "message": f"alert {i}"}) == len(healthy) + len(stuck)
+        while any(len(socket.received) < 5 for socket in healthy):
+            await asyncio.sleep(0.005)
+        delivered = time.perf_counter() - started
+
+        await asyncio.sleep(1.2)
+        # Checked before asyncio.run() cancels the writers
+        assert set(manager.active_connections) == set(healthy)
+        assert manager.stats()["failed"] == len(stuck)
+        return healthy, stuck, delivered
+
+    healthy, stuck, delivered = asyncio.run(run())
+    # Healthy sockets never wait out a stuck one's send timeout
+    assert delivered < fanout.SOCKET_SEND_TIMEOUT
+    assert all(len(socket.received) == 5 for socket in healthy)
+    assert all(socket.close_code is None for socket in healthy)
+    assert all(socket.close_code == CLOSE_TRY_AGAIN_LATER for socket in stuck)
@@ -0,0 +1,66 @@
+import json
+
+import pytest
+
+from log_export import EXPORT_MAX_RANGE_DAYS, ExportRangeError, parse_export_range
+from packetbeat_generator import format_timestamp
+
+NOW_MS = 1760529600000  # 2025-10-15T12:00:00Z
+
+
+def test_iso_and_epoch_millis_bounds():
+    assert parse_export_range("2025-10-15T11:00:00Z", str(NOW_MS), now_ms=NOW_MS) == (NOW_MS - 3600_000, NOW_MS)
+    # Zoneless times are UTC, like in ES
+    assert parse_export_range("2025-10-15T12:00:00", None, now_ms=NOW_MS) == (NOW_MS, None)
+    assert parse_export_range(None, "", now_ms=NOW_MS) == (None, None)
+
+
+@pytest.mark.parametrize("start", ["2024", "1760529600", "20241", "yesterday", "2025-13-01"])
+def test_short_digit_strings_and_garbage_are_rejected(start):
+    with pytest.raises(ExportRangeError, match="Invalid start"):
+        parse_export_range(start, None, now_ms=NOW_MS)
+
+
+def test_start_after_end_is_rejected():
+    with pytest.raises(ExportRangeError, match="after end"):
+        parse_export_range("2025-10-15", "2025-10-14", now_ms=NOW_MS)
+
+
+def test_range_too_large_is_rejected_open_end_included():
+    with pytest.raises(ExportRangeError, match="too large"):
+        parse_export_range("2020-01-01", "2025-01-01", now_ms=NOW_MS)
+    with pytest.raises(ExportRangeError, match="too large"):
+        parse_export_range(str(NOW_MS - (EXPORT_MAX_RANGE_DAYS + 1) * 86400_000), None, now_ms=NOW_MS)
+    assert parse_export_range(str(NOW_MS - EXPORT_MAX_RANGE_DAYS * 86400_000), None, now_ms=NOW_MS)[0] is not None
+
+
+@pytest.mark.parametrize("params, detail", [
+    ({"start": "2025-10-15", "end": "2025-10-14"}, "start must not be after end"),
+    ({"start": "2024"}, "Invalid start"),
+    ({"end": "not-a-date"}, "Invalid end"),
+    ({"start": "2000-01-01", "end": "2025-01-01"}, "Range too large"),
+    ({"format": "xml"}, "Unsupported format"),
+])
+def test_export_rejects_bad_parameters_with_400(api, params, detail):
+    client, client_id = api
+    response = client.get(f"/clients/{client_id}/export", params=params)
+    assert response.status_code == 400
+    assert response.json()["detail"].startswith(detail)
+
+
+def test_export_streams_the_requested_range(api):
+    import main
+
+    client, client_id = api
+    main.es.add_documents("proxy-logs", [
+        {"@timestamp": format_timestamp(NOW_MS - minutes * 60_000), "client_id": client_id,
+         "destination": {"domain": f"site-{minutes}.example"}}
+        for minutes in range(0, 120, 10)
+    ])
+    response = client.get(f"/clients/{client_id}/export", params={
+        "gzip": "false", "start": "2025-10-15T11:00:00Z", "end": str(NOW_MS - 1),
+    })
+    assert response.status_code == 200
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert [row["timestamp"] for row in rows] == [format_timestamp(NOW_MS - minutes * 60_000)
+                                                  for minutes in range(10, 61, 10)]
@@ -0,0 +1,44 @@
+import time
+
+from fake_es import _filter_source
+from log_projection import LOG_FIELD_MAP, LOG_SOURCE_INCLUDES, project_hit, project_hits
+from packetbeat_generator import PacketbeatGenerator
+from schemas import Log
+
+
+def _lookup(source: dict, path: str, default):
+    # Field-by-field reference walk of the dotted path
+    node = source
+    for key in path.split("."):
+        if not isinstance(node, dict) or key not in node:
+            return default
+        node = node[key]
+    return node
+
+
+def test_projection_matches_a_field_by_field_walk():
+    now_ms = int(time.time() * 1000)
+    docs = PacketbeatGenerator(seed=7, clients=5).documents(50, now_ms - 60_000, now_ms)
+    hits = [{"_id": str(i), "_source": doc} for i, doc in enumerate(docs)]
+
+    for hit, log in zip(hits, project_hits(hits)):
+        assert list(log) == ["id", *LOG_FIELD_MAP]
+        assert log == {"id": hit["_id"], **{field: _lookup(hit["_source"], path, default)
+                                            for field, (path, default) in LOG_FIELD_MAP.items()}}
+        Log(**log)
+
+
+def test_source_includes_keep_every_projected_field():
+    now_ms = int(time.time() * 1000)
+    doc = PacketbeatGenerator(seed=7, clients=1).document(now_ms)
+    full = project_hit({"_id": "a", "_source": doc})
+    assert project_hit({"_id": "a", "_source": _filter_source(doc, LOG_SOURCE_INCLUDES)}) == full
+
+
+def test_missing_fields_and_parents_fall_back_to_defaults():
+    log = project_hit({"_id": "a", "_source": {"client_name": "Alice", "network": None, "event": {}}})
+    assert log["client_name"] == "Alice"
+    assert log["network_transport"] == "N/A"
+    assert log["event_duration"] == 0
+    assert log["os_platform"] == "N/A"
+    assert project_hit({"_id": "b"})["source_bytes"] == 0
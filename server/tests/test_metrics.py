@@ -0,0 +1,82 @@
+import re
+
+import pytest
+
+from metrics import MetricsRegistry
+
+# name{label="value",...} number, per the Prometheus text exposition format
+SAMPLE = re.compile(r'^[a-zA-Z_:][a-zA-Z0-9_:]*(\{([a-zA-Z_][a-zA-Z0-9_]*="([^"\\]|\\.)*",?)*\})? '
+                    r'(-?[0-9.e+-]+|\+Inf|-Inf|NaN)$')
+
+
+def _lines(registry) -> list:
+    text = registry.render()
+    assert text.endswith("\n")
+    return text.splitlines()
+
+
+def test_counter_renders_help_type_and_escaped_labels():
+    registry = MetricsRegistry()
+    counter = registry.counter("ueba_test_total", "Things counted", ("site",))
+    counter.inc(("a\"b\\c\nd",))
+    counter.inc(("plain",), amount=2.5)
+
+    assert _lines(registry) == [
+        "# HELP ueba_test_total Things counted",
+        "# TYPE ueba_test_total counter",
+        'ueba_test_total{site="a\\"b\\\\c\\nd"} 1',
+        'ueba_test_total{site="plain"} 2.5',
+    ]
+
+
+def test_histogram_buckets_are_cumulative_with_inclusive_bounds():
+    registry = MetricsRegistry()
+    histogram = registry.histogram("ueba_test_seconds", "Latency", ("loop",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.observe(value, ("x",))
+
+    assert _lines(registry)[2:] == [
+        'ueba_test_seconds_bucket{loop="x",le="0.1"} 2',
+        'ueba_test_seconds_bucket{loop="x",le="1.0"} 3',
+        'ueba_test_seconds_bucket{loop="x",le="+Inf"} 4',
+        'ueba_test_seconds_sum{loop="x"} 3.65',
+        'ueba_test_seconds_count{loop="x"} 4',
+    ]
+
+
+def test_callbacks_are_read_at_scrape_time_and_failures_stay_local():
+    registry = MetricsRegistry()
+    state = {"connections": 3}
+    registry.callback("ueba_test_connections", "Open sockets", ("kind",),
+                      lambda: [(("alert",), state["connections"]), (("logs",), None)])
+    registry.callback("ueba_test_broken", "Raises", (), lambda: 1 / 0)
+    registry.counter("ueba_test_after_total", "Still rendered").inc()
+
+    state["connections"] = 5
+    lines = _lines(registry)
+    assert 'ueba_test_connections{kind="alert"} 5' in lines
+    assert not any(line.startswith('ueba_test_connections{kind="logs"}') for line in lines)
+    assert "# ueba_test_broken unavailable: division by zero" in lines
+    assert "ueba_test_after_total 1" in lines
+
+
+def test_metric_names_are_unique():
+    registry = MetricsRegistry()
+    registry.counter("ueba_test_total", "Once")
+    with pytest.raises(ValueError):
+        registry.counter("ueba_test_total", "Twice")
+
+
+def test_metrics_endpoint_serves_valid_text_format(api):
+    client, _ = api
+    response = client.get("/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    lines = response.text.splitlines()
+    assert "# TYPE ueba_es_request_seconds histogram" in lines
+    assert not [line for line in lines if " unavailable: " in line]
+    samples = [line for line in lines if not line.startswith("#")]
+    assert samples
+    for line in samples:
+        assert SAMPLE.match(line), line
@@ -0,0 +1,119 @@
+import asyncio
+import base64
+import json
+
+import pytest
+
+from fake_es import FakeElasticsearch
+from packetbeat_generator import format_timestamp
+from pagination import CursorError, decode_cursor, encode_cursor, search_after_page
+
+INDEX = "proxy-logs"
+QUERY = {"term": {"client_id": "client-0001"}}
+NOW_MS = 1760529600000
+
+
+def _es(count=250):
+    es = FakeElasticsearch()
+    # Ten documents per millisecond, so page boundaries fall inside runs of equal timestamps
+    es.add_documents(INDEX, ({"@timestamp": format_timestamp(NOW_MS - i // 10), "client_id": "client-0001"}
+                             for i in range(count)), ids=(f"doc-{i:03d}" for i in range(count)))
+    return es
+
+
+async def _page(es, cursor, scope="client-0001", size=100):
+    return await search_after_page(es, INDEX, QUERY, size, cursor, scope=scope)
+
+
+def test_cursor_round_trip_serves_every_hit_once_and_leaves_no_pit_open():
+    async def run():
+        es = _es()
+        hits, cursor = await _page(es, None)
+        pages = [hits]
+        # Page 1 is served without a point-in-time
+        assert es.stats()["open_pits"] == 0
+        assert decode_cursor(cursor).get("pit") is None
+        while cursor:
+            hits, cursor = await _page(es, cursor)
+            pages.append(hits)
+            if cursor:
+                assert es.stats()["open_pits"] == 1
+        return es, pages
+
+    es, pages = asyncio.run(run())
+    assert [len(page) for page in pages] == [100, 100, 50]
+    ids = [hit["_id"] for page in pages for hit in page]
+    assert sorted(ids) == [f"doc-{i:03d}" for i in range(250)]
+    timestamps = [hit["sort"][0] for page in pages for hit in page]
+    assert timestamps == sorted(timestamps, reverse=True)
+    assert es.stats()["open_pits"] == 0
+
+
+def test_single_page_opens_no_pit():
+    async def run():
+        es = _es(30)
+        hits, cursor = await _page(es, None)
+        return es, hits, cursor
+
+    es, hits, cursor = asyncio.run(run())
+    assert len(hits) == 30 and cursor is None
+    assert es.stats()["open_pits"] == 0
+
+
+@pytest.mark.parametrize("token", [
+    "not a cursor!",
+    base64.urlsafe_b64encode(b"[1, 2]").decode(),
+    encode_cursor({"scope": "client-0001", "after": [NOW_MS]}),
+    encode_cursor({"scope": "client-0001", "after": "yesterday", "seen": []}),
+    encode_cursor({"scope": "client-0001", "after": [NOW_MS, 3], "pit": {"id": "x"}}),
+    encode_cursor({"scope": "client-0001", "after": [NOW_MS], "seen": [1, 2]}),
+])
+def test_tampered_cursor_is_rejected(token):
+    with pytest.raises(CursorError, match="Malformed"):
+        asyncio.run(_page(_es(), token))
+
+
+def test_cursor_from_another_scope_is_rejected():
+    async def run():
+        es = _es()
+        _, cursor = await _page(es, None)
+        state = decode_cursor(cursor)
+        await _page(es, encode_cursor(dict(state, scope="client-0002")))
+
+    with pytest.raises(CursorError, match="does not belong"):
+        asyncio.run(run())
+
+
+def test_expired_cursor_is_rejected_and_fresh_walk_still_works():
+    async def run():
+        es = _es()
+        _, cursor = await _page(es, None)
+        _, cursor = await _page(es, cursor)
+        pit_id = decode_cursor(cursor)["pit"]
+        await es.close_point_in_time(id=pit_id)
+        with pytest.raises(CursorError, match="expired"):
+            await _page(es, cursor)
+        hits, _ = await _page(es, None)
+        return hits
+
+    assert len(asyncio.run(run())) == 100
+
+
+def test_refresh_maps_cursor_errors_to_400(api):
+    client, client_id = api
+    tampered = base64.urlsafe_b64encode(json.dumps({"scope": client_id, "after": "x"}).encode()).decode()
+    response = client.get(f"/clients/{client_id}/refresh", params={"cursor": tampered})
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Malformed cursor"
+
+    foreign = encode_cursor({"scope": "someone-else", "after": [NOW_MS], "seen": []})
+    response = client.get(f"/clients/{client_id}/refresh", params={"cursor": foreign})
+    assert response.status_code == 400
+
+    expired = encode_cursor({"scope": client_id, "after": [NOW_MS, 1], "pit": "gone"})
+    response = client.get(f"/clients/{client_id}/refresh", params={"cursor": expired})
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Cursor expired"
+
+    response = client.get(f"/clients/{client_id}/refresh", params={"cursor": ""})
+    assert response.status_code == 200
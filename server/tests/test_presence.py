@@ -0,0 +1,47 @@
+import asyncio
+import time
+
+import pytest
+
+import presence
+from fake_es import FakeElasticsearch
+from packetbeat_generator import format_timestamp
+from presence import PresenceEngine
+
+INDEX = "proxy-logs"
+CLIENTS = [f"client-{i}" for i in range(5)]
+
+
+def _doc(epoch_ms: int, client_id: str) -> dict:
+    return {"@timestamp": format_timestamp(epoch_ms), "client_id": client_id}
+
+
+def test_refresh_pages_through_every_client_and_keeps_its_latest_log(monkeypatch):
+    monkeypatch.setattr(presence, "PRESENCE_PAGE_SIZE", 2)
+    now_ms = int(time.time() * 1000)
+    es = FakeElasticsearch()
+    # client-0 also has an older log that must not win the max; client-4 went quiet an hour ago
+    es.add_documents(INDEX, [_doc(now_ms - 60_000, client_id) for client_id in CLIENTS[:4]]
+                     + [_doc(now_ms - 3_600_000, "client-0"), _doc(now_ms - 3_600_000, "client-4")])
+    engine = PresenceEngine(index=INDEX)
+
+    assert asyncio.run(engine.refresh(es)) == 5
+    # Five clients at two per page: three composite pages, chained by after_key
+    assert es.stats()["searches"] == 3
+    assert engine.last_seen["client-0"] == (now_ms - 60_000) / 1000
+    assert engine.statuses(CLIENTS + ["never-seen"]) == {
+        "client-0": "Online", "client-1": "Online", "client-2": "Online", "client-3": "Online",
+        "client-4": "Offline", "never-seen": "Offline",
+    }
+
+
+def test_clients_outside_the_lookback_keep_their_last_seen():
+    now_ms = int(time.time() * 1000)
+    engine = PresenceEngine(index=INDEX)
+    engine.last_seen["retired"] = now_ms / 1000 - 2 * 86400
+    es = FakeElasticsearch()
+    es.add_documents(INDEX, [_doc(now_ms - 2 * 86400 * 1000, "retired"), _doc(now_ms, "client-0")])
+
+    assert asyncio.run(engine.refresh(es)) == 1
+    assert engine.last_seen_at("retired").timestamp() == pytest.approx(now_ms / 1000 - 2 * 86400, abs=1e-3)
+    assert engine.status("client-0") == "Online"
@@ -0,0 +1,36 @@
+import asyncio
+import io
+import json
+import os
+
+from fake_es import FakeElasticsearch
+from packetbeat_generator import PacketbeatGenerator
+from replay import Replay, build_rules
+
+BLOCKLIST = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app", "restricted_domains.csv")
+END_MS = 1_760_000_000_000
+
+
+def test_es_replay_alerts_match_direct_replay():
+    documents = PacketbeatGenerator(clients=20, seed=5).documents(5000, END_MS - 3_600_000, END_MS)
+    hits = [{"_id": str(i), "_source": doc, "sort": [END_MS - 3_600_000 + i * 720]} for i, doc in enumerate(documents)]
+
+    async def run():
+        direct = Replay(build_rules(BLOCKLIST, None, {}), alerts_out=io.StringIO())
+        await direct.run_direct(hits)
+
+        es = FakeElasticsearch()
+        es.add_documents("replay", documents, ids=[hit["_id"] for hit in hits])
+        through_es = Replay(build_rules(BLOCKLIST, None, {}), alerts_out=io.StringIO())
+        await through_es.run_es(es)
+        return direct, through_es
+
+    direct, through_es = asyncio.run(run())
+    assert sum(direct.alerts_by_key.values()) > 0
+    assert through_es.alerts_by_key == direct.alerts_by_key
+    assert through_es.now_ms == direct.now_ms == hits[-1]["sort"][0]
+    # Every alert is dated by the batch it came from, the first batch included
+    times = [[json.loads(line)["event_time"] for line in replay.alerts_out.getvalue().splitlines()]
+             for replay in (direct, through_es)]
+    assert times[0] == times[1]
+    assert min(times[1]) > 0
@@ -0,0 +1,58 @@
+import os
+from collections import Counter
+
+from cooldown import COOLDOWN_SNAPSHOT_FILE, CooldownStore
+from data_dir import DATA_DIR
+from rollups import BUCKET_SECONDS, DAY_SECONDS, HALF_DAY_SECONDS, ROLLUP_DB_FILE, RollupStore
+
+# 2025-10-13 00:00 UTC
+DAY0 = 1760313600
+
+
+def _hit(epoch: int, nbytes: int) -> dict:
+    return {"sort": [epoch * 1000], "_source": {"client_id": "client-0001", "network": {"bytes": nbytes}}}
+
+
+def _store(tmp_path):
+    # Partial first and last days around two whole ones, one hit per 7 minutes
+    store = RollupStore(str(tmp_path / "rollups.sqlite3"))
+    epochs = range(DAY0 - 5 * 3600, DAY0 + 2 * DAY_SECONDS + 7 * 3600, 420)
+    store.fold([_hit(epoch, epoch % 1000) for epoch in epochs])
+    expected = Counter()
+    for epoch in epochs:
+        expected[epoch - epoch % DAY_SECONDS] += epoch % 1000
+    return store, expected
+
+
+def test_day_series_reads_whole_days_from_the_daily_tier(tmp_path):
+    store, expected = _store(tmp_path)
+    start, end = DAY0 - 5 * 3600, DAY0 + 2 * DAY_SECONDS + 7 * 3600
+    with store._conn:
+        # Without their 5-minute buckets, the two whole days can only come from the daily rows
+        store._conn.execute("DELETE FROM rollup WHERE resolution = ? AND bucket >= ? AND bucket < ?",
+                            (BUCKET_SECONDS, DAY0, DAY0 + 2 * DAY_SECONDS))
+
+    assert [(day, nbytes) for day, nbytes, _ in store.series(start, end, DAY_SECONDS)] == sorted(expected.items())
+
+
+def test_day_series_matches_the_five_minute_tier(tmp_path):
+    store, _ = _store(tmp_path)
+    start, end = DAY0 - 3 * 3600, DAY0 + DAY_SECONDS + 2 * 3600
+    by_day = Counter()
+    for bucket, nbytes, _ in store.series(start, end, BUCKET_SECONDS):
+        by_day[bucket - bucket % DAY_SECONDS] += nbytes
+
+    assert [(day, nbytes) for day, nbytes, _ in store.series(start, end, DAY_SECONDS)] == sorted(by_day.items())
+    assert sum(nbytes for _, nbytes, _ in store.series(start, end, HALF_DAY_SECONDS)) == sum(by_day.values())
+
+
+def test_state_files_default_into_the_data_dir(tmp_path):
+    assert os.path.dirname(ROLLUP_DB_FILE) == DATA_DIR
+    assert os.path.dirname(COOLDOWN_SNAPSHOT_FILE) == DATA_DIR
+
+    RollupStore(str(tmp_path / "missing" / "rollups.sqlite3"))
+    cooldowns = CooldownStore(ttl=60, path=str(tmp_path / "other" / "cooldowns.json"))
+    cooldowns.check_and_set(("rule", "client-0001"))
+    cooldowns.save()
+    assert (tmp_path / "missing" / "rollups.sqlite3").exists()
+    assert (tmp_path / "other" / "cooldowns.json").exists()
@@ -0,0 +1,83 @@
+import asyncio
+import os
+
+import numpy as np
+import pytest
+
+from beaconing import score_periodicity
+from scoring_pool import ScoringPool
+
+
+def _columns(pairs=50, history=16, seed=0):
+    rng = np.random.default_rng(seed)
+    times = np.cumsum(rng.uniform(1, 120, (pairs, history)), axis=1)
+    valid = np.arange(history)[None, :] >= rng.integers(0, history - 2, pairs)[:, None]
+    return {"times": times, "valid": valid}
+
+
+def _shm_blocks() -> set:
+    # SharedMemory names its blocks psm_*; the executor's semaphores live there too
+    if not os.path.isdir("/dev/shm"):
+        return set()
+    return {name for name in os.listdir("/dev/shm") if name.startswith("psm_")}
+
+
+@pytest.fixture(scope="module")
+def pool():
+    pool = ScoringPool(size=2, batch_rows=16)
+    yield pool
+    pool.shutdown()
+
+
+def _assert_same(got, expected):
+    assert len(got) == len(expected)
+    for got_column, expected_column in zip(got, expected):
+        np.testing.assert_array_equal(got_column, expected_column)
+
+
+def test_process_pool_matches_a_direct_call_in_row_order(pool):
+    columns = _columns()
+    before = _shm_blocks()
+    result = asyncio.run(pool.map_rows(score_periodicity, columns))
+
+    _assert_same(result, score_periodicity(**columns))
+    assert pool.stats()["chunks"] >= 4
+    # The block holding the copied columns is unlinked once the call returns
+    assert _shm_blocks() == before
+
+
+def test_columns_built_in_shared_memory_are_used_in_place(pool):
+    columns = _columns(seed=1)
+    shared = pool.allocate({name: (column.shape, column.dtype) for name, column in columns.items()})
+    assert shared.block is not None
+    for name, column in columns.items():
+        shared.arrays[name][...] = column
+    try:
+        result = asyncio.run(pool.map_rows(score_periodicity, shared))
+    finally:
+        shared.release()
+    _assert_same(result, score_periodicity(**columns))
+
+
+def test_worker_errors_propagate_and_are_counted(pool):
+    errors = pool.stats()["errors"]
+    before = _shm_blocks()
+    with pytest.raises(TypeError):
+        asyncio.run(pool.map_rows(score_periodicity, _columns(), unknown=1))
+    assert pool.stats()["errors"] == errors + 1
+    assert _shm_blocks() == before
+
+
+def test_size_zero_runs_in_a_thread():
+    pool = ScoringPool(size=0, batch_rows=16)
+    columns = _columns(seed=2)
+    assert pool.allocate({"times": ((4, 16), np.float64)}).block is None
+
+    _assert_same(asyncio.run(pool.map_rows(score_periodicity, columns)), score_periodicity(**columns))
+    assert pool.stats()["started"] is False
+
+
+def test_columns_must_have_matching_rows():
+    with pytest.raises(ValueError):
+        asyncio.run(ScoringPool(size=0).map_rows(score_periodicity, {"times": np.zeros((3, 4)),
+                                                                      "valid": np.ones((2, 4), dtype=bool)}))
@@ -0,0 +1,49 @@
+import asyncio
+import time
+
+from fake_es import FakeElasticsearch
+from packetbeat_generator import format_timestamp
+from tailer import LogTailer
+
+INDEX = "proxy-logs"
+
+
+def _doc(epoch_ms: int, client_id: str = "client-0001") -> dict:
+    return {"@timestamp": format_timestamp(epoch_ms), "client_id": client_id}
+
+
+def _ids(hits) -> list:
+    return [hit["_id"] for hit in hits]
+
+
+def test_late_document_below_newest_is_not_skipped():
+    async def run():
+        es = FakeElasticsearch()
+        now_ms = int(time.time() * 1000)
+        es.add_documents(INDEX, [_doc(now_ms - 10_000), _doc(now_ms - 1_000)], ids=["old", "new"])
+        tailer = LogTailer(index=INDEX, start_ms=0, settle_delay=3)
+
+        # "new" is still inside the settle window, so the cursor stops at "old"
+        assert _ids(await tailer.poll(es)) == ["old"]
+        assert tailer.newest_ms == now_ms - 1_000
+
+        # Indexed after "new" but timestamped before it: a cursor on "new" would never see it
+        es.add_documents(INDEX, [_doc(now_ms - 5_000)], ids=["late"])
+        assert _ids(await tailer.poll(es)) == ["late"]
+        assert tailer.cursor_ms == now_ms - 5_000
+
+    asyncio.run(run())
+
+
+def test_quiet_index_is_drained_once_settled():
+    async def run():
+        es = FakeElasticsearch()
+        now_ms = int(time.time() * 1000)
+        es.add_documents(INDEX, [_doc(now_ms - 9_000 + i * 1_000) for i in range(5)],
+                         ids=[f"doc-{i}" for i in range(5)])
+        tailer = LogTailer(index=INDEX, start_ms=0, settle_delay=3)
+
+        assert _ids(await tailer.poll(es)) == [f"doc-{i}" for i in range(5)]
+        assert await tailer.poll(es) == []
+
+    asyncio.run(run())
@@ -0,0 +1,78 @@
+import asyncio
+import json
+import time
+
+from fanout import CLOSE_TRY_AGAIN_LATER
+from visualizations import VisualizationBroadcaster
+
+
+class CountingBroadcaster(VisualizationBroadcaster):
+    def __init__(self, interval):
+        super().__init__(es=None, interval=interval)
+        self.fetches = []
+
+    async def fetch(self, initial=False):
+        self.fetches.append(initial)
+        return {"fetch": len(self.fetches)}
+
+
+class FakeSocket:
+    def __init__(self, broken=False):
+        self.broken = broken
+        self.received = []
+        self.close_code = None
+
+    async def send_text(self, message):
+        if self.broken and self.received:
+            raise RuntimeError("connection reset")
+        self.received.append(json.loads(message))
+
+    async def close(self, code=1000):
+        self.close_code = code
+
+
+def test_joiner_gets_a_fresh_live_snapshot_instead_of_a_stale_one():
+    async def run():
+        broadcaster = CountingBroadcaster(interval=60)
+        broadcaster._set_live({"fetch": "old"})
+        broadcaster.live_at = time.time() - 3600
+        socket = FakeSocket()
+        await broadcaster.subscribe(socket)
+        broadcaster.unsubscribe(socket)
+        return broadcaster, socket
+
+    broadcaster, socket = asyncio.run(run())
+    assert broadcaster.fetches == [True, False]
+    assert socket.received == [{"fetch": 1}, {"fetch": 2}]
+
+
+def test_fresh_live_snapshot_is_reused():
+    async def run():
+        broadcaster = CountingBroadcaster(interval=60)
+        broadcaster._set_live({"fetch": "recent"})
+        socket = FakeSocket()
+        await broadcaster.subscribe(socket)
+        broadcaster.unsubscribe(socket)
+        return broadcaster, socket
+
+    broadcaster, socket = asyncio.run(run())
+    assert broadcaster.fetches == [True]
+    assert socket.received == [{"fetch": 1}, {"fetch": "recent"}]
+
+
+def test_failed_subscriber_is_closed_and_dropped():
+    async def run():
+        broadcaster = CountingBroadcaster(interval=0.05)
+        healthy, broken = FakeSocket(), FakeSocket(broken=True)
+        await broadcaster.subscribe(healthy)
+        await broadcaster.subscribe(broken)
+        await asyncio.sleep(0.2)
+        subscribers = set(broadcaster.subscribers)
+        broadcaster.unsubscribe(healthy)
+        return healthy, broken, subscribers
+
+    healthy, broken, subscribers = asyncio.run(run())
+    assert subscribers == {healthy}
+    assert broken.close_code == CLOSE_TRY_AGAIN_LATER
+    assert healthy.close_code is None
+    assert len(healthy.received) > 2
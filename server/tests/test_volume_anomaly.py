@@ -0,0 +1,126 @@
+import asyncio
+import time
+
+import numpy as np
+
+from fake_es import FakeElasticsearch
+from packetbeat_generator import PacketbeatGenerator
+from rollups import RollupIngestor, RollupStore
+from volume_anomaly import (HOURS_PER_WEEK, VOLUME_BUCKET_SECONDS, VOLUME_Z_THRESHOLD, MatrixBuilder,
+                            VolumeAnomalyJob, fetch_bytes_matrix, fetch_bytes_pages, hour_of_week, score_matrix)
+
+INDEX = "proxy-logs"
+BUCKET_MS = VOLUME_BUCKET_SECONDS * 1000
+# A Wednesday noon, on a bucket boundary
+NOW_MS = 1760529600000
+
+
+def _es_with_spike(spike_ms, now_ms=NOW_MS):
+    es = FakeElasticsearch()
+    generator = PacketbeatGenerator(seed=7, clients=5)
+    es.add_documents(INDEX, generator.documents(5000, now_ms - 2 * 86400 * 1000, now_ms))
+    spike = generator.document(spike_ms)
+    spike["client_id"] = "client-0003"
+    spike["network"]["bytes"] = 900 * 2 ** 20
+    es.add_documents(INDEX, [spike])
+    return es
+
+
+def test_a_spike_is_reported_by_one_scan_only():
+    async def run():
+        es = _es_with_spike(NOW_MS - 2 * BUCKET_MS)
+        job = VolumeAnomalyJob(index=INDEX, lookback_days=2)
+        first = await job.run_once(es, now=NOW_MS / 1000)
+        assert job.last_run["recent_buckets"] == 12
+        # The next scan (one interval later) still has the spike in its last hour, but not among its new buckets
+        second = await job.run_once(es, now=NOW_MS / 1000 + 900)
+        assert job.last_run["recent_buckets"] == 3
+        # Nothing closed since the last scan
+        third = await job.run_once(es, now=NOW_MS / 1000 + 900 + 60)
+        return first, second, third
+
+    first, second, third = asyncio.run(run())
+    assert [(anomaly["client_id"], anomaly["bucket"]) for anomaly in first] == [("client-0003", "2025-10-15T11:50:00Z")]
+    assert second == third == []
+
+
+def _hourly_matrix():
+    """Three clients over two weeks plus a recent hour of 12 buckets, one bucket per hour of week."""
+    history, recent = 2 * HOURS_PER_WEEK, 12
+    hours = np.arange(history + recent)
+    rng = np.random.default_rng(11)
+    noise = rng.uniform(0.9, 1.1, size=(3, len(hours)))
+    flat = 1e6 * noise[0]
+    # Busy 09:00-17:00, near idle otherwise
+    daytime = np.where((hours % 24 >= 9) & (hours % 24 < 17), 5e8, 1e5) * noise[1]
+    quiet = 1e4 * noise[2]
+    return np.stack([flat, daytime, quiet]).astype(np.float32), history, recent
+
+
+def test_score_matrix_flags_the_spike_bucket_against_the_hour_of_week_profile():
+    matrix, history, recent = _hourly_matrix()
+    # Recent hours are 00:00-11:00 of a Monday; the flat client spikes at 03:00
+    matrix[0, history + 3] = 2e9
+    # The daytime client is busy at 10:00, as it always is
+    matrix[1, history + 10] = 5e8
+    # ... and the quiet client bursts at 05:00 to what would be normal for the daytime one
+    matrix[2, history + 5] = 5e8
+    how = (np.arange(history + recent) % HOURS_PER_WEEK).astype(np.intp)
+
+    z, peak = score_matrix(matrix, how, recent=recent, chunk=2)
+
+    assert z[0] >= VOLUME_Z_THRESHOLD and peak[0] == history + 3
+    assert z[1] < VOLUME_Z_THRESHOLD
+    assert z[2] >= VOLUME_Z_THRESHOLD and peak[2] == history + 5
+
+    job = VolumeAnomalyJob(min_bytes=0)
+    flagged = job.flag(["flat", "daytime", "quiet"], matrix, NOW_MS, z, peak)
+    # Highest z first
+    assert [anomaly["client_id"] for anomaly in flagged] == ["quiet", "flat"]
+
+
+def test_same_hour_last_week_is_not_a_spike():
+    matrix, history, recent = _hourly_matrix()
+    how = (np.arange(history + recent) % HOURS_PER_WEEK).astype(np.intp)
+    z, _ = score_matrix(matrix, how, recent=recent)
+    assert (z < VOLUME_Z_THRESHOLD).all()
+
+
+def test_hour_of_week_is_local_time():
+    # 2025-10-13 is a Monday; 00:00 UTC is 05:30 in Kolkata
+    start_ms = 1760313600000
+    assert hour_of_week(start_ms, 2, 3600_000, "UTC").tolist() == [0, 1]
+    assert hour_of_week(start_ms, 1, 3600_000, "Asia/Kolkata").tolist() == [5]
+
+
+def test_history_from_rollups_plus_es_increment_matches_es_alone(tmp_path):
+    async def run():
+        now_ms = int(time.time() * 1000)
+        es = _es_with_spike(now_ms - 2 * BUCKET_MS, now_ms=now_ms)
+        rollups = RollupIngestor(RollupStore(str(tmp_path / "rollups.sqlite3")), index=INDEX)
+        rollups.tailer.cursor_ms = now_ms - 3 * 86400 * 1000
+        rollups.tailer.batch_size = 20000
+        for _ in range(3):
+            await rollups.step(es)
+        # Leave the last stretch to ES
+        rollups.tailer.cursor_ms = now_ms - 30 * 60 * 1000
+
+        with_rollups = VolumeAnomalyJob(index=INDEX, lookback_days=2, rollups=rollups)
+        start_ms, end_ms = with_rollups.window(now_ms / 1000)
+        split_ms = with_rollups.rollups_until(start_ms, end_ms)
+        assert split_ms == (now_ms - 30 * 60 * 1000) // BUCKET_MS * BUCKET_MS
+
+        builder = MatrixBuilder(start_ms, (end_ms - start_ms) // BUCKET_MS)
+        with_rollups._read_rollups(builder, start_ms, split_ms)
+        await fetch_bytes_pages(es, builder, split_ms, end_ms, INDEX)
+        combined = builder.build()
+        es_only = await fetch_bytes_matrix(es, start_ms, end_ms, INDEX)
+
+        anomalies = await with_rollups.run_once(es, now=now_ms / 1000)
+        return combined, es_only, anomalies, with_rollups.last_run
+
+    (clients, matrix), (es_clients, es_matrix), anomalies, last_run = asyncio.run(run())
+    order = [clients.index(client) for client in es_clients]
+    assert np.array_equal(matrix[order], es_matrix)
+    assert last_run["rollup_buckets"] == last_run["buckets"] - 6
+    assert [anomaly["client_id"] for anomaly in anomalies] == ["client-0003"]
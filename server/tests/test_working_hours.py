@@ -0,0 +1,85 @@
+import asyncio
+from datetime import datetime, timezone
+
+import numpy as np
+import pytz
+
+from fake_es import FakeElasticsearch
+from packetbeat_generator import format_timestamp
+from working_hours import WorkingHoursPolicies, WorkingHoursPolicy, local_hours
+
+INDEX = "proxy-logs"
+HOUR_MS = 3_600_000
+# 2025-03-08 00:00 UTC: New York springs forward the next morning
+START_MS = 1741392000000
+ROLES = {"client-default": None, "client-night": "night-ops", "client-us": "us-desk"}
+
+
+def _policies():
+    return WorkingHoursPolicies(WorkingHoursPolicy(9, 17, "Asia/Kolkata"), {
+        "night-ops": WorkingHoursPolicy(8, 20, "Asia/Kolkata"),
+        "us-desk": WorkingHoursPolicy(22, 6, "America/New_York"),
+    })
+
+
+def _pushed_down_ids(policies, docs) -> set:
+    async def run():
+        es = FakeElasticsearch()
+        es.add_documents(INDEX, docs, ids=[str(i) for i in range(len(docs))])
+        response = await es.search(index=INDEX, body={
+            "size": len(docs), "query": policies.pushdown_query(), "runtime_mappings": policies.runtime_mappings(),
+        })
+        return {hit["_id"] for hit in response["hits"]["hits"]}
+
+    return asyncio.run(run())
+
+
+def test_pushdown_candidates_are_hours_outside_every_policy_of_a_timezone():
+    policies = _policies()
+    assert policies.timezones == ["America/New_York", "Asia/Kolkata"]
+    # 9-17 is working time for both Kolkata policies; 22-6 for the only New York one
+    assert policies.pushdown_query() == {"bool": {"should": [
+        {"terms": {"local_hour_0": list(range(6, 22))}},
+        {"terms": {"local_hour_1": list(range(0, 9)) + list(range(17, 24))}},
+    ], "minimum_should_match": 1}}
+    assert {spec["script"]["params"]["tz"] for spec in policies.runtime_mappings().values()} == set(policies.timezones)
+
+
+def test_local_hours_follow_dst_per_event():
+    epoch_ms = START_MS + np.arange(0, 48 * HOUR_MS, 20 * 60 * 1000)
+    new_york = pytz.timezone("America/New_York")
+    expected = [datetime.fromtimestamp(ms / 1000, new_york).hour for ms in epoch_ms.tolist()]
+    assert local_hours(epoch_ms, "America/New_York").tolist() == expected
+
+
+def test_evaluate_matches_the_scalar_check_per_role():
+    policies = _policies()
+    epoch_ms = START_MS + np.arange(0, 48 * HOUR_MS, 20 * 60 * 1000)
+    for client_id, role in ROLES.items():
+        policy = policies.policy_for(role)
+        expected = [policy.is_outside(datetime.fromtimestamp(ms / 1000, timezone.utc)) for ms in epoch_ms.tolist()]
+        assert policies.evaluate(epoch_ms, [client_id] * len(epoch_ms), ROLES).tolist() == expected
+
+
+def test_pushdown_returns_every_event_evaluate_would_flag():
+    policies = _policies()
+    epoch_ms = (START_MS + np.arange(0, 48 * HOUR_MS, 20 * 60 * 1000)).tolist()
+    events = [(ms, client_id) for ms in epoch_ms for client_id in ROLES]
+    docs = [{"@timestamp": format_timestamp(ms), "client_id": client_id} for ms, client_id in events]
+    outside = policies.evaluate([ms for ms, _ in events], [client_id for _, client_id in events], ROLES)
+
+    flagged = {str(i) for i in np.flatnonzero(outside)}
+    pushed_down = _pushed_down_ids(policies, docs)
+    assert flagged <= pushed_down
+    # ...while still leaving out the hours that are working time under every policy
+    assert len(pushed_down) < len(docs)
+
+
+def test_single_policy_pushdown_is_exact():
+    policies = WorkingHoursPolicies(WorkingHoursPolicy(17, 19, "Asia/Kolkata"))
+    epoch_ms = (START_MS + np.arange(0, 24 * HOUR_MS, 15 * 60 * 1000)).tolist()
+    docs = [{"@timestamp": format_timestamp(ms), "client_id": "client-0001"} for ms in epoch_ms]
+    outside = policies.evaluate(epoch_ms, ["client-0001"] * len(epoch_ms), {})
+
+    assert _pushed_down_ids(policies, docs) == {str(i) for i in np.flatnonzero(outside)}
+    assert len(docs) - outside.sum() == 8